@@ -48,6 +48,22 @@ class MutantHelper(object):
             }
             当type为json时, name为数组形式, value为对应的类型(只取int/str类型)
             当type为files时, name为数组形式, value为包含"filename" "content" "content_type"三个key的dict
+            request_data_ins未被修改时结果由同一扫描任务的所有插件共用, item不应修改
+        """
+        if not request_data_ins.is_template():
+            return self._get_params_list(request_data_ins, param_type_list)
+
+        if param_type_list is not None:
+            param_type_list = tuple(param_type_list)
+        cache_key = ("params_list", param_type_list)
+        cache = request_data_ins.get_template_cache()
+        if cache_key not in cache:
+            cache[cache_key] = self._get_params_list(request_data_ins, param_type_list)
+        return list(cache[cache_key])
+
+    def _get_params_list(self, request_data_ins, param_type_list):
+        """
+        get_params_list的实现, 不使用缓存
         """
         test_params = []
         all_param = request_data_ins.get_all_param(param_type_list)
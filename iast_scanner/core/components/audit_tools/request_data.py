@@ -22,6 +22,7 @@ import copy
 import json
 import base64
 import aiohttp
+import weakref
 import binascii
 import urllib.parse
 import http.cookies
@@ -40,6 +41,9 @@ class RequestData(object):
     http_methods = ["get", "post", "head", "put",
                     "push", "delete", "options", "patch"]
 
+    # 以RaspResult实例为key的请求模板缓存, 扫描任务结束RaspResult被释放后自动清除
+    _templates = weakref.WeakKeyDictionary()
+
     def __init__(self, rasp_result_ins, payload_seq=None, payload_feature=None):
         """
         初始化
@@ -50,10 +54,56 @@ class RequestData(object):
             payload_feature - 用于检测payload是否成功投放的特征
         """
         self.rasp_result_ins = rasp_result_ins
-        self.method = rasp_result_ins.get_method().lower()
-        if not self._is_valid_method(self.method):
-            Logger().error("Found invalid http method {}".format(self.method))
-            self.method = "post"
+        self._template = self._get_template(rasp_result_ins)
+        self.method = self._template["method"]
+        self.content_type = self._template["content_type"]
+        # http_data的各项与模板共用, 首次修改时由_get_section复制
+        self.http_data = dict(self._template["http_data"])
+        self._copied_sections = set()
+
+        try:
+            self.queue_id = Communicator().get_module_id()
+        except TypeError:
+            self.queue_id = "1"
+
+        self.payload_info = {
+            # payload序列号, 同一测试点相同类型payload序列号应相同，保证报警不重复
+            "seq": payload_seq,
+            # 用于检测payload是否生效的特征
+            "feature": payload_feature
+        }
+
+        # 请求返回的HTTP结果
+        self.response = {}
+        # 请求对应的rasp_result
+        self.rasp_result = None
+
+    @classmethod
+    def _get_template(cls, rasp_result_ins):
+        """
+        获取由RaspResult实例构造的请求模板, 同一RaspResult的所有RequestData共用一个模板, 模板不应被修改
+
+        Parameters:
+            rasp_result_ins - RaspResult实例
+
+        Returns:
+            dict, 结构:
+            {
+                "method": 小写的http方法,
+                "content_type": 请求的content-type,
+                "http_data": 请求各项参数的dict,
+                "cache": 由模板计算的结果的缓存dict, 所有扫描插件共用
+            }
+        """
+        try:
+            return cls._templates[rasp_result_ins]
+        except KeyError:
+            pass
+
+        method = rasp_result_ins.get_method().lower()
+        if method not in cls.http_methods:
+            Logger().error("Found invalid http method {}".format(method))
+            method = "post"
             # raise exceptions.UnsupportedHttpData
 
         data = {}
@@ -61,12 +111,12 @@ class RequestData(object):
         cookies = None
         body = None
         files = []
-        self.content_type = rasp_result_ins.get_content_type()
-        if self.content_type.startswith("application/x-www-form-urlencoded"):
+        content_type = rasp_result_ins.get_content_type()
+        if content_type.startswith("application/x-www-form-urlencoded"):
             data = rasp_result_ins.get_post_data_dict()
-        elif self.content_type.startswith("application/json"):
+        elif content_type.startswith("application/json"):
             json = copy.deepcopy(rasp_result_ins.get_json())
-        elif self.content_type.startswith("multipart/form-data"):
+        elif content_type.startswith("multipart/form-data"):
             data = rasp_result_ins.get_post_data_dict()
             files = rasp_result_ins.get_upload_files()
         else:
@@ -93,7 +143,7 @@ class RequestData(object):
         for key in del_keys:
             del headers[key]
 
-        self.http_data = {
+        http_data = {
             "url": rasp_result_ins.get_scan_url(),
             "headers": headers,
             "params": rasp_result_ins.get_query_param_dict(),
@@ -104,22 +154,55 @@ class RequestData(object):
             "files": files
         }
 
-        try:
-            self.queue_id = Communicator().get_module_id()
-        except TypeError:
-            self.queue_id = "1"
-
-        self.payload_info = {
-            # payload序列号, 同一测试点相同类型payload序列号应相同，保证报警不重复
-            "seq": payload_seq,
-            # 用于检测payload是否生效的特征
-            "feature": payload_feature
+        template = {
+            "method": method,
+            "content_type": content_type,
+            "http_data": http_data,
+            "cache": {}
         }
+        cls._templates[rasp_result_ins] = template
+        return template
 
-        # 请求返回的HTTP结果
-        self.response = {}
-        # 请求对应的rasp_result
-        self.rasp_result = None
+    def _get_section(self, section):
+        """
+        获取可修改的http_data项, 首次获取时复制模板中的对应项
+
+        Parameters:
+            section - str, http_data的key
+
+        Returns:
+            http_data中对应的项
+        """
+        if section not in self._copied_sections:
+            value = self.http_data[section]
+            if section == "json":
+                value = copy.deepcopy(value)
+            elif section == "files":
+                value = [dict(item) for item in value]
+            elif value is not None:
+                value = dict(value)
+            self.http_data[section] = value
+            self._copied_sections.add(section)
+        return self.http_data[section]
+
+    def is_template(self):
+        """
+        判断请求参数是否未被修改, 与模板相同
+
+        Returns:
+            Boolean
+        """
+        return len(self._copied_sections) == 0
+
+    def get_template_cache(self):
+        """
+        获取同一RaspResult的所有RequestData共用的缓存dict, 用于缓存只与模板相关的计算结果,
+        扫描任务结束RaspResult被释放后随模板清除
+
+        Returns:
+            dict
+        """
+        return self._template["cache"]
 
     def _is_valid_method(self, method):
         """
@@ -181,19 +264,20 @@ class RequestData(object):
             exceptions.DataParamError - 参数错误引发此异常
         """
         if para_type == "cookies":
-            self.http_data["cookies"][para_name] = urllib.parse.quote(value)
+            self._get_section("cookies")[para_name] = urllib.parse.quote(value)
         elif para_type == "get":
-            self.http_data["params"][para_name] = value
+            self._get_section("params")[para_name] = value
         elif para_type == "post":
-            self.http_data["data"][para_name] = value
+            self._get_section("data")[para_name] = value
         elif para_type == "headers":
-            self.http_data["headers"][para_name] = value
+            self._get_section("headers")[para_name] = value
         elif para_type == "json":
             # 如果para_name为空，将root节点为设为value
             if len(para_name) == 0:
                 self.http_data["json"] = value
+                self._copied_sections.add("json")
                 return
-            json_target = self.http_data["json"]
+            json_target = self._get_section("json")
             for i in range(len(para_name)):
                 name = para_name[i]
                 obj = json_target.get(name, None)
@@ -209,9 +293,10 @@ class RequestData(object):
                 Logger().error("RequestData files content must set with bytes type!")
                 raise exceptions.DataParamError
             else:
-                self.http_data["files"][para_name[0]][para_name[1]] = value
+                self._get_section("files")[para_name[0]][para_name[1]] = value
         elif para_type == "body":
             self.http_data["body"] = value
+            self._copied_sections.add("body")
         else:
             Logger().error("Use an invalid para_type in set_param method!")
             raise exceptions.DataParamError
@@ -227,13 +312,13 @@ class RequestData(object):
             exceptions.DataParamError - 参数错误引发此异常
         """
         if para_type == "cookies" and para_name in self.http_data["cookies"]:
-            del self.http_data["cookies"][para_name]
+            del self._get_section("cookies")[para_name]
         elif para_type == "get" and para_name in self.http_data["params"]:
-            del self.http_data["params"][para_name]
+            del self._get_section("params")[para_name]
         elif para_type == "post" and para_name in self.http_data["data"]:
-            del self.http_data["data"][para_name]
+            del self._get_section("data")[para_name]
         elif para_type == "headers" and para_name in self.http_data["headers"]:
-            del self.http_data["headers"][para_name]
+            del self._get_section("headers")[para_name]
         else:
             Logger().error("Use an invalid para_type in set_param method!")
             raise exceptions.DataParamError
@@ -259,7 +344,7 @@ class RequestData(object):
             ]
         """
         value = base64.b64encode(json.dumps(hook_filter).encode("utf-8"))
-        self.http_data["headers"]["x-iast-filter"] = value.decode("utf-8")
+        self._get_section("headers")["x-iast-filter"] = value.decode("utf-8")
 
     def get_content_type(self):
         """
@@ -315,7 +400,7 @@ class RequestData(object):
                 默认为None时获取 "get" "post" "json" "headers" "cookie" 五类参数
 
         Returns:
-            dict，变量类型para_type为key, 类型对应的变量集合为value，
+            dict，变量类型para_type为key, 类型对应的变量集合为value, 与请求模板共用, 不应修改，
             json类型value与json相同, 
             files类型value为包含name、filename、content三个key的dict
             其余value为dict类型
@@ -398,6 +483,7 @@ class RequestData(object):
         elif self.content_type.startswith("multipart/form-data"):
             result["data"] = self._make_multipart()
             if self.http_data["headers"].get("content-type", None) is not None:
+                result["headers"] = self._get_section("headers")
                 del result["headers"]["content-type"]
         elif self.http_data["body"] is not None:
             result["data"] = self.http_data["body"]
@@ -502,7 +588,7 @@ class RequestData(object):
         """
         uuid = common.generate_uuid()
         scan_id = self.queue_id + "-" + uuid
-        self.http_data["headers"]["scan-request-id"] = scan_id
+        self._get_section("headers")["scan-request-id"] = scan_id
         return scan_id
 
     def is_param_concat_in_hook(self, hook_type, param_value):
@@ -519,6 +605,19 @@ class RequestData(object):
         if len(param_value) == 0:
             return False
 
+        # 结果只与RaspResult中的hook信息有关, 同一扫描任务的所有插件共用
+        if not isinstance(param_value, str):
+            return self._is_param_concat_in_hook(hook_type, param_value)
+        cache_key = ("param_concat", hook_type, param_value)
+        cache = self.get_template_cache()
+        if cache_key not in cache:
+            cache[cache_key] = self._is_param_concat_in_hook(hook_type, param_value)
+        return cache[cache_key]
+
+    def _is_param_concat_in_hook(self, hook_type, param_value):
+        """
+        is_param_concat_in_hook的实现, 不使用缓存
+        """
         hook_info = self.rasp_result_ins.get_hook_info()
 
         for hook_item in hook_info:
@@ -678,13 +777,18 @@ class RequestData(object):
         设置请求的response
 
         Parameters:
-            status_code - int, http状态码
-            headers - dict, http头信息
-            body - bytes, http body
+            response - dict, Session.send_request返回的response, 包含以下key
+                status - int, http状态码
+                headers - dict, http头信息
+                body - bytes, http body
+                body_read - bool, 是否读取了body, 可选, 默认为True
+                body_truncated - bool, body是否被截断, 可选, 默认为False
         """
         self.response["status"] = response["status"]
         self.response["headers"] = response["headers"]
         self.response["body"] = response["body"]
+        self.response["body_read"] = response.get("body_read", True)
+        self.response["body_truncated"] = response.get("body_truncated", False)
 
     def get_response(self):
         """
@@ -700,6 +804,33 @@ class RequestData(object):
         """
         return self.response
 
+    def get_raw_response(self):
+        """
+        获取请求response的文本形式, 用于日志和漏洞报告, 未读取或被截断的body在末尾注明
+
+        Returns:
+            str
+        """
+        raw_response = []
+        raw_response.append("HTTP Code:" + str(self.response["status"]))
+        for key, value in self.response["headers"].items():
+            raw_response.append(key + ": " + value)
+
+        raw_response.append("")
+        if not self.response.get("body_read", True):
+            raw_response.append("[body not read]")
+            return "\r\n".join(raw_response)
+
+        try:
+            body = self.response["body"].decode("utf-8")
+        except UnicodeDecodeError:
+            body = self.response["body"].decode("latin-1")
+
+        raw_response.append(body)
+        if self.response.get("body_truncated", False):
+            raw_response.append("[truncated at {} bytes]".format(len(self.response["body"])))
+        return "\r\n".join(raw_response)
+
     def set_rasp_result(self, rasp_result):
         """
         添加请求对应的rasp_result
@@ -23,49 +23,132 @@ import asyncio
 from core.components import exceptions
 from core.components.logger import Logger
 from core.components.config import Config
+from core.components.communicator import Communicator
 from core.components.audit_tools import context
 
 
 class Session(object):
     """
-    用于发送http请求的session，一个扫描模块所有协程共用一个session
+    用于发送http请求的session，一个扫描模块所有插件和协程共用一个session及其keep-alive连接池
+
+    https连接只通过keep-alive复用, 未实现连接间的TLS会话恢复, 每个新建的https连接都进行一次完整的TLS握手
     """
 
+    def __new__(cls):
+        """
+        单例模式
+        """
+        if not hasattr(cls, "instance"):
+            cls.instance = super(Session, cls).__new__(cls)
+            cls.instance.session = None
+            cls.instance.user_num = 0
+        return cls.instance
+
     async def async_init(self):
         """
-        初始化
+        初始化, 每个使用者调用一次, 仅首次调用时创建session
         """
+        self.user_num += 1
+        if self.session is not None:
+            return
         cookie_jar = aiohttp.DummyCookieJar()
-        conn = aiohttp.TCPConnector(limit=0)
+        conn = aiohttp.TCPConnector(
+            limit=Config().get_config("scanner.conn_limit"),
+            limit_per_host=Config().get_config("scanner.conn_limit_per_host"),
+            keepalive_timeout=Config().get_config("scanner.conn_keepalive_timeout"),
+            use_dns_cache=True,
+            ttl_dns_cache=Config().get_config("scanner.dns_cache_ttl"),
+            # ssl为None时使用默认的证书校验
+            ssl=None if Config().get_config("scanner.ssl_verify") else False
+        )
         timeout = aiohttp.ClientTimeout(
             total=Config().get_config("scanner.request_timeout"))
         self.session = aiohttp.ClientSession(
             cookie_jar=cookie_jar,
             connector=conn,
-            timeout=timeout
+            timeout=timeout,
+            trace_configs=[self._create_trace_config()]
         )
 
     async def close(self):
         """
-        关闭session
+        关闭session, 所有使用者均调用后关闭
         """
-        await self.session.close()
+        self.user_num -= 1
+        if self.user_num <= 0 and self.session is not None:
+            session = self.session
+            self.session = None
+            await session.close()
+
+    def _create_trace_config(self):
+        """
+        创建统计连接复用情况的aiohttp.TraceConfig
+        """
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+
+    async def _on_request_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.is_https = params.url.scheme == "https"
+
+    async def _on_connection_create_end(self, session, trace_config_ctx, params):
+        # 未实现TLS会话恢复, 新建的https连接均计为一次完整握手
+        Communicator().increase_value("http_conn_create")
+        if getattr(trace_config_ctx, "is_https", False):
+            Communicator().increase_value("tls_handshake")
+
+    async def _on_connection_reuseconn(self, session, trace_config_ctx, params):
+        Communicator().increase_value("http_conn_reuse")
+
+    async def _read_body(self, response, read_body):
+        """
+        流式读取响应body, 读取量超过scanner.response_body_limit时丢弃剩余部分并断开连接,
+        不需要body时仅读完(未超出上限的)body以复用连接
+
+        Parameters:
+            response - aiohttp.ClientResponse
+            read_body - bool, 是否保存body
+
+        Returns:
+            tuple, (body, bytes; 是否被截断, bool)
+        """
+        body_limit = Config().get_config("scanner.response_body_limit")
+        if not read_body and response.content_length is not None and response.content_length > body_limit:
+            response.close()
+            return b"", True
+
+        body = bytearray()
+        read_size = 0
+        while True:
+            chunk = await response.content.read(65536)
+            if not chunk:
+                return bytes(body), False
+            if read_body:
+                body.extend(chunk[:body_limit - read_size])
+            read_size += len(chunk)
+            if read_size >= body_limit and not response.content.at_eof():
+                response.close()
+                return bytes(body), True
 
-    async def send_request(self, request_data_ins, proxy_url=None):
+    async def send_request(self, request_data_ins, proxy_url=None, read_body=True):
         """
         异步发送一个http请求, 返回结果
 
         Parameters:
             request_data_ins - request_data.RequestData类的实例，包含请求的全部信息
             proxy_url - 发送请求使用的代理url, 为None时不使用代理
+            read_body - bool, 是否读取响应body, 为False时返回的body为b""
 
         Returns:
             dict, 结构:
             {
-                "raw_request": 完整的raw http请求包
                 "status": http响应码,
                 "headers": http响应头的dict,
-                "body": http响应body, bytes
+                "body": http响应body, bytes, 最多scanner.response_body_limit字节,
+                "body_read": bool, 是否读取了body, 与参数read_body相同,
+                "body_truncated": bool, body是否因超出大小上限被截断
             }
 
         Raises:
@@ -77,11 +160,14 @@ class Session(object):
         while retry_times >= 0:
             try:
                 async with context.Context():
-                    async with http_func(**request_params_dict, proxy=proxy_url, allow_redirects=False, ssl=False) as response:
+                    async with http_func(**request_params_dict, proxy=proxy_url, allow_redirects=False) as response:
+                        body, body_truncated = await self._read_body(response, read_body)
                         response = {
                             "status": response.status,
                             "headers": response.headers,
-                            "body": await response.read()
+                            "body": body,
+                            "body_read": read_body,
+                            "body_truncated": body_truncated
                         }
                         break
             except (asyncio.TimeoutError, aiohttp.client_exceptions.ClientError) as e:
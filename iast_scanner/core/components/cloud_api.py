@@ -56,13 +56,15 @@ class CloudApi(object):
         all_report_model = []
         base_report_model = report_model.ReportModel(
             table_prefix=None, create_table=False, multiplexing_conn=True)
-        tables = base_report_model.get_tables()
-        for table_name in tables:
-            if table_name.lower().endswith("_report"):
-                all_report_model.append(table_name)
+        if base_report_model.is_single_table():
+            all_report_model = base_report_model.get_upload_targets()
+        else:
+            tables = base_report_model.get_tables()
+            for table_name in tables:
+                if table_name.lower().endswith("_report"):
+                    all_report_model.append(table_name[:-7])
 
-        for table_name in all_report_model:
-            table_prefix = table_name[:-7]
+        for table_prefix in all_report_model:
             try:
                 model_ins = report_model.ReportModel(
                     table_prefix=table_prefix, create_table=False, multiplexing_conn=True)
@@ -19,6 +19,9 @@ limitations under the License.
 
 import os
 import time
+import ctypes
+import select
+import struct
 import multiprocessing
 
 from core.components import common
@@ -56,7 +59,10 @@ class Communicator(object):
             "invalid_data",  # non-json or json format err data
             "duplicate_request",
             "new_request",
-            "rasp_result_request"
+            "rasp_result_request",
+            "dropped_scan_result",  # rasp_result_queue full or result larger than queue
+            "db_pool_wait",
+            "db_pool_wait_time"
         ]
 
         for i in range(self.pre_http_num):
@@ -78,7 +84,12 @@ class Communicator(object):
             "dropped_rasp_result",
             "send_request",
             "failed_request",
-            "config_version"
+            "http_conn_create",
+            "http_conn_reuse",
+            "tls_handshake",
+            "config_version",
+            "db_pool_wait",
+            "db_pool_wait_time"
         ]
 
         data_struct = {
@@ -121,8 +132,9 @@ class Communicator(object):
 
     def _init_queues(self):
         self.queues = {}
+        queue_size = Config().get_config("scanner.result_queue_size")
         for i in range(self.scanner_num):
-            self.queues["rasp_result_queue_" + str(i)] = OriQueue()
+            self.queues["rasp_result_queue_" + str(i)] = OriQueue(queue_size)
 
     def _init_shared_setting(self):
         self.shared_setting_obj = OriSharedObj()
@@ -364,7 +376,12 @@ class Communicator(object):
 
         Parameters:
             queue_name - 目标队列名
-            data - 发送的数据
+            data - 发送的数据, bytes类型
+
+        Raises:
+            exceptions.QueueFull - 目标队列已满, 数据未发送
+            exceptions.QueueValueError - 数据不是bytes类型或超过队列大小
+            exceptions.QueueNotExist - 目标队列不存在
         """
         if queue_name in self.queues:
             self.queues[queue_name].put(data)
@@ -398,34 +415,124 @@ class Communicator(object):
         """
         return self.queues[queue_name].get_nowait()
 
+    def get_queue_fd(self, queue_name):
+        """
+        获取指定队列的通知fd, 队列写入数据后该fd变为可读, 可用于select或事件循环的add_reader
+
+        Parameters:
+            queue_name - 目标队列名
+
+        Returns:
+            int, 可读的文件描述符
+        """
+        return self.queues[queue_name].get_fd()
+
+    def clear_queue_notify(self, queue_name):
+        """
+        清空指定队列的通知fd中的数据, 应在读取队列前调用, 避免漏掉读取过程中写入的数据
+
+        Parameters:
+            queue_name - 目标队列名
+        """
+        self.queues[queue_name].clear_notify()
+
 
 class OriQueue(object):
+    """
+    基于共享内存环形缓冲区的有界多生产者单消费者队列, 用于在进程间传递bytes数据
 
-    def __init__(self):
+    每条数据以4字节长度 + 数据内容的形式写入缓冲区, 写入不会阻塞, 缓冲区空间不足时抛出QueueFull,
+    由调用者丢弃并计数。每次写入后向通知管道写入1字节, 消费者可以等待get_fd()返回的fd可读
+    """
+
+    def __init__(self, size):
+        """
+        初始化, 需要在fork子进程前调用
+
+        Parameters:
+            size - int, 缓冲区大小, 单位Bytes
+        """
         self.uuid = common.generate_uuid()
-        self.read_lock = multiprocessing.Lock()
-        self.write_lock = multiprocessing.Lock()
-        self.pipe_receiver, self.pip_sender = multiprocessing.Pipe(False)
+        self.size = size
+        self.buffer = multiprocessing.RawArray(ctypes.c_char, size)
+        self.buffer_addr = ctypes.addressof(self.buffer)
+        # offset[0] 为读取位置, offset[1] 为写入位置, 均为单调递增的字节数
+        self.offset = multiprocessing.RawArray(ctypes.c_uint64, 2)
+        self.lock = multiprocessing.Lock()
+        self.notify_reader, self.notify_writer = os.pipe()
+        os.set_blocking(self.notify_reader, False)
+        os.set_blocking(self.notify_writer, False)
+
+    def _write(self, offset, data):
+        """
+        从offset处向环形缓冲区写入数据
+        """
+        pos = offset % self.size
+        first_len = min(len(data), self.size - pos)
+        ctypes.memmove(self.buffer_addr + pos, data, first_len)
+        if first_len < len(data):
+            ctypes.memmove(self.buffer_addr, data[first_len:], len(data) - first_len)
+
+    def _read(self, offset, length):
+        """
+        从offset处读取环形缓冲区中length长度的数据
+        """
+        pos = offset % self.size
+        first_len = min(length, self.size - pos)
+        data = ctypes.string_at(self.buffer_addr + pos, first_len)
+        if first_len < length:
+            data += ctypes.string_at(self.buffer_addr, length - first_len)
+        return data
+
+    def get_fd(self):
+        """
+        获取通知管道的读端fd
+        """
+        return self.notify_reader
+
+    def clear_notify(self):
+        """
+        清空通知管道中的数据
+        """
+        try:
+            while os.read(self.notify_reader, 4096):
+                pass
+        except BlockingIOError:
+            pass
 
     def get(self):
-        with self.read_lock:
-            data = self.pipe_receiver.recv()
-            return data
+        while True:
+            try:
+                return self.get_nowait()
+            except exceptions.QueueEmpty:
+                select.select([self.notify_reader], [], [])
+                self.clear_notify()
 
     def get_nowait(self):
-        with self.read_lock:
-            if self.pipe_receiver.poll():
-                data = self.pipe_receiver.recv()
-                return data
-            else:
+        with self.lock:
+            read_offset, write_offset = self.offset[0], self.offset[1]
+            if read_offset == write_offset:
                 raise exceptions.QueueEmpty
+            length = struct.unpack("<I", self._read(read_offset, 4))[0]
+            data = self._read(read_offset + 4, length)
+            self.offset[0] = read_offset + 4 + length
+        return data
 
     def put(self, data):
-        with self.write_lock:
-            try:
-                self.pip_sender.send(data)
-            except ValueError as e:
-                raise exceptions.QueueValueError
+        if not isinstance(data, bytes) or len(data) + 4 > self.size:
+            raise exceptions.QueueValueError
+        with self.lock:
+            read_offset, write_offset = self.offset[0], self.offset[1]
+            if self.size - (write_offset - read_offset) < len(data) + 4:
+                raise exceptions.QueueFull
+            self._write(write_offset, struct.pack("<I", len(data)))
+            self._write(write_offset + 4, data)
+            self.offset[1] = write_offset + 4 + len(data)
+        try:
+            os.write(self.notify_writer, b"\x00")
+        except BlockingIOError:
+            # 通知管道已满说明消费者尚未处理之前的通知, 无需再次通知
+            pass
 
 
 class OriSharedObj(object):
@@ -47,6 +47,7 @@ class Config(object):
             "./config.yaml"
         ]
         self._default_log_path = os.path.expanduser("~") + "/openrasp-iast/log"
+        self._default_data_path = os.path.expanduser("~") + "/openrasp-iast"
 
         self._config_path = None
         self.config_dict = None
@@ -294,6 +295,19 @@ class Config(object):
                     os.path.abspath(self.config_dict["log.path"])))
                 sys.exit(1)
 
+            if self.config_dict["database.engine"] == "sqlite":
+                try:
+                    if self.config_dict["database.sqlite_path"] == "":
+                        self.config_dict["database.sqlite_path"] = "{}/{}.db".format(
+                            self._default_data_path, self.config_dict["database.db_name"])
+                    sqlite_dir = os.path.dirname(os.path.abspath(self.config_dict["database.sqlite_path"]))
+                    if not os.path.exists(sqlite_dir):
+                        os.makedirs(sqlite_dir)
+                except Exception as e:
+                    print("[!] OpenRASP-IAST init error, sqlite path: {} is not writable!".format(
+                        os.path.abspath(self.config_dict["database.sqlite_path"])))
+                    sys.exit(1)
+
         except Exception as e:
             print(
                 "[!] OpenRASP-IAST load config error! Please check config file: {}! \n".format(self._config_path))
@@ -100,6 +100,12 @@ class QueueEmpty(CommunicatorException, OriExpectedException):
         super().__init__(message)
 
 
+class QueueFull(CommunicatorException, OriExpectedException):
+    def __init__(self):
+        message = "OriQueue which put in communicator is full"
+        super().__init__(message)
+
+
 class QueueValueError(CommunicatorException, OriExpectedException):
     def __init__(self):
         message = "OriQueue send data too large"
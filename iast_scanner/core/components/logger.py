@@ -141,6 +141,7 @@ class Logger(object):
         self.warning = iast_logger.warning
         self.info = iast_logger.info
         self.debug = iast_logger.debug
+        self.isEnabledFor = iast_logger.isEnabledFor
 
     def get_scan_plugin_logger(self, plugin_name):
         """
@@ -23,7 +23,10 @@ import copy
 import queue
 import types
 import asyncio
+import logging
 import aiohttp
+import contextvars
+import collections
 
 from core.components import common
 from core.components import exceptions
@@ -33,6 +36,10 @@ from core.components.logger import Logger
 from core.components.config import Config
 from core.components.communicator import Communicator
 
+# 当前协程正在执行的扫描任务状态, 结构为 {"id": 任务id, "failed": 是否存在失败的请求}
+# 同一插件并行执行多个任务时, 各任务的协程通过contextvars区分各自的状态
+current_task_state = contextvars.ContextVar("current_task_state", default=None)
+
 
 class ScanPluginBase(object):
 
@@ -42,6 +49,9 @@ class ScanPluginBase(object):
         "description": "No description"  # 插件描述
     }
 
+    # 插件是否需要扫描请求的响应body, 为False时只读取响应码和headers, 不保存body, 发现漏洞的请求在写入报告前重新发送以获取body
+    need_response_body = True
+
     audit_tools = audit_tools
 
     def __init__(self):
@@ -59,11 +69,14 @@ class ScanPluginBase(object):
         self._white_reg = None  # 扫描url白名单
         self._proxy_url = None  # 扫描使用的代理
         self._scan_queue = queue.Queue()  # 任务队列
-        self._last_scan_id = 0  # 最近扫描完成的任务在数据库中的id
+        self._last_scan_id = 0  # 最近扫描完成的任务在数据库中的id, 该id及之前的任务均已完成
         self._scan_num = 0  # 当前已扫描url数量
-        self._has_failed_reuqest = False  # 标记扫描中存在连接失败的请求
+        self._running_task_ids = collections.OrderedDict()  # 已开始执行的任务id, value为是否完成
+        self._finished_tasks = []  # 已完成但未被扫描模块获取的任务, item为tuple (任务id, 是否存在失败的请求, 是否执行了扫描)
+        self._running_tasks = set()  # 正在执行的任务协程
         self._request_timeout = Config().get_config("scanner.request_timeout")
         self._max_concurrent_task = Config().get_config("scanner.max_concurrent_request")
+        self._max_running_task = max(Config().get_config("scanner.plugin_concurrent_task"), 1)
 
         # 共享的report_model 和 failed_task_set 需要在实例化ScanPluginBase类之前设置
         try:
@@ -73,6 +86,12 @@ class ScanPluginBase(object):
             Logger().error("Try to init scan_plugin before set internal shared key in Communicator! Check 'error.log' for more information.")
             sys.exit(1)
 
+        # 任务完成时通知扫描模块, 未设置时(如单独测试插件)不通知
+        try:
+            self._task_finish_event = Communicator().get_internal_shared("task_finish_event")
+        except exceptions.InternalSharedKeyError:
+            self._task_finish_event = None
+
         self._request_session = audit_tools.Session()
         self._request_data = audit_tools.RequestData
 
@@ -92,6 +111,26 @@ class ScanPluginBase(object):
         """
         return self._scan_num, self._last_scan_id
 
+    def pop_finished_tasks(self):
+        """
+        获取并清空上次调用以来完成的任务
+
+        Returns:
+            list, item为tuple (任务id, 是否存在失败的请求, 是否执行了扫描), 插件未启用时任务不执行扫描
+        """
+        finished_tasks = self._finished_tasks
+        self._finished_tasks = []
+        return finished_tasks
+
+    def get_pending_num(self):
+        """
+        获取已添加但未完成的任务数量
+
+        Returns:
+            int
+        """
+        return self._scan_queue.qsize() + len(self._running_task_ids)
+
     def get_max_concureent_task(self):
         """
         Returns:
@@ -108,6 +147,13 @@ class ScanPluginBase(object):
         """
         self._enable = is_enable
 
+    def get_enable(self):
+        """
+        Returns:
+            bool, 插件是否启用
+        """
+        return self._enable
+
     def set_white_url_reg(self, reg_str):
         """
         设置扫描url白名单, 为空时设置为None
@@ -134,35 +180,78 @@ class ScanPluginBase(object):
 
     async def async_run(self):
         """
-        主函数，执行扫描任务
+        主函数，执行扫描任务, 最多同时执行scanner.plugin_concurrent_task个任务
         """
         await self._request_session.async_init()
         self._scan_queue_event = asyncio.Event()
-        while True:
-            if not self._scan_queue.empty():
-                self._has_failed_reuqest = False
-                self._task = self._scan_queue.get_nowait()
-                if self._enable:
-                    rasp_result_ins = self._task["data"]
-                    try:
-                        await self._scan(self._task["id"], rasp_result_ins)
-                    except asyncio.CancelledError as e:
-                        raise e
-                    except Exception as e:
-                        self.logger.error("scanner plugin: [{}] error:".format(
-                            self.plugin_info["name"]), exc_info=e)
-
-                    if self._has_failed_reuqest:
-                        self._failed_set.add(self._task["id"])
-
-                self._last_scan_id = self._task["id"]
-                self._scan_num += 1
-            else:
-                self._scan_queue_event.clear()
-                await self._scan_queue_event.wait()
+        task_semaphore = asyncio.Semaphore(self._max_running_task)
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                if not self._scan_queue.empty():
+                    await task_semaphore.acquire()
+                    task = self._scan_queue.get_nowait()
+                    self._running_task_ids[task["id"]] = False
+                    running_task = loop.create_task(self._run_task(task, task_semaphore))
+                    self._running_tasks.add(running_task)
+                    running_task.add_done_callback(self._running_tasks.discard)
+                else:
+                    self._scan_queue_event.clear()
+                    await self._scan_queue_event.wait()
+        finally:
+            for running_task in list(self._running_tasks):
+                running_task.cancel()
         # if break but not exit, do close
         await self._request_session.close()
 
+    async def _run_task(self, task, task_semaphore):
+        """
+        执行一个扫描任务并记录完成状态
+
+        Parameters:
+            task - dict, 扫描任务, 格式: {"id": 任务id, "data": RaspResult实例}
+            task_semaphore - asyncio.Semaphore, 限制同时执行的任务数, 任务结束时释放
+        """
+        task_state = {"id": task["id"], "failed": False}
+        current_task_state.set(task_state)
+        scanned = self._enable
+        try:
+            if scanned:
+                try:
+                    await self._scan(task["id"], task["data"])
+                except asyncio.CancelledError as e:
+                    raise e
+                except Exception as e:
+                    self.logger.error("scanner plugin: [{}] error:".format(
+                        self.plugin_info["name"]), exc_info=e)
+
+                if task_state["failed"]:
+                    self._failed_set.add(task["id"])
+            self._finish_task(task["id"], task_state["failed"], scanned)
+        finally:
+            task_semaphore.release()
+
+    def _finish_task(self, task_id, failed=False, scanned=True):
+        """
+        标记任务完成, 任务可能乱序完成, _last_scan_id只推进到连续完成的最大id
+
+        Parameters:
+            task_id - int, 完成的任务id
+            failed - bool, 任务中是否存在失败的请求
+            scanned - bool, 是否执行了扫描, 插件未启用时为False
+        """
+        self._scan_num += 1
+        self._finished_tasks.append((task_id, failed, scanned))
+        self._running_task_ids[task_id] = True
+        while len(self._running_task_ids) > 0:
+            first_id = next(iter(self._running_task_ids))
+            if not self._running_task_ids[first_id]:
+                break
+            self._running_task_ids.popitem(last=False)
+            self._last_scan_id = first_id
+        if self._task_finish_event is not None:
+            self._task_finish_event.set()
+
     def add_task(self, task):
         """
         向扫描插件添加任务的接口
@@ -240,7 +329,9 @@ class ScanPluginBase(object):
                 "response": {
                     "status": HTTP状态码,
                     "headers": 返回包的headers字典,
-                    "body": 返回包的body, bytes类型
+                    "body": 返回包的body, bytes类型, 插件的need_response_body为False时为b"",
+                    "body_read": 是否读取了body,
+                    "body_truncated": body是否因超出scanner.response_body_limit被截断
                     }
                 "rasp_result": core.components.rasp_result.RaspResult 对象实例，未获取到时为None
             }
@@ -254,7 +345,8 @@ class ScanPluginBase(object):
         self._register_result(request_id)
         try:
             # self.logger.debug("Send scan request with id: {}, content: {}".format(request_id, request_data.get_aiohttp_param()))
-            response = await self._request_session.send_request(request_data, self._proxy_url)
+            response = await self._request_session.send_request(
+                request_data, self._proxy_url, read_body=self.need_response_body)
             # self.logger.debug("Request with id: {} get response: {}".format(request_id, response))
 
             if "X-Protected-By" not in response["headers"]:
@@ -264,8 +356,10 @@ class ScanPluginBase(object):
                 rasp_result_ins = await self._wait_result(request_id)
                 # self.logger.debug("Request with id: {} get rasp_result: {}".format(request_id, rasp_result_ins))
         except (exceptions.ScanRequestFailed, exceptions.GetRaspResultFailed) as e:
-            self._has_failed_reuqest = True
-            self.logger.debug("Request with id {} of task id {} failed, skip task!".format(request_id, self._task["id"]))
+            task_state = current_task_state.get()
+            if task_state is not None:
+                task_state["failed"] = True
+                self.logger.debug("Request with id {} of task id {} failed, skip task!".format(request_id, task_state["id"]))
             raise e
 
         ret = {
@@ -283,6 +377,9 @@ class ScanPluginBase(object):
             task_id - int, 扫描task对应的id
             rasp_result_ins - RaspResult实例
         """
+        if current_task_state.get() is None:
+            current_task_state.set({"id": task_id, "failed": False})
+
         if self._white_reg is not None:
             qs = rasp_result_ins.get_query_string()
             uri = rasp_result_ins.get_path()
@@ -327,8 +424,9 @@ class ScanPluginBase(object):
         Parameters:
             mutant_generator - 测试请求序列生成器
         """
+        task_state = current_task_state.get()
         while True:
-            if self._has_failed_reuqest:
+            if task_state["failed"]:
                 break
             try:
                 request_data_list = mutant_generator.__next__()
@@ -339,28 +437,15 @@ class ScanPluginBase(object):
                 for req_data in request_data_list:
                     ret = await self.send_request(req_data)
                     req_data.set_response(ret["response"])
-                    raw_request = await req_data.get_aiohttp_raw()
-                    self.logger.debug("Send scan request: \n{}\n".format(raw_request))
-
-                    raw_response = []
-                    raw_response.append("HTTP Code:" + str(ret["response"]["status"]))
-                    for key, value in ret["response"]["headers"].items():
-                        raw_response.append(key + ": " + value)
-
-                    raw_response.append("")
-                    try:
-                        body = ret["response"]["body"].decode("utf-8")
-                    except UnicodeDecodeError:
-                        body = ret["response"]["body"].decode("latin-1")
-
-                    raw_response.append(body)
-                    raw_response = "\r\n".join(raw_response)
-                    self.logger.debug("Scan request with id: {}, got response:\n {}\n".format(ret["scan_req_id"], raw_response))
+                    # 仅在debug日志级别下生成每个扫描请求的raw request/response
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug("Send scan request: \n{}\n".format(await req_data.get_aiohttp_raw()))
+                        self.logger.debug("Scan request with id: {}, got response:\n {}\n".format(
+                            ret["scan_req_id"], req_data.get_raw_response()))
 
                     if ret["rasp_result"] is not None:
-                        self.logger.debug("Scan request with id: {}, got rasp_result: {}".format(ret["scan_req_id"], ret["rasp_result"]))
-                        ret["rasp_result"].set_request(raw_request)
-                        ret["rasp_result"].set_response(raw_response)
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            self.logger.debug("Scan request with id: {}, got rasp_result: {}".format(ret["scan_req_id"], ret["rasp_result"]))
                         req_data.set_rasp_result(ret["rasp_result"])
             except (exceptions.ScanRequestFailed, exceptions.GetRaspResultFailed):
                 break
@@ -374,6 +459,40 @@ class ScanPluginBase(object):
                     urls = ",".join(url_list)
                     self.logger.info("Plugin find vuln with request {}".format(urls))
 
+    async def _render_raw(self, request_data_list):
+        """
+        为发现漏洞的测试请求序列生成raw request/response并写入对应的RaspResult, 仅在写入漏洞报告前调用
+
+        Parameters:
+            request_data_list - list, RequestData类的实例组成的列表
+        """
+        for request_data in request_data_list:
+            rasp_result_ins = request_data.get_rasp_result()
+            if rasp_result_ins is None:
+                continue
+            rasp_result_ins.set_request(await request_data.get_aiohttp_raw())
+            if not request_data.get_response().get("body_read", True):
+                await self._read_response_body(request_data)
+            rasp_result_ins.set_response(request_data.get_raw_response())
+
+    async def _read_response_body(self, request_data):
+        """
+        重新发送未读取响应body的测试请求, 读取最多scanner.response_body_limit字节的body, 用于漏洞报告,
+        发送失败时保留原response
+
+        Parameters:
+            request_data - RequestData类的实例
+        """
+        # 使用新的scan-request-id, 重新发送的请求产生的rasp_result不会被当作原请求的结果
+        request_data.gen_scan_request_id()
+        try:
+            response = await self._request_session.send_request(
+                request_data, self._proxy_url, read_body=True)
+        except exceptions.ScanRequestFailed:
+            self.logger.warning("Resend request for response body failed, report without body!")
+            return
+        request_data.set_response(response)
+
     async def report(self, request_data_list, message=""):
         """
         向扫描结果中添加一条漏洞信息
@@ -389,4 +508,5 @@ class ScanPluginBase(object):
             exceptions.DatabaseError - 数据库发生错误时引发
         """
         message = "OpenRASP-IAST漏洞扫描 - " + message
+        await self._render_raw(request_data_list)
         return await self._report_model.put(request_data_list, self.plugin_info["name"], self.plugin_info["description"], message)
@@ -29,6 +29,7 @@ import urllib.parse
 from core.components import common
 from core.components import exceptions
 from core.components.logger import Logger
+from core.components.config import Config
 
 
 class RaspResult(object):
@@ -63,22 +64,48 @@ class RaspResult(object):
     }
     rasp_result_validtor = jsonschema.Draft7Validator(schema)
 
+    # schema中的类型对应的python类型, 用于非严格模式下的字段检查
+    json_types = {
+        "string": str,
+        "object": dict,
+        "array": list
+    }
+
     host_reg = re.compile(r'^[a-zA-Z0-9.\-]+$')
 
-    def __init__(self, rasp_result_json):
+    # 扫描请求的scan-request-id, 由扫描进程的队列id和uuid组成, 用于在原始数据中查找,
+    # 请求body等字段中可能包含相同的key, 匹配结果只能作为候选
+    raw_scan_request_id_reg = re.compile(rb'"scan-request-id"\s*:\s*"([0-9]+-[0-9a-fA-F\-]+)"')
+    # 位于header对象(值均为字符串, 不包含嵌套对象)中的scan-request-id
+    raw_header_scan_request_id_reg = re.compile(
+        rb'"header"\s*:\s*\{[^{}]*?"scan-request-id"\s*:\s*"([0-9]+-[0-9a-fA-F\-]+)"')
+    scan_request_id_reg = re.compile(r'^[0-9]+-[0-9a-fA-F\-]+$')
+
+    def __init__(self, rasp_result_json, strict=None):
         """
         初始化
 
+        非严格模式下仅检查路由和去重必需的结构(context、header、hook_info、requestId),
+        context中的其他字段在首次读取时检查, 严格模式下使用json schema完整校验
+
         Parameters:
             rasp_result_json - 接收自rasp agent的rasp_result json字符串 或 其反序列化后的dict
+            strict - boolean, 是否使用严格模式, 为None时使用配置preprocessor.strict_validate
         """
         self.hash_str = ""
+        self._context_checked = False
+        if strict is None:
+            strict = Config().get_config("preprocessor.strict_validate")
         try:
             if type(rasp_result_json) is dict:
                 self.rasp_result_dict = rasp_result_json
             else:
                 self.rasp_result_dict = json.loads(rasp_result_json)
-            self.rasp_result_validtor.validate(self.rasp_result_dict)
+            if strict:
+                self.rasp_result_validtor.validate(self.rasp_result_dict)
+                self._context_checked = True
+            else:
+                self._check_struct()
         except (UnicodeDecodeError, ValueError, TypeError) as e:
             Logger().warning(
                 "RaspResult init with non-json data:{}".format(rasp_result_json), exc_info=e)
@@ -89,6 +116,115 @@ class RaspResult(object):
             raise exceptions.ResultInvalid
         self._check_target(rasp_result_json)
 
+    def _check_struct(self):
+        """
+        检查rasp_result中路由和去重必需的结构
+
+        Raises:
+            exceptions.ResultInvalid - 格式错误引发此异常
+        """
+        rasp_result_dict = self.rasp_result_dict
+        if type(rasp_result_dict) is not dict or \
+           type(rasp_result_dict.get("hook_info")) is not list or \
+           type(rasp_result_dict.get("context")) is not dict or \
+           type(rasp_result_dict["context"].get("header")) is not dict or \
+           type(rasp_result_dict["context"].get("requestId")) is not str:
+            Logger().warning("RaspResult init with invalid format data!")
+            raise exceptions.ResultInvalid
+
+    def _check_context(self):
+        """
+        按照schema检查context中的全部字段, 仅在首次读取context字段时执行一次
+
+        Raises:
+            exceptions.ResultInvalid - 格式错误引发此异常
+        """
+        context = self.rasp_result_dict["context"]
+        context_schema = self.schema["properties"]["context"]
+        for key in context_schema["required"]:
+            if key not in context:
+                Logger().warning("RaspResult missing required field: context.{}".format(key))
+                raise exceptions.ResultInvalid
+        for key, field_schema in context_schema["properties"].items():
+            if key in context and type(context[key]) is not self.json_types[field_schema["type"]]:
+                Logger().warning("RaspResult field context.{} type error, expect {}".format(
+                    key, field_schema["type"]))
+                raise exceptions.ResultInvalid
+        self._context_checked = True
+
+    def _get_context(self):
+        """
+        获取rasp_result中的context, 首次获取时检查字段格式
+
+        Returns:
+            dict, context
+
+        Raises:
+            exceptions.ResultInvalid - 格式错误引发此异常
+        """
+        if not self._context_checked:
+            self._check_context()
+        return self.rasp_result_dict["context"]
+
+    @classmethod
+    def get_raw_scan_request_id_list(cls, raw_result):
+        """
+        不解析json, 在原始数据中查找所有可能是scan-request-id的值, 真实的scan-request-id(如果存在)一定在其中
+
+        Parameters:
+            raw_result - bytes, 接收自rasp agent的rasp_result json
+
+        Returns:
+            list, item为str
+        """
+        return [match.group(1).decode("ascii") for match in cls.raw_scan_request_id_reg.finditer(raw_result)]
+
+    @classmethod
+    def get_raw_scan_request_id(cls, raw_result):
+        """
+        获取原始数据中context.header的scan-request-id, 用于扫描请求结果的路由,
+        原始数据中只有一个候选值且位于header对象中时直接使用, 不包含候选值时返回空,
+        仅在存在多个候选值(如请求json中包含同名key)或无法确定候选值位置时解析json
+
+        Parameters:
+            raw_result - bytes, 接收自rasp agent的rasp_result json
+
+        Returns:
+            str, scan_request_id, 未找到或json无法解析时返回空
+        """
+        candidates = cls.raw_scan_request_id_reg.findall(raw_result)
+        if len(candidates) == 0:
+            return ""
+        elif len(candidates) == 1:
+            match = cls.raw_header_scan_request_id_reg.search(raw_result)
+            if match is not None:
+                return match.group(1).decode("ascii")
+        try:
+            scan_request_id = json.loads(raw_result)["context"]["header"]["scan-request-id"]
+        except (UnicodeDecodeError, ValueError, TypeError, KeyError):
+            return ""
+        if type(scan_request_id) is not str or cls.scan_request_id_reg.match(scan_request_id) is None:
+            return ""
+        return scan_request_id
+
+    @staticmethod
+    def get_stack_hash(stack):
+        """
+        获取一个hook点调用栈的hash
+
+        Parameters:
+            stack - list, hook_info中的stack
+
+        Returns:
+            str, md5字符串
+        """
+        hook_stack_str = "".join(stack)
+        try:
+            hook_stack_bytes = hook_stack_str.encode("latin-1")
+        except UnicodeEncodeError:
+            hook_stack_bytes = hook_stack_str.encode("utf-8")
+        return hashlib.md5(hook_stack_bytes).hexdigest()
+
     def _check_target(self, rasp_result_json):
         """
         检查rasp_result中是否包含target，不包含则从context->host中获取
@@ -177,7 +313,7 @@ class RaspResult(object):
         Returns:
             str, hostname
         """
-        return self.rasp_result_dict["context"]["hostname"]
+        return self._get_context()["hostname"]
 
     def get_server_nic(self):
         """
@@ -190,7 +326,7 @@ class RaspResult(object):
                 "ip": "172.17.0.2"
             }
         """
-        return self.rasp_result_dict["context"]["nic"]
+        return self._get_context()["nic"]
 
     def get_result_queue_id(self):
         """
@@ -230,7 +366,7 @@ class RaspResult(object):
                 'language': 'java / php'
              }
         """
-        return self.rasp_result_dict["context"]["server"]
+        return self._get_context()["server"]
 
     def get_app_base_path(self):
         """
@@ -239,7 +375,7 @@ class RaspResult(object):
         Returns:
             str, '/home/tomcat/webapps'
         """
-        return self.rasp_result_dict["context"]["appBasePath"]
+        return self._get_context()["appBasePath"]
 
     def get_host(self):
         """
@@ -285,7 +421,7 @@ class RaspResult(object):
         Returns:
             string, 获取的ip
         """
-        return self.rasp_result_dict["context"].get("target", "")
+        return self._get_context().get("target", "")
 
     def get_attack_source(self):
         """
@@ -294,7 +430,7 @@ class RaspResult(object):
         Returns:
             string, 获取的ip
         """
-        return self.rasp_result_dict["context"].get("source", "")
+        return self._get_context().get("source", "")
 
     def get_client_ip(self):
         """
@@ -303,7 +439,7 @@ class RaspResult(object):
         Returns:
             string, 获取的ip
         """
-        return self.rasp_result_dict["context"].get("clientIp", "")
+        return self._get_context().get("clientIp", "")
 
     def get_method(self):
         """
@@ -312,7 +448,7 @@ class RaspResult(object):
         Returns:
             string, 小写形式
         """
-        return self.rasp_result_dict["context"]["method"].lower()
+        return self._get_context()["method"].lower()
 
     def get_path(self):
         """
@@ -321,7 +457,7 @@ class RaspResult(object):
         Returns:
             string, 获取的path
         """
-        return self.rasp_result_dict["context"]["path"]
+        return self._get_context()["path"]
 
     def get_url(self):
         """
@@ -330,7 +466,7 @@ class RaspResult(object):
         Returns:
             string, 获取的url
         """
-        return self.rasp_result_dict["context"]["url"]
+        return self._get_context()["url"]
 
     def get_scan_url(self):
         """
@@ -339,7 +475,7 @@ class RaspResult(object):
         Returns:
             string, 获取的url
         """
-        if self.rasp_result_dict["context"]["url"].startswith("https"):
+        if self._get_context()["url"].startswith("https"):
             protocol = "https://"
         else:
             protocol = "http://"
@@ -354,7 +490,7 @@ class RaspResult(object):
         Returns:
             string, 形如 HTTP/1.1
         """
-        return self.rasp_result_dict["context"]["protocol"].upper()
+        return self._get_context()["protocol"].upper()
 
     def get_query_string(self):
         """
@@ -363,7 +499,7 @@ class RaspResult(object):
         Returns:
             string, 获取的query
         """
-        return self.rasp_result_dict["context"]["querystring"]
+        return self._get_context()["querystring"]
 
     def get_headers(self):
         """
@@ -381,7 +517,7 @@ class RaspResult(object):
         Returns:
             dict, 每个参数字段对应一个key-value
         """
-        return self.rasp_result_dict["context"]["parameter"]
+        return self._get_context()["parameter"]
 
     def get_query_parameters(self):
         """
@@ -390,7 +526,7 @@ class RaspResult(object):
         Returns:
             dict, 每个参数字段对应一个key-value, value为list，包含所有同名参数
         """
-        return urllib.parse.parse_qs(self.rasp_result_dict["context"]["querystring"], keep_blank_values=True)
+        return urllib.parse.parse_qs(self._get_context()["querystring"], keep_blank_values=True)
 
     def get_query_param_dict(self):
         """
@@ -401,7 +537,7 @@ class RaspResult(object):
         """
         result = {}
         params = urllib.parse.parse_qsl(
-            self.rasp_result_dict["context"]["querystring"], keep_blank_values=True)
+            self._get_context()["querystring"], keep_blank_values=True)
         rasp_params = self.get_parameters()
         for item in params:
             if item[0] not in result:
@@ -479,7 +615,7 @@ class RaspResult(object):
         Returns:
             json.loads后返回的对象，非json请求或不存在时返回{}
         """
-        return self.rasp_result_dict["context"]["json"]
+        return self._get_context()["json"]
 
     def get_body(self):
         """
@@ -488,7 +624,7 @@ class RaspResult(object):
         Returns:
             json.loads返回的对象，非json请求或不存在时返回{}
         """
-        return bytes.fromhex(self.rasp_result_dict["context"]["body"])
+        return bytes.fromhex(self._get_context()["body"])
 
     def get_hook_info(self):
         """
@@ -544,7 +680,7 @@ class RaspResult(object):
         Returns:
             string, json结构字符串
         """
-        json_data = self.rasp_result_dict["context"]["json"]
+        json_data = self._get_context()["json"]
         result = []
         parse_stack = [json_data]
         while len(parse_stack) > 0:
@@ -593,8 +729,7 @@ class RaspResult(object):
             hook_item - dict, 取自请求的hook_info
         """
         try:
-            hook_stack_str = "".join(hook_item["stack"]).encode("latin-1")
-            stack_hash = hashlib.md5(hook_stack_str).hexdigest()
+            stack_hash = self.get_stack_hash(hook_item["stack"])
         except KeyError:
             stack_hash = "random-" + common.random_str(32)
 
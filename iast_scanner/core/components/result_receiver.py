@@ -22,6 +22,7 @@ import asyncio
 import collections
 
 from core.components import exceptions
+from core.components import rasp_result
 from core.components.logger import Logger
 from core.components.config import Config
 from core.components.communicator import Communicator
@@ -56,22 +57,51 @@ class RaspResultReceiver(object):
         self.rasp_result_collection[req_id] = [
             asyncio.Event(), expire_time, None]
 
-    def add_result(self, rasp_result):
+    def add_raw_result(self, raw_result):
+        """
+        添加一个未解析的扫描请求结果, 仅解析可能已通过register_result方法注册的结果, 其余直接丢弃
+
+        Parameters:
+            raw_result - bytes, 扫描请求结果的json
+        """
+        # 真实的scan-request-id一定在候选值中, 所有候选值均未注册时无需解析
+        id_list = rasp_result.RaspResult.get_raw_scan_request_id_list(raw_result)
+        if len(id_list) > 0 and not any(item in self.rasp_result_collection for item in id_list):
+            Communicator().increase_value("dropped_rasp_result")
+            Logger().warning("Drop no registered rasp result data with scan-request-id: {}".format(id_list[0]))
+            self._clean_expired()
+            return
+
+        try:
+            rasp_result_ins = rasp_result.RaspResult(raw_result)
+        except exceptions.OriExpectedException:
+            Communicator().increase_value("dropped_rasp_result")
+            Logger().warning("Drop invalid rasp result data: {}".format(raw_result))
+            self._clean_expired()
+            return
+        self.add_result(rasp_result_ins)
+
+    def add_result(self, rasp_result_ins):
         """
         添加一个RaspResult实例到缓存队列并触发对应的数据到达事件, 同时清空缓存中过期的实例
         若RaspResult实例的id未通过register_result方法注册，则直接丢弃
 
         Parameters:
-            rasp_result - 待添加的RaspResult实例
+            rasp_result_ins - 待添加的RaspResult实例
         """
-        scan_request_id = rasp_result.get_scan_request_id()
+        scan_request_id = rasp_result_ins.get_scan_request_id()
         try:
-            self.rasp_result_collection[scan_request_id][2] = rasp_result
+            self.rasp_result_collection[scan_request_id][2] = rasp_result_ins
             self.rasp_result_collection[scan_request_id][0].set()
         except KeyError:
             Communicator().increase_value("dropped_rasp_result")
-            Logger().warning("Drop no registered rasp result data: {}".format(str(rasp_result)))
+            Logger().warning("Drop no registered rasp result data: {}".format(str(rasp_result_ins)))
+        self._clean_expired()
 
+    def _clean_expired(self):
+        """
+        清空缓存中过期的实例
+        """
         while True:
             try:
                 key = next(iter(self.rasp_result_collection))
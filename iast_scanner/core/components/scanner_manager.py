@@ -37,6 +37,7 @@ from core.model.base_model import BaseModel
 from core.model.report_model import ReportModel
 from core.model.config_model import ConfigModel
 from core.model.new_request_model import NewRequestModel
+from core.model.target_stats_model import TargetStatsModel
 
 
 class ScannerManager(object):
@@ -186,6 +187,11 @@ class ScannerManager(object):
                 "dropped_rasp_result": 0, // 收到的无效rasp-agent结果数量
                 "send_request": 0,  // 已发送测试请求
                 "failed_request": 0, // 发生错误的测试请求
+                "http_conn_create": 0, // 新建的扫描请求连接数
+                "http_conn_reuse": 0, // 复用keep-alive连接的扫描请求数
+                "tls_handshake": 0, // 新建https连接的TLS握手次数(未实现会话恢复, 均为完整握手)
+                "db_pool_wait": 0, // 等待数据库连接池的次数
+                "db_pool_wait_time": 0, // 等待数据库连接池的总时间(ms)
                 "total": 5, // 当前url总数
                 "failed": 1, // 扫描失败的url数量
                 "scanned": 2, // 扫描的url数量
@@ -683,12 +689,15 @@ class TargetStatus(object):
         """
         table_status = Communicator().get_target_list_status()
         if table_status > self._table_status:
-            tables = BaseModel(multiplexing_conn=True).get_tables()
             result_tables = []
-            for table_name in tables:
-                if table_name.lower().endswith("_resultlist"):
-                    host_port = table_name[:-11]
-                    result_tables.append(host_port)
+            if BaseModel.is_single_table():
+                result_tables = TargetStatsModel.get_instance().get_targets()
+            else:
+                tables = BaseModel(multiplexing_conn=True).get_tables()
+                for table_name in tables:
+                    if table_name.lower().endswith("_resultlist"):
+                        host_port = table_name[:-11]
+                        result_tables.append(host_port)
             self._table_list = result_tables
             self._table_status = table_status
         return self._table_list
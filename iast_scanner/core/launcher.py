@@ -52,6 +52,8 @@ class Launcher(object):
                         break
 
                     if cpid == self.monitor_pid:
+                        # preprocessor的http服务进程先写入缓冲区中的新请求再退出
+                        modules.Preprocessor.stop_http_server(Config().get_config("preprocessor.exit_timeout"))
                         root_proc = psutil.Process(os.getpid())
                         procs = root_proc.children(recursive=True)
                         for p in procs:
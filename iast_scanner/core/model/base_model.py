@@ -18,12 +18,18 @@ limitations under the License.
 """
 
 import os
+import zlib
 import time
+import base64
 import peewee
+import sqlite3
 import pymysql
 import peewee_async
 import threading
+import playhouse.migrate
 
+from core.model import db_pool
+from core.model import db_sqlite
 from core.components import exceptions
 from core.components.logger import Logger
 from core.components.config import Config
@@ -33,6 +39,13 @@ from core.components.communicator import Communicator
 class BaseModel(object):
 
     mul_lock = threading.Lock()
+    # 当前进程中已检查过表结构版本的数据表
+    upgraded_tables = set()
+    # 数据表结构版本, 子类修改表结构时增加版本号, 并在_get_migrations中添加对应的升级操作
+    schema_version = 0
+    # 是否支持单表存储模式, 为True的子类在database.storage_mode为single_table时, 将所有扫描目标的数据
+    # 按host_port的hash存储在共用的分区表中, 以target列区分扫描目标
+    support_single_table = False
 
     class LongTextField(peewee.TextField):
         """
@@ -40,6 +53,26 @@ class BaseModel(object):
         """
         field_type = 'LONGTEXT'
 
+    class CompressedLongTextField(LongTextField):
+        """
+        压缩存储的mysql longtext字段, 写入时使用zlib压缩并base64编码, 以format_tag开头,
+        读取时自动解压, 未压缩的旧数据原样返回
+        """
+        format_tag = "zlib:"
+
+        def db_value(self, value):
+            if value is not None and Config().get_config("database.compress_data"):
+                data = base64.b64encode(zlib.compress(value.encode("utf-8"))).decode("ascii")
+                # 压缩后更大的短数据不压缩
+                if len(data) + len(self.format_tag) < len(value):
+                    value = self.format_tag + data
+            return super().db_value(value)
+
+        def python_value(self, value):
+            if value is not None and value.startswith(self.format_tag):
+                value = zlib.decompress(base64.b64decode(value[len(self.format_tag):])).decode("utf-8")
+            return super().python_value(value)
+
     def __new__(cls, table_prefix=None, use_async=True, create_table=True, multiplexing_conn=False):
         """
         初始化数据库连接，构造peewee model实例
@@ -48,7 +81,7 @@ class BaseModel(object):
             table_prefix - 表名前缀，由扫描目标的 host + "_" + str(port) 组成
             use_async - 是否开启数据库连接的异步查询功能，默认为True
             create_table - 数据表不存在时是否创建，默认为True
-            multiplexing_conn - 是否复用连接，为True时，相同的Model的实例会使用同一个连接，默认为False
+            multiplexing_conn - 是否复用连接，为True时，当前进程中的实例共用同一个连接池，默认为False
 
         Raises:
             create_table为Fasle且目标数据表不存在时，引发exceptions.TableNotExist
@@ -63,7 +96,8 @@ class BaseModel(object):
                 "charset": "utf8mb4"
             }
 
-            if not hasattr(cls, "db_created"):
+            # sqlite数据库文件在首次连接时创建
+            if not hasattr(cls, "db_created") and not cls.is_sqlite():
                 conn = pymysql.connect(
                     host=Config().get_config("database.host"),
                     port=Config().get_config("database.port"),
@@ -86,26 +120,10 @@ class BaseModel(object):
                 conn.close()
                 cls.db_created = True
 
-            if multiplexing_conn is True:
-                with BaseModel.mul_lock:
-                    if not hasattr(BaseModel, "mul_database"):
-                        BaseModel.mul_database = peewee_async.MySQLDatabase(
-                            **cls.connect_para)
-                        BaseModel.mul_database.connect()
-                        BaseModel.mul_database_timeout = time.time() + 60
-                    elif time.time() > BaseModel.mul_database_timeout:
-                        BaseModel.mul_database.close()
-                        BaseModel.mul_database = peewee_async.MySQLDatabase(
-                            **cls.connect_para)
-                        BaseModel.mul_database.connect()
-                        BaseModel.mul_database_timeout = time.time() + 60
+            if multiplexing_conn is True or cls.is_sqlite():
+                cls._init_mul_database(Config().get_config("database.pool_max_size"))
             elif isinstance(multiplexing_conn, int):
-                with BaseModel.mul_lock:
-                    if not hasattr(BaseModel, "mul_database"):
-                        BaseModel.mul_database = peewee_async.PooledMySQLDatabase(
-                            **cls.connect_para,
-                            max_connections=multiplexing_conn
-                        )
+                cls._init_mul_database(multiplexing_conn)
         except Exception as e:
             cls._handle_exception("Mysql Connection Fail!", e)
 
@@ -120,14 +138,16 @@ class BaseModel(object):
             table_prefix - 表名前缀，由扫描目标的 host + "_" + str(port) 组成
             use_async - 是否开启数据库连接的异步查询功能，默认为True
             create_table - 数据表不存在时是否创建，默认为True
-            multiplexing_conn - 是否复用连接，为True时，相同的Model的实例会使用同一个连接, 为int时使用该int大小的连接池, 默认为False
+            multiplexing_conn - 是否复用连接，为True时，当前进程中的实例共用同一个连接池, 为int时指定首次创建的连接池的最大连接数, 默认为False
 
         Raises:
             create_table为Fasle且目标数据表不存在时，引发exceptions.TableNotExist
         """
         self.use_async = use_async
+        self.host_port = table_prefix
         try:
-            if multiplexing_conn:
+            # sqlite数据库每个进程只使用一个连接
+            if multiplexing_conn or self.is_sqlite():
                 database = BaseModel.mul_database
             else:
                 if self.use_async:
@@ -150,6 +170,7 @@ class BaseModel(object):
                             pass
                     else:
                         raise exceptions.TableNotExist
+                self._upgrade_table(database)
 
             self.database = database
         except exceptions.TableNotExist as e:
@@ -157,12 +178,220 @@ class BaseModel(object):
         except Exception as e:
             self._handle_exception("Mysql Connection Fail!", e)
 
+    @classmethod
+    def _init_mul_database(cls, max_size):
+        """
+        创建当前进程共用的数据库连接池(sqlite为共用的连接), fork产生的子进程重新创建
+
+        Parameters:
+            max_size - int, 连接池最大连接数
+        """
+        with BaseModel.mul_lock:
+            if getattr(BaseModel, "mul_database_pid", None) == os.getpid():
+                return
+            if cls.is_sqlite():
+                BaseModel.mul_database = db_sqlite.SqliteDatabase(Config().get_config("database.sqlite_path"))
+            else:
+                BaseModel.mul_database = db_pool.PooledMySQLDatabase(
+                    **cls.connect_para,
+                    min_connections=min(Config().get_config("database.pool_min_size"), max_size),
+                    max_connections=max_size,
+                    pool_recycle=Config().get_config("database.pool_recycle"),
+                    ping_interval=Config().get_config("database.pool_ping_interval")
+                )
+            BaseModel.mul_database.connect()
+            BaseModel.mul_database_pid = os.getpid()
+
+    @classmethod
+    def get_instance(cls, use_async=True):
+        """
+        获取当前进程共用的实例, 用于所有扫描目标共用的数据表
+
+        Parameters:
+            use_async - 是否开启数据库连接的异步查询功能，默认为True
+
+        Returns:
+            cls的实例
+        """
+        if cls.__dict__.get("instance_pid") != os.getpid():
+            cls.instance = cls(table_prefix="", use_async=use_async, multiplexing_conn=True)
+            cls.instance_pid = os.getpid()
+        return cls.instance
+
     def _create_model(self, db, table_prefix):
         """
         子类实现此方法，构建对应数据表的peewee.Model类
         """
         raise NotImplementedError
 
+    @staticmethod
+    def is_sqlite():
+        """
+        Returns:
+            bool, 是否使用sqlite数据库
+        """
+        return Config().get_config("database.engine") == "sqlite"
+
+    @staticmethod
+    def is_single_table():
+        """
+        Returns:
+            bool, 是否使用单表存储模式
+        """
+        return Config().get_config("database.storage_mode") == "single_table"
+
+    def _use_single_table(self):
+        """
+        Returns:
+            bool, 当前实例的数据是否存储在共用的分区表中
+        """
+        return self.support_single_table and self.is_single_table()
+
+    def _get_table_name(self, table_prefix, name):
+        """
+        获取扫描目标对应的数据表名, 单表存储模式下为 name + "_" + 分区号, 否则为 table_prefix + "_" + name
+
+        Parameters:
+            table_prefix - str, 表名前缀, 由扫描目标的 host + "_" + str(port) 组成
+            name - str, 数据表类型名
+
+        Returns:
+            str, 数据表名
+        """
+        if self._use_single_table():
+            partition = zlib.crc32(table_prefix.encode("utf-8")) % Config().get_config("database.partition_num")
+            return "{}_{}".format(name, partition)
+        return table_prefix + "_" + name
+
+    def _add_target_unique_index(self, model, column):
+        """
+        单表存储模式下为model添加(target, column)唯一索引, 索引名以表名开头, 避免各分区表的索引重名
+
+        Parameters:
+            model - peewee.Model类
+            column - str, 在扫描目标内唯一的列名
+        """
+        table_name = model._meta.table_name
+        model.add_index(peewee.ModelIndex(
+            model, (model.target, getattr(model, column)), unique=True,
+            name="{}_target_{}".format(table_name, column)))
+
+    def _get_index(self, columns):
+        """
+        获取按扫描目标查询时使用的索引列, 单表存储模式下在最前添加target列
+
+        Parameters:
+            columns - tuple, 索引列名
+
+        Returns:
+            tuple, 索引列名
+        """
+        if self._use_single_table():
+            return ("target", ) + tuple(columns)
+        return tuple(columns)
+
+    def _target_query(self, query):
+        """
+        单表存储模式下为查询添加扫描目标条件, 否则原样返回
+
+        Parameters:
+            query - 当前实例model的peewee查询(select, update, delete)
+
+        Returns:
+            peewee查询
+        """
+        if self._use_single_table():
+            return query.where(self._model.target == self.host_port)
+        return query
+
+    def _get_migrations(self):
+        """
+        子类修改表结构时实现此方法, 返回各版本的升级操作
+
+        Returns:
+            dict, key为版本号, value为从上一版本升级到该版本的操作list, item为tuple, 可以为:
+                ("add_column", 列名) - 添加model中定义的列
+                ("add_index", (列名, ...)) - 添加联合索引
+        """
+        return {}
+
+    @staticmethod
+    def _create_version_model(database):
+        """
+        创建记录各数据表结构版本的peewee.Model类
+        """
+        meta = type("Meta", (object, ), {
+            "database": database,
+            "table_name": "schema_version"
+        })
+        model_dict = {
+            "name": peewee.CharField(primary_key=True, max_length=64),
+            "version": peewee.IntegerField(default=0),
+            "Meta": meta
+        }
+        return type("SchemaVersion", (peewee.Model, ), model_dict)
+
+    def _upgrade_table(self, database):
+        """
+        将数据表结构升级到当前model的schema_version, 新建的表和旧版本创建的表(无版本记录, 视为版本0)
+        均从记录的版本开始依次执行升级操作, 已存在的列和索引跳过, 每个进程中每张表只检查一次
+
+        Parameters:
+            database - 数据表所在的peewee数据库实例
+        """
+        table_name = self._model._meta.table_name
+        if self.schema_version == 0 or table_name in BaseModel.upgraded_tables:
+            return
+
+        version_model = self._create_version_model(database)
+        version_model.create_table(safe=True)
+        record = version_model.get_or_none(version_model.name == table_name)
+        version = 0 if record is None else record.version
+
+        if version < self.schema_version:
+            migrator = playhouse.migrate.SchemaMigrator.from_database(database)
+            migrations = self._get_migrations()
+            for target_version in range(version + 1, self.schema_version + 1):
+                for operation in migrations.get(target_version, []):
+                    self._run_migration(database, migrator, table_name, operation)
+            version_model.insert(
+                name=table_name, version=self.schema_version).on_conflict_replace().execute()
+            Logger().info("Upgrade table {} schema from version {} to {}".format(
+                table_name, version, self.schema_version))
+        BaseModel.upgraded_tables.add(table_name)
+
+    def _run_migration(self, database, migrator, table_name, operation):
+        """
+        执行一个升级操作, 目标列或索引已存在时跳过
+
+        Parameters:
+            database - 数据表所在的peewee数据库实例
+            migrator - playhouse.migrate.SchemaMigrator实例
+            table_name - str, 数据表名
+            operation - tuple, 升级操作, 见_get_migrations
+        """
+        operation_type, target = operation
+
+        def is_applied():
+            if operation_type == "add_column":
+                return target in [column.name for column in database.get_columns(table_name)]
+            else:
+                return list(target) in [index.columns for index in database.get_indexes(table_name)]
+
+        if is_applied():
+            return
+        if operation_type == "add_column":
+            field = self._model._meta.columns[target]
+            migration = migrator.add_column(table_name, target, field)
+        else:
+            migration = migrator.add_index(table_name, target)
+        try:
+            playhouse.migrate.migrate(migration)
+        except (peewee.InternalError, peewee.OperationalError) as e:
+            # 多个进程同时升级时, 其他进程可能已完成该操作
+            if not is_applied():
+                raise e
+
     def drop_table(self):
         """
         删除当前实例对应的数据库表
@@ -171,8 +400,19 @@ class BaseModel(object):
             exceptions.DatabaseError - 数据库出错时引发此异常
         """
         try:
+            # 单表存储模式下只删除扫描目标的数据, 不删除共用的分区表
+            if self._use_single_table():
+                self._target_query(self._model.delete()).execute()
+                return
             schema_manager = peewee.SchemaManager(self._model)
             schema_manager.drop_table()
+            # 删除表结构版本记录, 重新建表时重新执行升级操作
+            table_name = self._model._meta.table_name
+            BaseModel.upgraded_tables.discard(table_name)
+            if self.schema_version > 0:
+                version_model = self._create_version_model(self._model._meta.database)
+                if version_model.table_exists():
+                    version_model.delete().where(version_model.name == table_name).execute()
         except AttributeError as e:
             self._handle_exception("Can not call drop table in base model!", e)
         except Exception as e:
@@ -186,6 +426,9 @@ class BaseModel(object):
             exceptions.DatabaseError - 数据库出错时引发此异常
         """
         try:
+            if self._use_single_table():
+                self._target_query(self._model.delete()).execute()
+                return
             schema_manager = peewee.SchemaManager(self._model)
             schema_manager.truncate_table()
         except AttributeError:
@@ -209,6 +452,23 @@ class BaseModel(object):
             self._handle_exception("DB error in method get_tables!", e)
         return result
 
+    async def _execute_rowcount(self, query):
+        """
+        异步执行查询并返回影响的行数, 用于peewee_async不返回行数的查询(如批量INSERT IGNORE)
+
+        Parameters:
+            query - peewee查询实例
+
+        Returns:
+            int, 影响的行数
+        """
+        cursor = await self.database.cursor_async()
+        try:
+            await cursor.execute(*query.sql())
+            return cursor.rowcount
+        finally:
+            await cursor.release()
+
     @staticmethod
     def _handle_exception(msg, e):
         if str(e).find("Too many connections") != -1:
@@ -238,6 +498,51 @@ class BaseModel(object):
             )
             BaseModel.pymysql_conn_timeout = time.time() + 60
 
+    @staticmethod
+    def _get_cursor():
+        """
+        获取用于同步查询的游标, mysql使用pymysql连接, sqlite使用进程共用的数据库
+
+        Returns:
+            pymysql或sqlite3的cursor
+        """
+        if BaseModel.is_sqlite():
+            BaseModel._init_mul_database(1)
+            return BaseModel.mul_database.cursor()
+        BaseModel._creat_conn()
+        cursor = BaseModel.pymysql_conn.cursor()
+        cursor._defer_warnings = True
+        return cursor
+
+    @staticmethod
+    def _has_target_tables():
+        """
+        Returns:
+            bool, 是否可能存在统计表中没有记录的扫描目标数据表, 单表存储模式和sqlite数据库下扫描目标均在统计表中
+        """
+        return not BaseModel.is_single_table() and not BaseModel.is_sqlite()
+
+    @staticmethod
+    def _get_target_stats(cursor, target_list):
+        """
+        从TargetStats表读取扫描目标的统计数据, 统计表不存在时返回空dict
+
+        Parameters:
+            cursor - pymysql或sqlite3的cursor
+            target_list - list, item为要获取的主机的host_port
+
+        Returns:
+            dict, key为host_port, value为tuple (total, scanned, failed, last_time)
+        """
+        param = "?" if BaseModel.is_sqlite() else "%s"
+        sql = "SELECT host_port, total, scanned, failed, last_time FROM `TargetStats` WHERE host_port IN ({})".format(
+            ", ".join([param] * len(target_list)))
+        try:
+            cursor.execute(sql, list(target_list))
+        except (pymysql.err.ProgrammingError, sqlite3.OperationalError):
+            return {}
+        return {item[0]: item[1:] for item in cursor.fetchall()}
+
     @staticmethod
     def get_scan_count(target_list):
         """
@@ -262,33 +567,43 @@ class BaseModel(object):
             exceptions.DatabaseError - 数据库出错时引发此异常
         """
         try:
-            BaseModel._creat_conn()
-            conn = BaseModel.pymysql_conn
             if len(target_list) == 0:
                 return {}
 
             result = {}
+            cursor = BaseModel._get_cursor()
+            target_stats = BaseModel._get_target_stats(cursor, target_list)
+
+            # 优先使用统计表中的数据, 统计表中不存在的目标从目标的数据表统计
             sql = ""
             for target in target_list:
+                if target in target_stats:
+                    total, scanned, failed, _ = target_stats[target]
+                    result[target] = {
+                        "total": total,
+                        "scanned": scanned,
+                        "failed": failed
+                    }
+                    continue
                 result[target] = {
                     "total": 0,
                     "scanned": 0,
                     "failed": 0
                 }
+                if not BaseModel._has_target_tables():
+                    continue
                 sql += "union all ( SELECT '{target}', scan_status, count(*) FROM `{target}_ResultList` group by scan_status) ".format(target=target)
-            sql = sql[10:]
-            cursor = conn.cursor()
-            cursor._defer_warnings = True
-            cursor.execute(sql)
-            re = cursor.fetchall()
-            conn.commit()
-
-            for item in re:
-                result[item[0]]["total"] += item[2]
-                if item[1] == 1:
-                    result[item[0]]["scanned"] = item[2]
-                elif item[1] == 3:
-                    result[item[0]]["failed"] = item[2]
+
+            if sql != "":
+                sql = sql[10:]
+                cursor.execute(sql)
+                for item in cursor.fetchall():
+                    result[item[0]]["total"] += item[2]
+                    if item[1] == 1:
+                        result[item[0]]["scanned"] = item[2]
+                    elif item[1] == 3:
+                        result[item[0]]["failed"] = item[2]
+            cursor.connection.commit()
 
             return result
         except Exception as e:
@@ -315,27 +630,33 @@ class BaseModel(object):
             exceptions.DatabaseError - 数据库出错时引发此异常
         """
         try:
-            BaseModel._creat_conn()
-            conn = BaseModel.pymysql_conn
             if len(target_list) == 0:
                 return {}
 
-            sql = ""
             result = {}
+            cursor = BaseModel._get_cursor()
+            target_stats = BaseModel._get_target_stats(cursor, target_list)
+
+            sql = ""
             for target in target_list:
+                if target in target_stats:
+                    result[target] = {
+                        "last_time": target_stats[target][3]
+                    }
+                    continue
                 result[target] = {
                     "last_time": 0
                 }
+                if not BaseModel._has_target_tables():
+                    continue
                 sql += "union all ( SELECT '{target}', time FROM `{target}_ResultList` order by id desc limit 1) ".format(target=target)
-            sql = sql[10:]
-            cursor = conn.cursor()
-            cursor._defer_warnings = True
-            cursor.execute(sql)
-            re = cursor.fetchall()
-            conn.commit()
-
-            for item in re:
-                result[item[0]]["last_time"] = item[1]
+
+            if sql != "":
+                sql = sql[10:]
+                cursor.execute(sql)
+                for item in cursor.fetchall():
+                    result[item[0]]["last_time"] = item[1]
+            cursor.connection.commit()
 
             return result
         except Exception as e:
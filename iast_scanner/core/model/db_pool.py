@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+import asyncio
+import aiomysql
+import peewee_async
+import playhouse.shortcuts
+
+from core.components.logger import Logger
+from core.components.communicator import Communicator
+
+
+class PooledConnection(peewee_async.AsyncMySQLConnection):
+    """
+    带健康检查的aiomysql连接池, 空闲超过pool_recycle的连接在取出时重建,
+    空闲超过ping_interval的连接在取出时先执行ping, 失败时丢弃并重新获取
+    """
+
+    def __init__(self, *, database=None, loop=None, timeout=None, **kwargs):
+        """
+        初始化
+
+        Parameters:
+            pool_recycle - int, 空闲连接的最长保留时间(s), 为-1时不重建
+            ping_interval - int, 连接空闲超过该时间(s)时取出前执行ping, 为-1时不检查
+        """
+        self.pool_recycle = kwargs.pop("pool_recycle", -1)
+        self.ping_interval = kwargs.pop("ping_interval", -1)
+        super(PooledConnection, self).__init__(database=database, loop=loop, timeout=timeout, **kwargs)
+
+    async def connect(self):
+        """
+        创建连接池
+        """
+        self.pool = await aiomysql.create_pool(
+            loop=self.loop,
+            db=self.database,
+            connect_timeout=self.timeout,
+            pool_recycle=self.pool_recycle,
+            **self.connect_params)
+
+    async def acquire(self):
+        """
+        从连接池获取连接, 记录等待时间并检查连接是否可用
+
+        Returns:
+            aiomysql.Connection
+        """
+        start_time = time.time()
+        conn = await self.pool.acquire()
+        if self.ping_interval >= 0 and \
+           asyncio.get_event_loop().time() - conn.last_usage > self.ping_interval:
+            try:
+                await conn.ping(reconnect=False)
+            except Exception as e:
+                Logger().warning("Drop broken connection in pool: {}".format(e))
+                conn.close()
+                self.pool.release(conn)
+                conn = await self.pool.acquire()
+        self._record_wait(time.time() - start_time)
+        return conn
+
+    def _record_wait(self, wait_time):
+        """
+        连接池无空闲连接或需要新建连接时, 将等待次数和时间(ms)计入当前模块的运行信息
+        """
+        if wait_time < 0.001:
+            return
+        try:
+            module_name = Communicator().get_module_name()
+            Communicator().add_value("db_pool_wait", module_name, 1)
+            Communicator().add_value("db_pool_wait_time", module_name, int(wait_time * 1000))
+        except (AttributeError, KeyError):
+            # 未记录运行信息的模块(如监控模块)
+            pass
+
+
+class PooledMySQLDatabase(playhouse.shortcuts.ReconnectMixin, peewee_async.PooledMySQLDatabase):
+    """
+    异步查询使用PooledConnection连接池, 同步查询在连接断开时自动重连的peewee数据库
+    """
+
+    def init(self, database, **kwargs):
+        self.pool_recycle = kwargs.pop("pool_recycle", -1)
+        self.ping_interval = kwargs.pop("ping_interval", -1)
+        kwargs["async_conn"] = PooledConnection
+        super(PooledMySQLDatabase, self).init(database, **kwargs)
+
+    @property
+    def connect_params_async(self):
+        """
+        PooledConnection的连接参数
+        """
+        kwargs = super(PooledMySQLDatabase, self).connect_params_async
+        kwargs.update({
+            "pool_recycle": self.pool_recycle,
+            "ping_interval": self.ping_interval
+        })
+        return kwargs
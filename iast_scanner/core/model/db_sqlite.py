@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import peewee
+import asyncio
+import sqlite3
+import peewee_async
+import concurrent.futures
+
+
+class AsyncSqliteCursor(object):
+    """
+    在AsyncSqliteConnection的查询线程中执行sql的异步游标, 执行时一次性取回全部结果
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = []
+        self._index = 0
+
+    async def execute(self, operation, params=None):
+        """
+        执行sql
+        """
+        def run():
+            cursor = self.connection.conn.execute(operation, params or ())
+            try:
+                return cursor.fetchall(), cursor.description, cursor.rowcount, cursor.lastrowid
+            finally:
+                cursor.close()
+
+        self._rows, self.description, self.rowcount, self.lastrowid = await self.connection.run(run)
+        self._index = 0
+
+    async def fetchone(self):
+        if self._index >= len(self._rows):
+            return None
+        row = self._rows[self._index]
+        self._index += 1
+        return row
+
+    async def fetchall(self):
+        rows = self._rows[self._index:]
+        self._index = len(self._rows)
+        return rows
+
+    async def release(self):
+        self._rows = []
+
+
+class AsyncSqliteConnection(object):
+    """
+    sqlite异步连接, 每个进程使用一个连接, 所有异步查询在单独的线程中依次执行, 不阻塞事件循环
+    """
+
+    def __init__(self, *, database=None, loop=None, timeout=None, **kwargs):
+        self.database = database
+        self.loop = loop
+        self.timeout = timeout
+        self.pragmas = kwargs.get("pragmas", ())
+        self.conn = None
+        self.executor = None
+
+    async def run(self, func, *args):
+        """
+        在查询线程中执行func
+
+        Returns:
+            func的返回值
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    def _connect(self):
+        # isolation_level为None时每条语句自动提交
+        conn = sqlite3.connect(
+            self.database, timeout=self.timeout or 30, isolation_level=None, check_same_thread=False)
+        for key, value in self.pragmas:
+            conn.execute("PRAGMA {} = {}".format(key, value))
+        return conn
+
+    async def connect(self):
+        """
+        创建查询线程和连接
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.conn = await self.run(self._connect)
+
+    async def close(self):
+        """
+        关闭连接和查询线程
+        """
+        if self.conn is not None:
+            await self.run(self.conn.close)
+            self.conn = None
+        self.executor.shutdown(wait=False)
+
+    async def acquire(self):
+        return self.conn
+
+    def release(self, conn):
+        pass
+
+    async def cursor(self, conn=None, *args, **kwargs):
+        return AsyncSqliteCursor(self)
+
+
+class SqliteDatabase(peewee_async.AsyncDatabase, peewee.SqliteDatabase):
+    """
+    支持peewee_async异步查询的sqlite数据库, 默认开启WAL模式, 多个进程可以同时读取, 写入时等待锁释放
+    """
+
+    default_pragmas = (
+        ("journal_mode", "wal"),
+        ("synchronous", "normal"),
+        ("busy_timeout", 30000)
+    )
+
+    def init(self, database, **kwargs):
+        kwargs.setdefault("pragmas", self.default_pragmas)
+        kwargs.setdefault("timeout", 30)
+        self._async_conn_cls = AsyncSqliteConnection
+        super(SqliteDatabase, self).init(database, **kwargs)
+
+    @property
+    def connect_params_async(self):
+        """
+        AsyncSqliteConnection的连接参数
+        """
+        return {"pragmas": self._pragmas}
+
+    async def last_insert_id_async(self, cursor):
+        """
+        获取最近插入的数据id
+        """
+        return cursor.lastrowid
@@ -19,11 +19,15 @@ limitations under the License.
 
 import os
 import time
+import uuid
+import json
 import peewee
 import asyncio
 import peewee_async
 
 from core.model import base_model
+from core.model.stack_model import StackModel
+from core.model.target_stats_model import TargetStatsModel
 from core.components import common
 from core.components import exceptions
 from core.components import rasp_result
@@ -34,12 +38,19 @@ from core.components.communicator import Communicator
 
 class NewRequestModel(base_model.BaseModel):
 
+    schema_version = 2
+    support_single_table = True
+
     def __init__(self, *args, **kwargs):
         """
         初始化
         """
         super(NewRequestModel, self).__init__(*args, **kwargs)
-        self._init_start_id()
+        # 当前实例领取任务时使用的租约持有者标识, 每次领取的租约标记为 lease_owner + "-" + 领取序号
+        self.lease_owner = uuid.uuid4().hex
+        self.lease_seq = 0
+        if hasattr(self, "ResultList"):
+            TargetStatsModel.get_instance().init_target(self.host_port, self._get_stats)
 
     def _create_model(self, db, table_prefix):
         """
@@ -47,63 +58,105 @@ class NewRequestModel(base_model.BaseModel):
         """
         meta_dict = {
             "database": db,
-            "table_name": table_prefix + "_" + "ResultList"
+            "table_name": self._get_table_name(table_prefix, "ResultList")
         }
+        single_table = self._use_single_table()
 
         meta = type("Meta", (object, ), meta_dict)
         model_dict = {
             "id": peewee.AutoField(),
-            "data": self.LongTextField(),
+            "data": self.CompressedLongTextField(),
             # utf8mb4 编码下 1 char = 4 bytes，会导致peewee创建过长的列导致MariaDB产生 1071, Specified key was too long; 错误, max_length不使用255
-            "data_hash": peewee.CharField(unique=True, max_length=63),
+            "data_hash": peewee.CharField(unique=not single_table, max_length=63),
             # scan_status含义： 未扫描：0, 已扫描：1, 正在扫描：2, 扫描中出现错误: 3
             "scan_status": peewee.IntegerField(default=0),
+            # 已成功扫描该请求的插件位图, 插件对应的bit由扫描模块分配
+            "plugin_mask": peewee.BigIntegerField(default=0),
+            # 正在扫描的数据的租约持有者和租约到期时间戳, 租约到期后数据可被重新领取
+            "lease_owner": peewee.CharField(max_length=63, default=""),
+            "lease_expire": peewee.IntegerField(default=0),
             "time": peewee.IntegerField(default=common.get_timestamp),
             "Meta": meta
         }
+        if single_table:
+            model_dict["target"] = peewee.CharField(max_length=63, default=table_prefix)
         self.ResultList = type("ResultList", (peewee.Model, ), model_dict)
+        if single_table:
+            # 单表存储模式下同一扫描目标内去重
+            self._add_target_unique_index(self.ResultList, "data_hash")
         return self.ResultList
 
-    def _init_start_id(self):
+    def _get_migrations(self):
         """
-        初始化start_id为未扫描的最小id，未扫描时，值为0
-
-        Raises:
-            exceptions.DatabaseError - 数据库错误引发此异常
+        数据表升级操作
         """
-        query = self.ResultList.select(peewee.fn.MIN(self.ResultList.id)).where(
-            self.ResultList.scan_status != 1
-        )
-        try:
-            result = query.scalar()
-        except Exception as e:
-            Logger().critical("DB error in method _init_start_id!", exc_info=e)
-        if result is None:
-            self.start_id = 0
-        else:
-            self.start_id = result - 1
+        return {
+            # 记录插件进度和任务租约的列
+            1: [
+                ("add_column", "plugin_mask"),
+                ("add_column", "lease_owner"),
+                ("add_column", "lease_expire")
+            ],
+            # 按扫描状态获取、统计数据和领取租约到期任务使用的索引
+            2: [
+                ("add_index", self._get_index(("scan_status", "id"))),
+                ("add_index", self._get_index(("scan_status", "lease_expire")))
+            ]
+        }
 
     def reset_unscanned_item(self):
         """
-        重置未扫描的item的status为初始状态码(0)
+        重置扫描失败的item的status为初始状态码(0), 正在扫描的item在租约到期后自动重新领取, 不需要重置
 
         Raises:
             exceptions.DatabaseError - 数据库错误引发此异常
         """
         try:
-            self.ResultList.update(scan_status=0).where(
-                self.ResultList.scan_status > 1).execute()
+            row_count = self._target_query(self.ResultList.update(scan_status=0).where(
+                self.ResultList.scan_status == 3)).execute()
+            TargetStatsModel.get_instance().add_count_sync(self.host_port, failed=-row_count)
         except Exception as e:
             Logger().critical("DB error in method reset_unscanned_item!", exc_info=e)
 
-    def get_start_id(self):
+    def _get_stats(self):
         """
-        获取当前start_id
+        从数据表统计扫描目标的url数量, 用于初始化统计表
 
         Returns:
-            start_id, int类型
+            dict, 格式为 {"total": url总数, "scanned": 已扫描数量, "failed": 扫描失败数量, "last_time": 最近一条记录的时间戳}
         """
-        return self.start_id
+        stats = {
+            "total": 0,
+            "scanned": 0,
+            "failed": 0,
+            "last_time": 0
+        }
+        query = self._target_query(self.ResultList.select(
+            self.ResultList.scan_status, peewee.fn.COUNT(self.ResultList.id)
+        )).group_by(self.ResultList.scan_status).tuples()
+        for scan_status, count in query:
+            stats["total"] += count
+            if scan_status == 1:
+                stats["scanned"] = count
+            elif scan_status == 3:
+                stats["failed"] = count
+        last_time = self._target_query(self.ResultList.select(peewee.fn.MAX(self.ResultList.time))).scalar()
+        if last_time is not None:
+            stats["last_time"] = last_time
+        return stats
+
+    def _dump_result(self, rasp_result_ins, stacks):
+        """
+        序列化rasp_result_ins, hook调用栈替换为调用栈hash单独存储
+
+        Parameters:
+            rasp_result_ins - RaspResult实例
+            stacks - dict, 用于收集被替换的调用栈
+
+        Returns:
+            str, 序列化后的json字符串
+        """
+        return json.dumps(StackModel.strip_stack(rasp_result_ins.rasp_result_dict, stacks))
 
     async def put(self, rasp_result_ins):
         """
@@ -115,11 +168,13 @@ class NewRequestModel(base_model.BaseModel):
         Raises:
             exceptions.DatabaseError - 数据库错误引发此异常
         """
+        stacks = {}
+        data = {
+            "data": self._dump_result(rasp_result_ins, stacks),
+            "data_hash": rasp_result_ins.get_hash()
+        }
+        await StackModel.get_instance().put_stacks(stacks)
         try:
-            data = {
-                "data": rasp_result_ins.dump(),
-                "data_hash": rasp_result_ins.get_hash()
-            }
             await peewee_async.create_object(self.ResultList, **data)
         except peewee.IntegrityError as e:
             return False
@@ -128,61 +183,134 @@ class NewRequestModel(base_model.BaseModel):
         except Exception as e:
             Logger().critical("DB error in method put!", exc_info=e)
         else:
+            await TargetStatsModel.get_instance().add_count(self.host_port, total=1)
             return True
 
-    async def get_new_scan(self, count=1):
+    async def put_batch(self, rasp_result_list):
         """
-        获取多条未扫描的请求数据
+        将多个rasp_result_ins序列化, 使用一条INSERT IGNORE语句批量插入数据表
+
+        Parameters:
+            rasp_result_list - list, item为待插入的RaspResult实例
+
+        Returns:
+            int, 插入成功的条数, 其余为重复数据
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        if len(rasp_result_list) == 0:
+            return 0
+
+        rows = []
+        stacks = {}
+        for rasp_result_ins in rasp_result_list:
+            rows.append({
+                "data": self._dump_result(rasp_result_ins, stacks),
+                "data_hash": rasp_result_ins.get_hash()
+            })
+        await StackModel.get_instance().put_stacks(stacks)
+        query = self.ResultList.insert_many(rows).on_conflict_ignore()
+        try:
+            row_count = await self._execute_rowcount(query)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method put_batch!", e)
+        await TargetStatsModel.get_instance().add_count(self.host_port, total=row_count)
+        return row_count
+
+    async def get_recent_hash(self, before_id=None, count=1000):
+        """
+        按id倒序获取数据的data_hash, 用于预加载去重表
+
+        Parameters:
+            before_id - int, 只获取id小于before_id的数据, 为None时从最新的数据开始获取
+            count - int, 最大获取条数, 默认为1000
+
+        Returns:
+            list, item为tuple (数据id, data_hash), 按id倒序排列
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        query = self._target_query(self.ResultList.select(self.ResultList.id, self.ResultList.data_hash))
+        if before_id is not None:
+            query = query.where(self.ResultList.id < before_id)
+        query = query.order_by(self.ResultList.id.desc()).limit(count).tuples()
+        try:
+            return list(await peewee_async.execute(query))
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method get_recent_hash!", e)
+
+    async def get_new_scan(self, count=1, lease_time=120):
+        """
+        领取多条未扫描或租约已到期的请求数据, 使用一条UPDATE语句将其标记为扫描中并写入租约, 多个实例同时领取时不会重复
 
         Parameters:
             count - 最大获取条数，默认为1
+            lease_time - int, 租约时长(s), 默认为120
 
         Returns:
-            获取的数据组成的list,每个item为一个dict, [{id:数据id, data:请求数据的json字符串} ... ]
+            获取的数据组成的list,每个item为一个dict, [{id:数据id, data:请求数据的json字符串, plugin_mask:已完成的插件位图, size:数据大小} ... ]
 
         Raises:
             exceptions.DatabaseError - 数据库错误引发此异常
         """
         result = []
+        self.lease_seq += 1
+        lease_token = "{}-{}".format(self.lease_owner, self.lease_seq)
+        now = common.get_timestamp()
         try:
-            # 获取未扫描的最小id
-            query = self.ResultList.select(peewee.fn.MIN(self.ResultList.id)).where((
-                self.ResultList.id > self.start_id) & (
-                self.ResultList.scan_status == 0)
-            )
-            fetch_star_id = await peewee_async.scalar(query)
-            if fetch_star_id is None:
-                return []
-
-            # 将要获取的记录标记为扫描中
-            query = self.ResultList.update(
-                {self.ResultList.scan_status: 2}
-            ).where((
-                self.ResultList.scan_status == 0) & (
-                self.ResultList.id > self.start_id)
-            ).order_by(
-                self.ResultList.id
-            ).limit(count)
+            # 领取记录, 标记为扫描中
+            update_dict = {
+                self.ResultList.scan_status: 2,
+                self.ResultList.lease_owner: lease_token,
+                self.ResultList.lease_expire: now + lease_time
+            }
+            condition = (
+                self.ResultList.scan_status == 0) | ((
+                self.ResultList.scan_status == 2) & (
+                self.ResultList.lease_expire < now))
+            if self.is_sqlite():
+                # sqlite的UPDATE语句不支持ORDER BY和LIMIT, 使用子查询选取领取的记录
+                subquery = self._target_query(self.ResultList.select(self.ResultList.id)).where(
+                    condition
+                ).order_by(
+                    self.ResultList.id
+                ).limit(count)
+                query = self.ResultList.update(update_dict).where(self.ResultList.id.in_(subquery))
+            else:
+                query = self._target_query(self.ResultList.update(update_dict)).where(
+                    condition
+                ).order_by(
+                    self.ResultList.id
+                ).limit(count)
 
             row_count = await peewee_async.execute(query)
             if (row_count == 0):
                 return result
 
-            # 获取标记的记录
-            query = self.ResultList.select().where((
-                self.ResultList.id >= fetch_star_id) & (
-                self.ResultList.scan_status == 2)
+            # 获取本次领取的记录, scan_status条件使查询使用(scan_status, id)索引, 只扫描正在扫描的记录
+            query = self._target_query(self.ResultList.select()).where((
+                self.ResultList.scan_status == 2) & (
+                self.ResultList.lease_owner == lease_token)
             ).order_by(
                 self.ResultList.id
-            ).limit(row_count)
+            )
 
             data = await peewee_async.execute(query)
 
             for line in data:
                 result.append({
                     "id": line.id,
-                    "data": rasp_result.RaspResult(line.data)
+                    "data": rasp_result.RaspResult(line.data),
+                    "plugin_mask": line.plugin_mask,
+                    "size": len(line.data)
                 })
+            await StackModel.get_instance().restore_stack([item["data"].rasp_result_dict for item in result])
             return result
 
         except asyncio.CancelledError as e:
@@ -190,50 +318,87 @@ class NewRequestModel(base_model.BaseModel):
         except Exception as e:
             self._handle_exception("DB error in method get_new_scan!", e)
 
-    async def mark_result(self, last_id, failed_list):
+    async def renew_lease(self, id_list, lease_time=120):
         """
-        将id 小于等于 last_id的result标记为已扫描，更新star_id, 将failed_list中的id标记为失败
+        延长当前实例领取的记录的租约
 
         Parameters:
-            last_id - 已扫描的最大id
-            failed_list - 扫描中出现连接失败的url
+            id_list - list, 需要延长租约的记录id
+            lease_time - int, 从当前时间起的租约时长(s), 默认为120
 
         Raises:
             exceptions.DatabaseError - 数据库错误引发此异常
         """
-        if last_id > self.start_id:
-            try:
-
-                # 标记失败的扫描记录
-                query = self.ResultList.update({self.ResultList.scan_status: 3}).where((
-                    self.ResultList.id <= last_id) & (
-                    self.ResultList.id > self.start_id) & (
-                    self.ResultList.id << failed_list)
+        expire = common.get_timestamp() + lease_time
+        try:
+            for index in range(0, len(id_list), 1000):
+                query = self._target_query(self.ResultList.update(
+                    {self.ResultList.lease_expire: expire}
+                )).where((
+                    self.ResultList.id << id_list[index:index + 1000]) & (
+                    self.ResultList.scan_status == 2) & (
+                    self._own_lease())
                 )
                 await peewee_async.execute(query)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method renew_lease!", e)
 
-                # 标记已扫描的记录
-                query = self.ResultList.update({self.ResultList.scan_status: 1}).where((
-                    self.ResultList.id <= last_id) & (
-                    self.ResultList.id > self.start_id) & (
-                    self.ResultList.scan_status == 2)
-                )
-                await peewee_async.execute(query)
+    def _own_lease(self):
+        """
+        Returns:
+            peewee表达式, 匹配当前实例持有租约的记录
+        """
+        return self.ResultList.lease_owner.startswith(self.lease_owner + "-")
 
-                # 更新start_id
-                query = self.ResultList.select(peewee.fn.MAX(self.ResultList.id)).where((
-                    self.ResultList.id > self.start_id) & (
-                    self.ResultList.scan_status == 1)
-                )
+    async def mark_result(self, finished_list, failed_list, plugin_progress=None):
+        """
+        记录各插件的扫描进度, 将当前实例领取的finished_list中的id标记为已扫描, 其中failed_list中的id标记为失败
+
+        Parameters:
+            finished_list - list, 所有插件均已扫描完成的任务id
+            failed_list - list, 扫描中出现连接失败的任务id, 应为finished_list的子集
+            plugin_progress - dict, key为插件bit, value为该插件成功完成的任务id list, 默认为None
 
-                result = await peewee_async.scalar(query)
-            except asyncio.CancelledError as e:
-                raise e
-            except Exception as e:
-                self._handle_exception("DB error in method mark_result!", e)
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        try:
+            # 记录插件进度, 扫描模块重启后已完成的插件不再重复扫描
+            if plugin_progress is not None:
+                for plugin_bit, id_list in plugin_progress.items():
+                    query = self._target_query(self.ResultList.update(
+                        {self.ResultList.plugin_mask: self.ResultList.plugin_mask.bin_or(plugin_bit)}
+                    )).where(self.ResultList.id << id_list)
+                    await peewee_async.execute(query)
+
+            if len(finished_list) == 0:
+                return
+
+            # 标记失败的扫描记录
+            failed_count = 0
+            if len(failed_list) > 0:
+                query = self._target_query(self.ResultList.update({self.ResultList.scan_status: 3})).where((
+                    self.ResultList.id << failed_list) & (
+                    self.ResultList.scan_status == 2) & (
+                    self._own_lease())
+                )
+                failed_count = await peewee_async.execute(query)
 
-            if result is not None:
-                self.start_id = result
+            # 标记已扫描的记录, 租约到期已被其他实例领取的记录不做标记
+            query = self._target_query(self.ResultList.update({self.ResultList.scan_status: 1})).where((
+                self.ResultList.id << finished_list) & (
+                self.ResultList.scan_status == 2) & (
+                self._own_lease())
+            )
+            scanned_count = await peewee_async.execute(query)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method mark_result!", e)
+        await TargetStatsModel.get_instance().add_count(
+            self.host_port, scanned=scanned_count, failed=failed_count)
 
     async def get_scan_count(self):
         """
@@ -246,8 +411,8 @@ class NewRequestModel(base_model.BaseModel):
             exceptions.DatabaseError - 数据库错误引发此异常
         """
         try:
-            query = self.ResultList.select(
-                peewee.fn.COUNT(self.ResultList.id)).where(
+            query = self._target_query(self.ResultList.select(
+                peewee.fn.COUNT(self.ResultList.id))).where(
                 self.ResultList.scan_status == 1)
 
             result = await peewee_async.scalar(query)
@@ -256,8 +421,8 @@ class NewRequestModel(base_model.BaseModel):
             else:
                 scanned = result
 
-            query = self.ResultList.select(
-                peewee.fn.COUNT(self.ResultList.id)).where(
+            query = self._target_query(self.ResultList.select(
+                peewee.fn.COUNT(self.ResultList.id))).where(
                 self.ResultList.scan_status == 3)
 
             result = await peewee_async.scalar(query)
@@ -266,8 +431,8 @@ class NewRequestModel(base_model.BaseModel):
             else:
                 failed = result
 
-            query = self.ResultList.select(
-                peewee.fn.COUNT(self.ResultList.id))
+            query = self._target_query(self.ResultList.select(
+                peewee.fn.COUNT(self.ResultList.id)))
 
             result = await peewee_async.scalar(query)
             if result is None:
@@ -291,7 +456,7 @@ class NewRequestModel(base_model.BaseModel):
         Raises:
             exceptions.DatabaseError - 数据库错误引发此异常
         """
-        query = self.ResultList.select().order_by(self.ResultList.time.desc()).limit(1)
+        query = self._target_query(self.ResultList.select()).order_by(self.ResultList.time.desc()).limit(1)
 
         try:
             result = await peewee_async.execute(query)
@@ -323,8 +488,8 @@ class NewRequestModel(base_model.BaseModel):
         if page <= 0:
             page = 1
         try:
-            query = self.ResultList.select(
-                peewee.fn.COUNT(self.ResultList.id)).where(
+            query = self._target_query(self.ResultList.select(
+                peewee.fn.COUNT(self.ResultList.id))).where(
                 self.ResultList.scan_status == status)
 
             result = await peewee_async.scalar(query)
@@ -333,7 +498,7 @@ class NewRequestModel(base_model.BaseModel):
             else:
                 total = result
 
-            query = self.ResultList.select().where(
+            query = self._target_query(self.ResultList.select()).where(
                 self.ResultList.scan_status == status
             ).order_by(
                 self.ResultList.id
@@ -354,9 +519,17 @@ class NewRequestModel(base_model.BaseModel):
         except Exception as e:
             self._handle_exception("DB error in method get_urls!", e)
 
+    def truncate_table(self):
+        """
+        清空表时清零扫描目标的统计数据
+        """
+        super().truncate_table()
+        TargetStatsModel.get_instance().reset_target(self.host_port)
+
     def drop_table(self):
         """
-        删除表时更新表状态
+        删除表时更新表状态, 删除扫描目标的统计数据
         """
         super().drop_table()
+        TargetStatsModel.get_instance().delete_target(self.host_port)
         Communicator().update_target_list_status()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import peewee
+
+from core.model import base_model
+
+
+class PluginBitModel(base_model.BaseModel):
+    """
+    扫描插件在扫描进度位图(ResultList.plugin_mask)中的bit分配表, 所有扫描目标共用,
+    bit一经分配不再改变或复用, 插件增删或改名不影响已记录的扫描进度
+    """
+
+    # plugin_mask为有符号64位整数, 可分配的bit数量
+    max_bit = 63
+
+    def _create_model(self, db, table_prefix):
+        """
+        创建数据model
+        """
+        meta_dict = {
+            "database": db,
+            "table_name": "PluginBit"
+        }
+        meta = type("Meta", (object, ), meta_dict)
+        model_dict = {
+            "plugin_name": peewee.CharField(primary_key=True, max_length=63),
+            "bit": peewee.IntegerField(unique=True),
+            "Meta": meta
+        }
+        self.PluginBit = type("PluginBit", (peewee.Model, ), model_dict)
+        return self.PluginBit
+
+    def get_plugin_bit(self, plugin_name_list):
+        """
+        获取插件对应的bit序号, 未分配的插件按插件名排序依次分配最小的空闲bit
+
+        Parameters:
+            plugin_name_list - list, item为插件名
+
+        Returns:
+            dict, key为插件名, value为bit序号, 无空闲bit的插件不包含在内
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        try:
+            while True:
+                plugin_bit = {line.plugin_name: line.bit for line in self.PluginBit.select()}
+                missing_list = [name for name in sorted(plugin_name_list) if name not in plugin_bit]
+                used_bit = set(plugin_bit.values())
+                free_bit = [bit for bit in range(self.max_bit) if bit not in used_bit]
+                rows = [{"plugin_name": name, "bit": bit} for name, bit in zip(missing_list, free_bit)]
+                if len(rows) == 0:
+                    break
+                try:
+                    self.PluginBit.insert_many(rows).execute()
+                except peewee.IntegrityError:
+                    # 其他扫描模块同时分配了bit, 重新读取
+                    continue
+        except Exception as e:
+            self._handle_exception("DB error in method get_plugin_bit!", e)
+        return {name: plugin_bit[name] for name in plugin_name_list if name in plugin_bit}
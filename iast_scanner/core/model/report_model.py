@@ -18,12 +18,14 @@ limitations under the License.
 """
 
 import os
+import re
 import json
 import peewee
 import asyncio
 import peewee_async
 
 from core.model import base_model
+from core.model.stack_model import StackModel
 from core.components import common
 from core.components import exceptions
 from core.components import rasp_result
@@ -33,33 +35,50 @@ from core.components.config import Config
 
 class ReportModel(base_model.BaseModel):
 
+    schema_version = 1
+    support_single_table = True
+
     def __init__(self, *args, **kwargs):
         """
         初始化
         """
         super(ReportModel, self).__init__(*args, **kwargs)
 
+    def _get_migrations(self):
+        """
+        数据表升级操作
+        """
+        return {
+            # 获取未上传报告使用的索引
+            1: [("add_index", self._get_index(("upload", "id")))]
+        }
+
     def _create_model(self, db, table_prefix):
         """
         创建数据model
         """
         meta_dict = {
             "database": db,
-            "table_name": table_prefix + "_" + "Report"
+            "table_name": self._get_table_name(table_prefix, "Report")
         }
+        single_table = self._use_single_table()
         meta = type("Meta", (object, ), meta_dict)
         model_dict = {
             "id": peewee.AutoField(),
             "plugin_name": peewee.CharField(max_length=63),
             "description": peewee.TextField(),
-            "rasp_result_list": self.LongTextField(),
-            "payload_seq": peewee.CharField(unique=True, max_length=63),
+            "rasp_result_list": self.CompressedLongTextField(),
+            "payload_seq": peewee.CharField(unique=not single_table, max_length=63),
             "message": peewee.TextField(),
             "time": peewee.IntegerField(default=common.get_timestamp),
             "upload": peewee.IntegerField(default=0),
             "Meta": meta
         }
+        if single_table:
+            model_dict["target"] = peewee.CharField(max_length=63, default=table_prefix)
         self.Report = type("Report", (peewee.Model, ), model_dict)
+        if single_table:
+            self._add_target_unique_index(self.Report, "payload_seq")
         return self.Report
 
     async def put(self, request_data_list, plugin_name, description, message):
@@ -79,9 +98,11 @@ class ReportModel(base_model.BaseModel):
         """
         try:
             rasp_result_json_list = []
+            stacks = {}
             for request_data in request_data_list:
-                rasp_result_json_list.append(json.loads(
-                    request_data.get_rasp_result().dump()))
+                rasp_result_json_list.append(StackModel.strip_stack(
+                    request_data.get_rasp_result().rasp_result_dict, stacks))
+            await StackModel.get_instance().put_stacks(stacks)
             payload_seq = request_data_list[0].get_payload_info()["seq"]
             data = {
                 "plugin_name": plugin_name,
@@ -121,12 +142,15 @@ class ReportModel(base_model.BaseModel):
         result = {}
 
         try:
-            query = self.Report.select().offset((page - 1) * perpage).limit(perpage)
+            query = self._target_query(self.Report.select()).offset((page - 1) * perpage).limit(perpage)
             data = await peewee_async.execute(query)
             result["total"] = len(data)
             result["data"] = []
-            for line in data:
-                result["data"].append(line.rasp_result_list)
+            rasp_result_json_lists = [json.loads(line.rasp_result_list) for line in data]
+            await StackModel.get_instance().restore_stack(
+                [item for json_list in rasp_result_json_lists for item in json_list])
+            for json_list in rasp_result_json_lists:
+                result["data"].append(json.dumps(json_list))
             return result
 
         except asyncio.CancelledError as e:
@@ -160,15 +184,18 @@ class ReportModel(base_model.BaseModel):
         result = []
 
         try:
-            query = self.Report.select().where(self.Report.upload != 1).limit(count)
-            data = query.execute()
+            query = self._target_query(self.Report.select()).where(self.Report.upload != 1).limit(count)
+            data = list(query.execute())
+            rasp_result_json_lists = [json.loads(line.rasp_result_list) for line in data]
+            StackModel.get_instance().restore_stack_sync(
+                [item for json_list in rasp_result_json_lists for item in json_list])
 
-            for line in data:
+            for line, json_list in zip(data, rasp_result_json_lists):
                 result.append(
                     (
                         line.plugin_name,
                         line.description,
-                        line.rasp_result_list,
+                        json.dumps(json_list),
                         line.message,
                         line.time
                     )
@@ -193,9 +220,37 @@ class ReportModel(base_model.BaseModel):
             count = 20
 
         try:
-            query = self.Report.update({self.Report.upload: 1}).where(
-                self.Report.upload != 1).limit(count)
+            if self.is_sqlite():
+                # sqlite的UPDATE语句不支持LIMIT, 使用子查询选取标记的记录
+                subquery = self._target_query(self.Report.select(self.Report.id)).where(
+                    self.Report.upload != 1).limit(count)
+                query = self.Report.update({self.Report.upload: 1}).where(self.Report.id.in_(subquery))
+            else:
+                query = self._target_query(self.Report.update({self.Report.upload: 1})).where(
+                    self.Report.upload != 1).limit(count)
             query.execute()
 
         except Exception as e:
             self._handle_exception("DB error in method mark_report!", e)
+
+    def get_upload_targets(self):
+        """
+        单表存储模式下获取存在未上传报警数据的扫描目标
+
+        Returns:
+            list, item为扫描目标的host_port
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        result = []
+        try:
+            for table_name in self.get_tables():
+                if re.fullmatch(r"Report_\d+", table_name) is None:
+                    continue
+                cursor = self.database.execute_sql(
+                    "SELECT DISTINCT target FROM `{}` WHERE upload != 1".format(table_name))
+                result.extend([line[0] for line in cursor.fetchall()])
+        except Exception as e:
+            self._handle_exception("DB error in method get_upload_targets!", e)
+        return result
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import lru
+import json
+import peewee
+import asyncio
+import peewee_async
+
+from core.model import base_model
+from core.components import rasp_result
+from core.components.logger import Logger
+from core.components.config import Config
+
+
+class StackModel(base_model.BaseModel):
+    """
+    所有扫描目标共用的hook调用栈存储表, 以调用栈hash为key
+
+    存储请求数据时, hook_info中的stack替换为调用栈hash(stack_ref), 读取时还原,
+    进程内缓存已读写的调用栈, 还原后相同的调用栈共用同一个list对象
+    """
+
+    stack_cache = None
+
+    def __init__(self, *args, **kwargs):
+        """
+        初始化
+        """
+        super(StackModel, self).__init__(*args, **kwargs)
+        if StackModel.stack_cache is None:
+            StackModel.stack_cache = lru.LRU(Config().get_config("database.stack_cache_size"))
+
+    def _create_model(self, db, table_prefix):
+        """
+        创建数据model
+        """
+        meta_dict = {
+            "database": db,
+            "table_name": "StackTrace"
+        }
+        meta = type("Meta", (object, ), meta_dict)
+        model_dict = {
+            "stack_hash": peewee.CharField(primary_key=True, max_length=63),
+            "stack": self.LongTextField(),
+            "Meta": meta
+        }
+        self.StackTrace = type("StackTrace", (peewee.Model, ), model_dict)
+        return self.StackTrace
+
+    @staticmethod
+    def _strip_hook(hook_item, stacks):
+        """
+        获取将stack替换为stack_ref的hook_item浅拷贝
+
+        Parameters:
+            hook_item - dict, hook_info中的item
+            stacks - dict, 用于收集被替换的调用栈, key为调用栈hash, value为调用栈list
+
+        Returns:
+            dict
+        """
+        if not isinstance(hook_item.get("stack"), list):
+            return hook_item
+        stack_hash = rasp_result.RaspResult.get_stack_hash(hook_item["stack"])
+        stacks[stack_hash] = hook_item["stack"]
+        hook_item = dict(hook_item)
+        del hook_item["stack"]
+        hook_item["stack_ref"] = stack_hash
+        return hook_item
+
+    @staticmethod
+    def strip_stack(rasp_result_dict, stacks):
+        """
+        获取hook_info和vuln_hook中的调用栈替换为stack_ref的请求数据, 不修改原数据
+
+        Parameters:
+            rasp_result_dict - dict, RaspResult中的请求数据
+            stacks - dict, 用于收集被替换的调用栈, key为调用栈hash, value为调用栈list
+
+        Returns:
+            dict, 替换后的请求数据
+        """
+        rasp_result_dict = dict(rasp_result_dict)
+        rasp_result_dict["hook_info"] = [StackModel._strip_hook(
+            item, stacks) for item in rasp_result_dict["hook_info"]]
+        if "vuln_hook" in rasp_result_dict:
+            vuln_hook = dict(rasp_result_dict["vuln_hook"])
+            vuln_hook["hook_info"] = StackModel._strip_hook(vuln_hook["hook_info"], stacks)
+            rasp_result_dict["vuln_hook"] = vuln_hook
+        return rasp_result_dict
+
+    @staticmethod
+    def _iter_stack_hook(rasp_result_dict):
+        """
+        遍历请求数据中包含stack_ref的hook_item
+        """
+        hook_list = list(rasp_result_dict.get("hook_info", []))
+        if "vuln_hook" in rasp_result_dict:
+            hook_list.append(rasp_result_dict["vuln_hook"]["hook_info"])
+        for hook_item in hook_list:
+            if "stack_ref" in hook_item:
+                yield hook_item
+
+    def _get_missing_hash(self, rasp_result_dict_list):
+        """
+        获取缓存中不存在的调用栈hash
+        """
+        missing_hash = set()
+        for rasp_result_dict in rasp_result_dict_list:
+            for hook_item in self._iter_stack_hook(rasp_result_dict):
+                if hook_item["stack_ref"] not in self.stack_cache:
+                    missing_hash.add(hook_item["stack_ref"])
+        return list(missing_hash)
+
+    def _restore_from_cache(self, rasp_result_dict_list):
+        """
+        使用缓存中的调用栈还原hook_item中的stack, 不存在的调用栈还原为空list
+        """
+        for rasp_result_dict in rasp_result_dict_list:
+            for hook_item in self._iter_stack_hook(rasp_result_dict):
+                stack_hash = hook_item.pop("stack_ref")
+                try:
+                    hook_item["stack"] = self.stack_cache[stack_hash]
+                except KeyError:
+                    Logger().warning("Stack trace with hash {} not found!".format(stack_hash))
+                    hook_item["stack"] = []
+
+    def _select_stack(self, hash_list):
+        """
+        获取查询调用栈的peewee查询, hash_list过长时分批查询
+        """
+        for index in range(0, len(hash_list), 1000):
+            yield self.StackTrace.select().where(
+                self.StackTrace.stack_hash << hash_list[index:index + 1000])
+
+    async def put_stacks(self, stacks):
+        """
+        存储调用栈, 已存在的调用栈忽略
+
+        Parameters:
+            stacks - dict, key为调用栈hash, value为调用栈list
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        rows = []
+        for stack_hash, stack in stacks.items():
+            if stack_hash not in self.stack_cache:
+                rows.append({"stack_hash": stack_hash, "stack": json.dumps(stack)})
+        if len(rows) == 0:
+            return
+
+        try:
+            for index in range(0, len(rows), 1000):
+                query = self.StackTrace.insert_many(rows[index:index + 1000]).on_conflict_ignore()
+                await peewee_async.execute(query)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method put_stacks!", e)
+
+        for row in rows:
+            self.stack_cache[row["stack_hash"]] = stacks[row["stack_hash"]]
+
+    async def restore_stack(self, rasp_result_dict_list):
+        """
+        还原多个请求数据中的调用栈, 直接修改传入的请求数据
+
+        Parameters:
+            rasp_result_dict_list - list, item为RaspResult中的请求数据
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        missing_hash = self._get_missing_hash(rasp_result_dict_list)
+        try:
+            for query in self._select_stack(missing_hash):
+                for line in await peewee_async.execute(query):
+                    self.stack_cache[line.stack_hash] = json.loads(line.stack)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method restore_stack!", e)
+        self._restore_from_cache(rasp_result_dict_list)
+
+    def restore_stack_sync(self, rasp_result_dict_list):
+        """
+        restore_stack的同步版本, 用于同步查询的方法
+
+        Parameters:
+            rasp_result_dict_list - list, item为RaspResult中的请求数据
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        missing_hash = self._get_missing_hash(rasp_result_dict_list)
+        try:
+            for query in self._select_stack(missing_hash):
+                for line in query.execute():
+                    self.stack_cache[line.stack_hash] = json.loads(line.stack)
+        except Exception as e:
+            self._handle_exception("DB error in method restore_stack_sync!", e)
+        self._restore_from_cache(rasp_result_dict_list)
+
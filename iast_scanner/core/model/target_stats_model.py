@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import peewee
+import asyncio
+import peewee_async
+
+from core.model import base_model
+from core.components import common
+from core.components.communicator import Communicator
+
+
+class TargetStatsModel(base_model.BaseModel):
+    """
+    各扫描目标的url数量统计表, 由NewRequestModel在写入和标记数据时增量更新,
+    console获取扫描进度时只读取此表, 不查询各目标的数据表
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        初始化
+        """
+        super(TargetStatsModel, self).__init__(*args, **kwargs)
+        # 当前进程中已确认存在统计数据的扫描目标
+        self.inited_targets = set()
+
+    def _create_model(self, db, table_prefix):
+        """
+        创建数据model
+        """
+        meta_dict = {
+            "database": db,
+            "table_name": "TargetStats"
+        }
+        meta = type("Meta", (object, ), meta_dict)
+        model_dict = {
+            "host_port": peewee.CharField(primary_key=True, max_length=63),
+            "total": peewee.BigIntegerField(default=0),
+            "scanned": peewee.BigIntegerField(default=0),
+            "failed": peewee.BigIntegerField(default=0),
+            "last_time": peewee.IntegerField(default=0),
+            "Meta": meta
+        }
+        self.TargetStats = type("TargetStats", (peewee.Model, ), model_dict)
+        return self.TargetStats
+
+    def init_target(self, host_port, get_stats):
+        """
+        扫描目标不存在统计数据时, 从目标的数据表统计并写入, 用于新建的目标和旧版本创建的目标
+
+        Parameters:
+            host_port - str, 扫描目标的 host + "_" + str(port)
+            get_stats - callable, 返回从数据表统计的dict, 格式为 {"total": int, "scanned": int, "failed": int, "last_time": int}
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        if host_port in self.inited_targets:
+            return
+        try:
+            if self.TargetStats.get_or_none(self.TargetStats.host_port == host_port) is None:
+                stats = get_stats()
+                stats["host_port"] = host_port
+                self.TargetStats.insert(stats).on_conflict_ignore().execute()
+                # 单表存储模式下扫描目标列表从统计表获取
+                Communicator().update_target_list_status()
+        except Exception as e:
+            self._handle_exception("DB error in method init_target!", e)
+        self.inited_targets.add(host_port)
+
+    async def add_count(self, host_port, total=0, scanned=0, failed=0):
+        """
+        增量更新扫描目标的统计数据, total增加时同时更新last_time, 统计数据不存在(如数据表被其他进程删除后重建)时以增量值新建
+
+        Parameters:
+            host_port - str, 扫描目标的 host + "_" + str(port)
+            total - int, url总数的增量
+            scanned - int, 已扫描url数量的增量
+            failed - int, 扫描失败url数量的增量
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        if total == 0 and scanned == 0 and failed == 0:
+            return
+        update_query, insert_query = self._get_count_query(host_port, total, scanned, failed)
+        try:
+            row_count = await peewee_async.execute(update_query)
+            if row_count == 0:
+                await peewee_async.execute(insert_query)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            self._handle_exception("DB error in method add_count!", e)
+
+    def add_count_sync(self, host_port, total=0, scanned=0, failed=0):
+        """
+        add_count的同步版本, 用于同步查询的方法
+
+        Parameters:
+            host_port - str, 扫描目标的 host + "_" + str(port)
+            total - int, url总数的增量
+            scanned - int, 已扫描url数量的增量
+            failed - int, 扫描失败url数量的增量
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        if total == 0 and scanned == 0 and failed == 0:
+            return
+        update_query, insert_query = self._get_count_query(host_port, total, scanned, failed)
+        try:
+            if update_query.execute() == 0:
+                insert_query.execute()
+        except Exception as e:
+            self._handle_exception("DB error in method add_count_sync!", e)
+
+    def _get_count_query(self, host_port, total, scanned, failed):
+        """
+        获取增量更新统计数据的UPDATE查询, 及统计数据不存在时使用的INSERT查询
+        """
+        last_time = common.get_timestamp() if total > 0 else 0
+        update_dict = {
+            self.TargetStats.total: self.TargetStats.total + total,
+            self.TargetStats.scanned: self.TargetStats.scanned + scanned,
+            self.TargetStats.failed: self.TargetStats.failed + failed
+        }
+        if total > 0:
+            update_dict[self.TargetStats.last_time] = last_time
+        update_query = self.TargetStats.update(update_dict).where(self.TargetStats.host_port == host_port)
+        insert_query = self.TargetStats.insert({
+            "host_port": host_port,
+            "total": max(total, 0),
+            "scanned": max(scanned, 0),
+            "failed": max(failed, 0),
+            "last_time": last_time
+        }).on_conflict_ignore()
+        return update_query, insert_query
+
+    def get_targets(self):
+        """
+        获取统计表中的所有扫描目标
+
+        Returns:
+            list, item为扫描目标的host_port
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        try:
+            query = self.TargetStats.select(self.TargetStats.host_port).order_by(self.TargetStats.host_port)
+            return [line.host_port for line in query]
+        except Exception as e:
+            self._handle_exception("DB error in method get_targets!", e)
+
+    def reset_target(self, host_port):
+        """
+        清零扫描目标的统计数据, 扫描目标的数据表被清空时调用
+
+        Parameters:
+            host_port - str, 扫描目标的 host + "_" + str(port)
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        try:
+            self.TargetStats.update(total=0, scanned=0, failed=0, last_time=0).where(
+                self.TargetStats.host_port == host_port).execute()
+        except Exception as e:
+            self._handle_exception("DB error in method reset_target!", e)
+
+    def delete_target(self, host_port):
+        """
+        删除扫描目标的统计数据, 扫描目标的数据表被删除时调用
+
+        Parameters:
+            host_port - str, 扫描目标的 host + "_" + str(port)
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        try:
+            self.TargetStats.delete().where(self.TargetStats.host_port == host_port).execute()
+        except Exception as e:
+            self._handle_exception("DB error in method delete_target!", e)
+        self.inited_targets.discard(host_port)
@@ -25,6 +25,7 @@ import shutil
 import threading
 
 from core.modules import base
+from core.modules.preprocessor import Preprocessor
 from core.components import common
 from core.components.logger import Logger
 from core.components.config import Config
@@ -304,8 +305,10 @@ class Monitor(base.BaseModule):
 
     def _terminate_modules(self):
         """
-        结束其他所有模块
+        结束其他所有模块, preprocessor的http服务进程先写入缓冲区中的新请求再退出
         """
+        Preprocessor.stop_http_server(Config().get_config("preprocessor.exit_timeout"))
+
         all_procs = []
         scanner_num = Config().get_config("scanner.max_module_instance")
 
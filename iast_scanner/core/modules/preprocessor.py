@@ -18,20 +18,27 @@ limitations under the License.
 """
 
 import os
-import lru
 import sys
+import gzip
+import json
 import zlib
 import time
+import signal
+import psutil
+import hashlib
 import asyncio
 import logging
 import aiohttp
 import tornado.web
 import tornado.ioloop
+import tornado.process
 import tornado.httpserver
 import multiprocessing
 
 from core.modules import base
+from core.model import base_model
 from core.model import new_request_model
+from core.model import target_stats_model
 from core.components import exceptions
 from core.components import rasp_result
 from core.components.logger import Logger
@@ -56,7 +63,11 @@ class Preprocessor(base.BaseModule):
         except Exception as e:
             Logger().warning("Dedupulicate plugin {} init fail!".format(plugin_name), exc_info=e)
 
-        self.dedup_lru = DedupLru(Config().get_config("preprocessor.request_lru_size"))
+        # 去重表需要在http server fork子进程前创建, 以便各子进程共享
+        self.dedup_lru = DedupIndex(
+            Config().get_config("preprocessor.dedup_partition_num"),
+            Config().get_config("preprocessor.request_lru_size")
+        )
         self.new_request_storage = ResultStorage(self.dedup_lru)
         self.app = tornado.web.Application([
             tornado.web.url(
@@ -74,16 +85,16 @@ class Preprocessor(base.BaseModule):
         """
         启动http server
         """
-        server = tornado.httpserver.HTTPServer(
+        self.server = tornado.httpserver.HTTPServer(
             self.app, max_buffer_size=Config().get_config("preprocessor.max_buffer_size"))
         try:
-            server.bind(Config().get_config("preprocessor.http_port"))
+            self.server.bind(Config().get_config("preprocessor.http_port"))
         except OSError as e:
             Logger().critical("Preprocessor bind port error!", exc_info=e)
             sys.exit(1)
         else:
             # 这里会创建多个子进程，需要重新初始化Communicator
-            server.start(Config().get_config("preprocessor.process_num"))
+            self.server.start(Config().get_config("preprocessor.process_num"))
             Communicator().init_new_module(type(self).__name__)
             # 记录pid
             while True:
@@ -93,8 +104,62 @@ class Preprocessor(base.BaseModule):
                     pids = ", ".join(str(x) for x in Communicator().get_pre_http_pid())
                     Logger().error("Preprocessor HTTP Server set pid failed! Running pids: {}".format(pids))
                     time.sleep(3)
+            self.new_request_storage.start_flush()
+            signal.signal(signal.SIGTERM, self._exit)
+            # 去重表由各子进程共享, 仅由第一个子进程在启动时预加载
+            if tornado.process.task_id() in (None, 0):
+                tornado.ioloop.IOLoop.current().spawn_callback(
+                    self.new_request_storage.preload_all)
             tornado.ioloop.IOLoop.current().start()
 
+    def _exit(self, signum, frame):
+        """
+        收到SIGTERM时, 将缓冲区中的新请求写入数据库后停止IOLoop
+        """
+        tornado.ioloop.IOLoop.current().add_callback_from_signal(self._shutdown)
+
+    async def _shutdown(self):
+        """
+        停止接收新请求, 写入缓冲区中的全部新请求, 停止IOLoop
+        """
+        self.server.stop()
+        try:
+            await self.new_request_storage.flush_all()
+            # 写入失败的数据按重试次数重试, 直到写入成功或被丢弃
+            while len(self.new_request_storage.pending) > 0:
+                await asyncio.sleep(self.new_request_storage.flush_interval)
+                await self.new_request_storage.flush_all()
+        except Exception as e:
+            Logger().error("Flush new request failed when preprocessor exit!", exc_info=e)
+        tornado.ioloop.IOLoop.current().stop()
+
+    @staticmethod
+    def stop_http_server(timeout):
+        """
+        停止所有http服务进程, 先发送SIGTERM使其写入缓冲区中的新请求, 超时未退出的进程发送SIGKILL
+
+        Parameters:
+            timeout - int, 等待http服务进程退出的最长时间(s)
+        """
+        procs = []
+        for pid in Communicator().get_pre_http_pid():
+            if pid == 0:
+                continue
+            try:
+                proc = psutil.Process(pid)
+                proc.send_signal(signal.SIGTERM)
+            except psutil.Error:
+                continue
+            procs.append(proc)
+
+        gone, alive = psutil.wait_procs(procs, timeout=timeout)
+        for proc in alive:
+            Logger().warning("Preprocessor HTTP Server {} exit timeout, kill it!".format(proc.pid))
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+
 
 class jsonHandler(tornado.web.RequestHandler):
     """
@@ -122,27 +187,35 @@ class jsonHandler(tornado.web.RequestHandler):
     async def post(self):
         """
         处理POST请求
+
+        请求body可以是单条rasp_result json, 也可以是json数组或换行分隔的json(Content-Type为application/x-ndjson),
+        批量提交时逐条处理, 响应中的results按顺序给出每条数据的处理结果
         """
         try:
             data = self.request.body
-            headers = self.request.headers
             content_type = self.request.headers.get("Content-Type", "None")
-            if not content_type.startswith("application/json"):
+            if not content_type.startswith(("application/json", "application/x-ndjson")):
                 raise exceptions.ContentTypeInvalid
             content_encoding = self.request.headers.get("Content-Encoding", "None")
-            if content_encoding == "deflate":
+            if content_encoding in ("deflate", "gzip"):
                 try:
-                    data = zlib.decompress(data)
+                    if content_encoding == "deflate":
+                        data = zlib.decompress(data)
+                    else:
+                        data = gzip.decompress(data)
                 except Exception as e:
-                    Logger().warning("Deflated data decode error!", exc_info=e)
+                    Logger().warning("Compressed data decode error!", exc_info=e)
                     raise exceptions.ContentTypeInvalid
-            rasp_result_ins = rasp_result.RaspResult(data)
-            Logger().info("Received request data: " + str(rasp_result_ins))
-            if rasp_result_ins.is_scan_result():
-                self.send_data(rasp_result_ins)
+
+            data_list = self.split_batch(data, content_type)
+            if data_list is None:
+                await self.process_data(data)
+                self.write('{"status": 0, "msg":"ok"}\n')
             else:
-                await self.dedup_data(rasp_result_ins)
-            self.write('{"status": 0, "msg":"ok"}\n')
+                results = []
+                for item in data_list:
+                    results.append(await self.process_batch_item(item))
+                self.write(json.dumps({"status": 0, "msg": "ok", "results": results}) + "\n")
         except exceptions.OriExpectedException as e:
             self.write('{"status": 1, "msg":"data invalid"}\n')
             Communicator().increase_value("invalid_data")
@@ -153,6 +226,79 @@ class jsonHandler(tornado.web.RequestHandler):
             self.send_error(500)
         return
 
+    def split_batch(self, data, content_type):
+        """
+        拆分批量提交的数据
+
+        Parameters:
+            data - bytes, 解压后的请求body
+            content_type - str, 请求的Content-Type
+
+        Returns:
+            list, item为单条rasp_result的json bytes或dict, 非批量提交时返回None
+
+        Raises:
+            exceptions.ResultJsonError - json数组解析失败引发此异常
+        """
+        if content_type.startswith("application/x-ndjson"):
+            return [line for line in data.split(b"\n") if line.strip() != b""]
+        elif data.lstrip()[:1] == b"[":
+            try:
+                data_list = json.loads(data)
+            except (UnicodeDecodeError, ValueError) as e:
+                Logger().warning("Batch data is not a valid json array!", exc_info=e)
+                raise exceptions.ResultJsonError
+            return data_list
+        else:
+            return None
+
+    async def process_batch_item(self, data):
+        """
+        处理批量提交中的一条数据
+
+        Parameters:
+            data - 单条rasp_result的json bytes或dict
+
+        Returns:
+            dict, 该条数据的处理结果, 格式同单条提交时的响应
+        """
+        try:
+            await self.process_data(data)
+            return {"status": 0, "msg": "ok"}
+        except exceptions.OriExpectedException as e:
+            Communicator().increase_value("invalid_data")
+            Logger().warning("Invalid data: {} posted to http server, rejected!".format(data))
+            return {"status": 1, "msg": "data invalid"}
+        except Exception as e:
+            Logger().error(
+                "Unexpected error occured when process data:{}".format(data), exc_info=e)
+            return {"status": 2, "msg": "server error"}
+
+    async def process_data(self, data):
+        """
+        处理一条rasp_result, 扫描请求的结果不做解析, 以原始数据发送至对应的扫描进程, 其他请求去重后入库
+
+        Parameters:
+            data - 单条rasp_result的json bytes或dict
+
+        Raises:
+            exceptions.OriExpectedException - 数据格式错误引发此异常
+        """
+        if isinstance(data, bytes):
+            scan_request_id = rasp_result.RaspResult.get_raw_scan_request_id(data)
+            if scan_request_id != "":
+                self.send_data(scan_request_id, data)
+                return
+
+        rasp_result_ins = rasp_result.RaspResult(data)
+        Logger().info("Received request data: " + str(rasp_result_ins))
+        if rasp_result_ins.is_scan_result():
+            if not isinstance(data, bytes):
+                data = rasp_result_ins.dump().encode("utf-8")
+            self.send_data(rasp_result_ins.get_scan_request_id(), data)
+        else:
+            await self.dedup_data(rasp_result_ins)
+
     async def dedup_data(self, rasp_result_ins):
         """
         对非扫描请求new_request_data进行去重
@@ -179,34 +325,33 @@ class jsonHandler(tornado.web.RequestHandler):
                 Communicator().increase_value("duplicate_request")
             except KeyError:
                 rasp_result_ins.set_hash(hash_str)
-                try:
-                    data_stored = await self.new_request_storage.put(rasp_result_ins)
-                except exceptions.DatabaseError as e:
-                    self.dedup_lru.delete_key(host_port, hash_str)
-                    raise e
-                else:
-                    if data_stored:
-                        Logger().info("Get new request with request_id: {}".format(
-                            rasp_result_ins.get_request_id()))
-                        Communicator().increase_value("new_request")
-                    else:
-                        Logger().info("Drop duplicate request with request_id: {}".format(
-                            rasp_result_ins.get_request_id()))
-                        Communicator().increase_value("duplicate_request")
+                # 新请求先写入缓冲区, 由ResultStorage批量入库并统计new_request/duplicate_request
+                await self.new_request_storage.put(rasp_result_ins)
 
-    def send_data(self, rasp_result_ins):
+    def send_data(self, scan_request_id, raw_result):
         """
-        向rasp_result_queue发送RaspResult实例
+        向scan_request_id对应的rasp_result_queue发送扫描请求结果的原始数据
 
         Parameters:
-            rasp_result_ins - 待发送的RaspResult实例
+            scan_request_id - str, 扫描请求的scan_request_id
+            raw_result - bytes, 扫描请求结果的json
         """
-        queue_name = "rasp_result_queue_" + \
-            str(rasp_result_ins.get_result_queue_id())
-        Logger().info("Send scan request data with id:{} to queue:{}".format(
-            rasp_result_ins.get_request_id(), queue_name))
-        Communicator().send_data(queue_name, rasp_result_ins)
-        Communicator().increase_value("rasp_result_request")
+        queue_name = "rasp_result_queue_" + scan_request_id.split("-")[0]
+        Logger().info("Send scan request data with scan-request-id:{} to queue:{}".format(
+            scan_request_id, queue_name))
+        try:
+            Communicator().send_data(queue_name, raw_result)
+        except exceptions.QueueFull:
+            # 扫描进程未及时读取, 丢弃结果, 不阻塞http服务
+            Logger().warning("Queue {} is full, drop scan request data with scan-request-id:{}".format(
+                queue_name, scan_request_id))
+            Communicator().increase_value("dropped_scan_result")
+        except exceptions.QueueValueError:
+            Logger().warning("Scan request data with scan-request-id:{} ({} bytes) exceeds size of queue {}, dropped!".format(
+                scan_request_id, len(raw_result), queue_name))
+            Communicator().increase_value("dropped_scan_result")
+        else:
+            Communicator().increase_value("rasp_result_request")
 
     def update_setting(self):
         """
@@ -221,6 +366,9 @@ class jsonHandler(tornado.web.RequestHandler):
 
 
 class ResultStorage(object):
+    """
+    新请求的写入缓冲, 按host_port缓存待写入的数据, 达到数量或时间阈值时使用INSERT IGNORE批量写入
+    """
 
     def __init__(self, dedup_lru):
         """
@@ -228,6 +376,17 @@ class ResultStorage(object):
         """
         self.models = {}
         self.dedup_lru = dedup_lru
+        # 待写入的数据, key为host_port, value为RaspResult实例组成的list
+        self.pending = {}
+        self.batch_size = Config().get_config("preprocessor.write_batch_size")
+        self.flush_interval = Config().get_config("preprocessor.write_flush_interval")
+        self.retry_times = Config().get_config("preprocessor.write_retry_times")
+        # 写入失败等待重试的host_port, value为已重试次数
+        self.retry_count = {}
+        self.flush_callback = None
+        self.preload_size = Config().get_config("preprocessor.dedup_preload_size")
+        # 当前进程中已确认预加载过去重表的host_port
+        self.preloaded = set()
 
     def _get_model(self, host_port):
         """
@@ -244,98 +403,323 @@ class ResultStorage(object):
 
             del_host = []
             for host_port_item, model in self.models.items():
-                if model[1] < now_time:
+                if model[1] < now_time and host_port_item not in self.pending:
                     del_host.append(host_port_item)
 
             for host_port_item in del_host:
                 del self.models[host_port_item]
-                self.dedup_lru.clean_lru(host_port_item)
 
+            # 所有扫描目标的实例共用进程内的数据库连接池
             self.models[host_port] = [
-                new_request_model.NewRequestModel(host_port, multiplexing_conn=False),
+                new_request_model.NewRequestModel(host_port, multiplexing_conn=True),
                 time.time() + 180
             ]
 
+            if self._need_preload(host_port):
+                tornado.ioloop.IOLoop.current().spawn_callback(self.preload, host_port)
+
         return self.models[host_port][0]
 
+    def _need_preload(self, host_port):
+        """
+        判断当前进程是否需要预加载host_port的去重表, 所有http进程中只有第一个获取到标记的进程需要加载
+
+        Parameters:
+            host_port - host + "_" + str(port) 组成的字符串
+
+        Returns:
+            Boolean
+        """
+        if host_port in self.preloaded:
+            return False
+        self.preloaded.add(host_port)
+        return self.dedup_lru.mark_preloaded(host_port)
+
     def reset(self, host_port):
         """
-        清除缓存的NewRequestModel实例
+        清除缓存的NewRequestModel实例和未写入的数据
 
         Parameters:
             host_port - host + "_" + str(port) 组成的字符串, 指定清除的实例的表名
         """
         if host_port in self.models:
             del self.models[host_port]
+        self.pending.pop(host_port, None)
+        self.retry_count.pop(host_port, None)
+        self.preloaded.discard(host_port)
+
+    async def preload(self, host_port):
+        """
+        分页读取数据表中最近的preprocessor.dedup_preload_size条data_hash并加入去重表,
+        使重启后重放的重复请求可以在内存中被丢弃
+
+        Parameters:
+            host_port - host + "_" + str(port) 组成的字符串, 指定预加载的表
+        """
+        if self.preload_size <= 0:
+            return
+
+        model = self._get_model(host_port)
+        page_size = min(self.preload_size, 1000)
+        before_id = None
+        count = 0
+        try:
+            while count < self.preload_size:
+                rows = await model.get_recent_hash(before_id, min(page_size, self.preload_size - count))
+                # 预加载过程中表被重置(如清空LRU)时放弃加载, 避免加入已失效的hash
+                if host_port not in self.models or self.models[host_port][0] is not model:
+                    return
+                for row in rows:
+                    self.dedup_lru.add(host_port, row[1])
+                count += len(rows)
+                if len(rows) < page_size:
+                    break
+                before_id = rows[-1][0]
+        except exceptions.DatabaseError:
+            Logger().warning("Preload dedup index of {} failed!".format(host_port))
+            return
+        Logger().info("Preload {} request hash of {} to dedup index".format(count, host_port))
+
+    async def preload_all(self):
+        """
+        预加载数据库中所有扫描目标的去重表
+        """
+        if self.preload_size <= 0:
+            return
+
+        try:
+            if base_model.BaseModel.is_single_table():
+                targets = target_stats_model.TargetStatsModel.get_instance().get_targets()
+            else:
+                targets = []
+                for table_name in base_model.BaseModel(use_async=False).get_tables():
+                    if table_name.lower().endswith("_resultlist"):
+                        targets.append(table_name[:-11])
+        except exceptions.DatabaseError:
+            Logger().warning("Get target tables failed, skip preload dedup index!")
+            return
+
+        for host_port in targets:
+            if self._need_preload(host_port):
+                await self.preload(host_port)
+
+    def start_flush(self):
+        """
+        启动定时写入, 需要在IOLoop启动前调用
+        """
+        self.flush_callback = tornado.ioloop.PeriodicCallback(
+            self._schedule_flush, self.flush_interval * 1000)
+        self.flush_callback.start()
+
+    def _schedule_flush(self):
+        """
+        定时写入回调
+        """
+        if len(self.pending) > 0:
+            tornado.ioloop.IOLoop.current().spawn_callback(self.flush_all)
 
     async def put(self, rasp_result_ins):
         """
-        将RaspResult实例插入对应的数据表
+        将RaspResult实例加入写入缓冲, 缓冲数量达到write_batch_size时立即写入, 等待重试的host_port由定时写入重试
 
         Parameters:
             rasp_result_ins - 插入的RaspResult实例
         """
         host_port = rasp_result_ins.get_host_port()
-        model = self._get_model(host_port)
-        return await model.put(rasp_result_ins)
+        batch = self.pending.setdefault(host_port, [])
+        batch.append(rasp_result_ins)
+        if len(batch) >= self.batch_size and host_port not in self.retry_count:
+            await self.flush(host_port)
 
+    async def flush(self, host_port):
+        """
+        将指定host_port的缓冲数据批量写入数据表, 统计新请求与重复请求数量,
+        写入失败时放回缓冲区等待重试, 超出重试次数后丢弃并从去重LRU中删除对应的hash, 使后续相同请求可以重新入库
+
+        Parameters:
+            host_port - host + "_" + str(port) 组成的字符串, 指定写入的表
+        """
+        batch = self.pending.pop(host_port, None)
+        if not batch:
+            return
+
+        try:
+            model = self._get_model(host_port)
+            inserted = await model.put_batch(batch)
+        except exceptions.DatabaseError:
+            retry = self.retry_count.get(host_port, 0)
+            if retry < self.retry_times:
+                self.retry_count[host_port] = retry + 1
+                # 写入期间新加入的数据排在失败的数据之后
+                self.pending[host_port] = batch + self.pending.get(host_port, [])
+                Logger().warning("Write {} new requests of {} failed, retry later ({}/{})".format(
+                    len(batch), host_port, retry + 1, self.retry_times))
+                return
+            self.retry_count.pop(host_port, None)
+            Logger().error("Write {} new requests of {} failed after {} retries, dropped!".format(
+                len(batch), host_port, retry))
+            for rasp_result_ins in batch:
+                self.dedup_lru.delete_key(host_port, rasp_result_ins.get_hash())
+            return
+
+        self.retry_count.pop(host_port, None)
+        module_name = Communicator().get_module_name()
+        Communicator().add_value("new_request", module_name, inserted)
+        Communicator().add_value("duplicate_request", module_name, len(batch) - inserted)
+        Logger().info("Write {} new requests of {}, new: {}, duplicate: {}".format(
+            len(batch), host_port, inserted, len(batch) - inserted))
+
+    async def flush_all(self):
+        """
+        将全部缓冲数据写入数据表
+        """
+        for host_port in list(self.pending.keys()):
+            await self.flush(host_port)
 
-class DedupLru(object):
+
+class DedupIndex(object):
     """
-    非扫描请求入库前的去重LRU集合
+    非扫描请求入库前的去重表, 存储于共享内存中, 由预处理模块的所有http进程共享
+
+    去重表按host_port的hash分为多个分区, 每个分区是一个固定大小的开放寻址hash表,
+    存储 host_port + key 的64位指纹, 总内存为 partition_num * partition_size * 8 Bytes, 与进程数无关。
+    分区写满时覆盖探测范围内的旧指纹, 被覆盖或误删的key会回退到数据库的唯一索引去重。
     """
 
-    def __init__(self, max_size):
+    # 每个key最多探测的槽位数
+    probe_len = 8
+
+    # 标记扫描目标已预加载的key, 不会与请求的hash重复
+    preload_mark_key = "\x00preloaded"
+
+    def __init__(self, partition_num, partition_size):
         """
-        初始化
+        初始化, 需要在fork子进程前调用
+
+        Parameters:
+            partition_num - int, 分区数量
+            partition_size - int, 每个分区的槽位数量
+        """
+        self.partition_num = max(partition_num, 1)
+        self.partition_size = max(partition_size, 1)
+        self.probe_len = min(self.probe_len, self.partition_size)
+        self.slots = multiprocessing.Array(
+            "Q", self.partition_num * self.partition_size, lock=False)
+        self.locks = [multiprocessing.Lock() for i in range(self.partition_num)]
+        self.partition_cache = {}
+
+    def _get_partition(self, host_port):
         """
-        self.lru_dict = {}
-        self.max_size = max_size
+        获取host_port对应的分区序号
+        """
+        try:
+            return self.partition_cache[host_port]
+        except KeyError:
+            digest = hashlib.md5(host_port.encode("utf-8")).digest()
+            partition = int.from_bytes(digest[:4], "little") % self.partition_num
+            self.partition_cache[host_port] = partition
+            return partition
+
+    @staticmethod
+    def _get_fingerprint(host_port, key):
+        """
+        获取 host_port + key 的64位指纹, 0表示空槽位, 不会作为指纹返回
+        """
+        digest = hashlib.md5((host_port + "_" + key).encode("utf-8")).digest()
+        fingerprint = int.from_bytes(digest[:8], "little")
+        if fingerprint == 0:
+            fingerprint = 1
+        return fingerprint
+
+    def _get_probe_index(self, partition, fingerprint):
+        """
+        获取指纹在共享数组中的探测下标
+        """
+        base = partition * self.partition_size
+        home = fingerprint % self.partition_size
+        return [base + (home + i) % self.partition_size for i in range(self.probe_len)]
 
     def check(self, host_port, key):
         """
-        判断key是否存在于lru中，不存在则加入
+        判断key是否存在于去重表中，不存在则加入
 
         Parameters:
-            host_port - host + "_" + str(port) 组成的字符串，指定查找的LRU
-            key - 在LRU中查找的key
+            host_port - host + "_" + str(port) 组成的字符串，指定查找的分区
+            key - 在去重表中查找的key
 
         Raises:
-            KeyError - key不存在于LRU中
+            KeyError - key不存在于去重表中
+        """
+        partition = self._get_partition(host_port)
+        fingerprint = self._get_fingerprint(host_port, key)
+        probe_index = self._get_probe_index(partition, fingerprint)
+        with self.locks[partition]:
+            empty_index = None
+            for index in probe_index:
+                value = self.slots[index]
+                if value == fingerprint:
+                    return
+                elif value == 0 and empty_index is None:
+                    empty_index = index
+            if empty_index is None:
+                # 探测范围已满, 按指纹高位选择一个槽位覆盖
+                empty_index = probe_index[(fingerprint >> 32) % self.probe_len]
+            self.slots[empty_index] = fingerprint
+        raise KeyError
+
+    def add(self, host_port, key):
+        """
+        将key加入去重表
+
+        Parameters:
+            host_port - host + "_" + str(port) 组成的字符串，指定加入的分区
+            key - 加入去重表的key
         """
         try:
-            target_lru = self.lru_dict[host_port]
+            self.check(host_port, key)
         except KeyError:
-            self.lru_dict[host_port] = lru.LRU(self.max_size)
-            self.lru_dict[host_port][key] = None
-            raise KeyError
+            pass
+
+    def mark_preloaded(self, host_port):
+        """
+        在去重表中标记host_port已被预加载, 标记被覆盖或分区被清空后需要重新加载
 
+        Parameters:
+            host_port - host + "_" + str(port) 组成的字符串
+
+        Returns:
+            Boolean, 标记前不存在标记(调用者应执行预加载)时返回True
+        """
         try:
-            target_lru[key]
+            self.check(host_port, self.preload_mark_key)
         except KeyError:
-            target_lru[key] = None
-            raise KeyError
+            return True
+        return False
 
     def delete_key(self, host_port, key):
         """
-        在LRU中删除指定的key
+        在去重表中删除指定的key
 
         Parameters:
-            host_port - host + "_" + str(port) 组成的字符串，指定删除的key所在的LRU
-            key - 在LRU中删除的key
+            host_port - host + "_" + str(port) 组成的字符串，指定删除的key所在的分区
+            key - 在去重表中删除的key
 
         """
-        try:
-            target_lru = self.lru_dict[host_port]
-            del target_lru[key]
-        except KeyError:
-            pass
+        partition = self._get_partition(host_port)
+        fingerprint = self._get_fingerprint(host_port, key)
+        with self.locks[partition]:
+            for index in self._get_probe_index(partition, fingerprint):
+                if self.slots[index] == fingerprint:
+                    self.slots[index] = 0
 
     def clean_lru(self, host_port):
         """
-        清空LRU
+        清空host_port所在的分区, 同一分区内其他扫描目标的数据会回退到数据库去重
 
         Parameters:
-            host_port - host + "_" + str(port) 组成的字符串，指定清空的LRU
+            host_port - host + "_" + str(port) 组成的字符串，指定清空的分区
         """
-        self.lru_dict.pop(host_port, None)
+        partition = self._get_partition(host_port)
+        base = partition * self.partition_size
+        with self.locks[partition]:
+            self.slots[base:base + self.partition_size] = [0] * self.partition_size
@@ -24,6 +24,7 @@ import queue
 import signal
 import asyncio
 import functools
+import collections
 import multiprocessing
 
 from core.modules import base
@@ -38,6 +39,7 @@ from core.components.communicator import Communicator
 from core.model.report_model import ReportModel
 from core.model.config_model import ConfigModel
 from core.model.new_request_model import NewRequestModel
+from core.model.plugin_bit_model import PluginBitModel
 
 
 class Scanner(base.BaseModule):
@@ -55,6 +57,9 @@ class Scanner(base.BaseModule):
         # 用于记录失败请求并标记
         self.failed_task_set = set()
         Communicator().set_internal_shared("failed_task_set", self.failed_task_set)
+        # 插件完成任务或预取到新任务时触发, 用于及时向插件补充任务
+        self.task_finish_event = asyncio.Event()
+        Communicator().set_internal_shared("task_finish_event", self.task_finish_event)
         self.module_id = Communicator().get_module_name().split("_")[-1]
 
         Communicator().set_value("max_concurrent_request", 1)
@@ -63,6 +68,7 @@ class Scanner(base.BaseModule):
 
         self._init_db()
         self._init_plugin()
+        self._init_plugin_bit()
         # 更新运行时配置
         self._update_scan_config()
 
@@ -135,6 +141,21 @@ class Scanner(base.BaseModule):
             Logger().error("No scanner plugin detected, scanner exit!")
             raise exceptions.NoPluginError
 
+    def _init_plugin_bit(self):
+        """
+        获取每个插件在扫描进度位图中的bit, bit记录在PluginBit表中, 插件增删或改名时已分配的bit不变
+        """
+        self.plugin_bit = {}
+        self.full_mask = 0
+        bit_dict = PluginBitModel.get_instance().get_plugin_bit(
+            list(self.scan_config["scan_plugin_status"].keys()))
+        for plugin_name in self.plugin_loaded:
+            if plugin_name not in bit_dict:
+                Logger().error("No free plugin bit for scanner plugin {}, plugin will not run!".format(plugin_name))
+                continue
+            self.plugin_bit[plugin_name] = 1 << bit_dict[plugin_name]
+            self.full_mask |= 1 << bit_dict[plugin_name]
+
     def _init_db(self):
         """
         初始化数据库
@@ -198,135 +219,315 @@ class Scanner(base.BaseModule):
     async def _fetch_from_queue(self):
         """
         获取扫描请求的RaspResult, 并分发给扫描插件
+
+        监听队列的通知fd, 有数据写入时立即读取队列中的全部结果, 同时每秒检查一次扫描配置是否更新
         """
         queue_name = "rasp_result_queue_" + self.module_id
-        sleep_interval = 0.1
-        continuously_sleep = 0
+        queue_fd = Communicator().get_queue_fd(queue_name)
         Logger().debug("Fetch task is running, use queue: " + queue_name)
 
+        loop = asyncio.get_event_loop()
+        loop.add_reader(queue_fd, self._drain_queue, queue_name)
+        # 处理监听前已写入的数据
+        self._drain_queue(queue_name)
+        try:
+            while True:
+                if Communicator().get_value("config_version") > self.scan_config["version"]:
+                    self._update_scan_config()
+                await asyncio.sleep(1)
+        finally:
+            loop.remove_reader(queue_fd)
+
+    def _drain_queue(self, queue_name):
+        """
+        读取队列中的全部扫描请求结果并发送给RaspResultReceiver
+
+        Parameters:
+            queue_name - 读取的队列名
+        """
+        # 先清空通知再读取, 读取过程中写入的数据会产生新的通知, 不会被遗漏
+        Communicator().clear_queue_notify(queue_name)
         while True:
-            if Communicator().get_value("config_version") > self.scan_config["version"]:
-                self._update_scan_config()
             try:
                 data = Communicator().get_data_nowait(queue_name)
-                Logger().debug("From rasp_result_queue got data: " + str(data))
-                result_receiver.RaspResultReceiver().add_result(data)
-                Logger().debug("Send data to rasp_result receiver: {}".format(
-                    data.get_request_id()))
-                continuously_sleep = 0
             except exceptions.QueueEmpty:
-                if continuously_sleep < 10:
-                    continuously_sleep += 1
-                await asyncio.sleep(sleep_interval * continuously_sleep)
+                break
+            Logger().debug("From rasp_result_queue got data: {}".format(data))
+            try:
+                result_receiver.RaspResultReceiver().add_raw_result(data)
+            except Exception as e:
+                Logger().error("Add rasp result to receiver failed!", exc_info=e)
 
     async def _fetch_new_scan(self):
         """
         获取非扫描请求（新扫描任务），并分发给插件
+
+        预取协程从数据库获取任务放入缓冲区, 标记协程定期写入扫描进度, 数据库操作与扫描并行执行,
+        本协程在插件完成任务或缓冲区有新任务时, 从缓冲区向插件补充任务
+        """
+        self._init_fetch_state()
+
+        loop = asyncio.get_event_loop()
+        prefetch_task = loop.create_task(self._prefetch_task())
+        mark_task = loop.create_task(self._mark_progress_loop())
+        try:
+            while True:
+                self.task_finish_event.clear()
+                self._collect_scan_progress()
+                fetch_count = min(self._get_fetch_count(), len(self.task_buffer))
+                for _ in range(fetch_count):
+                    self._dispatch_task(self.task_buffer.popleft())
+                if fetch_count > 0:
+                    self.prefetch_event.set()
+                try:
+                    await asyncio.wait_for(self.task_finish_event.wait(), self.mark_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            prefetch_task.cancel()
+            mark_task.cancel()
+            await asyncio.wait({prefetch_task, mark_task})
+
+    def _init_fetch_state(self):
         """
-        # 扫描插件任务队列最大值
-        scan_queue_max = 300
-        # 已扫描的任务数量
-        self.scan_num = 0
-        # 扫描队列数量
-        self.scan_queue_remaining = 0
-        # 下次获取任务数量
-        self.fetch_count = 20
-        # 待标记的已扫描的最大id
-        self.mark_id = 0
+        初始化任务预取、分发和进度标记使用的状态
+        """
+        # 每次获取任务数量的最小值
+        self.fetch_min = 20
+        # 按插件扫描速度预取的任务时长(秒)
+        self.fetch_lookahead = 2
+        # 内存中缓存的任务数据大小上限
+        self.task_memory_limit = Config().get_config("scanner.task_memory_limit")
+        # 任务数据平均大小的估计值(Bytes)
+        self.task_size = 4096
+        # 两次写入扫描进度的最小间隔(秒)
+        self.mark_interval = 1
+        # 任务租约时长(秒), 每隔三分之一租约时长续约一次
+        self.lease_time = Config().get_config("scanner.task_lease_time")
+        # 已从数据库获取, 尚未分发给插件的任务
+        self.task_buffer = collections.deque()
+        # 缓冲区任务被取出时触发, 通知预取协程补充
+        self.prefetch_event = asyncio.Event()
+        # 未完成的任务, key为任务id, value为已完成该任务的插件位图
+        self.task_mask = {}
+        # 所有插件均已完成, 待标记的任务id
+        self.finished_list = []
+        # 待写入数据库的插件进度, key为插件bit, value为该插件成功完成的任务id list
+        self.plugin_progress = {}
+        # 各插件扫描速度(任务/秒)的指数加权移动平均
+        self.rate_alpha = 0.3
+        self.rate_interval = 0.5
+        self.rate_time = time.time()
+        self.plugin_rate = {plugin_name: 0.0 for plugin_name in self.plugin_bit}
+        self.rate_count = {plugin_name: 0 for plugin_name in self.plugin_bit}
+
+    async def _prefetch_task(self):
+        """
+        从数据库中获取当前扫描目标的非扫描请求（新扫描任务）放入缓冲区
+        """
+        sleep_interval = 1
+        continuously_sleep = 0
 
         while True:
+            self.prefetch_event.clear()
+            fetch_count = self._get_prefetch_count()
+            if fetch_count == 0:
+                await self.prefetch_event.wait()
+                continue
+
             try:
-                await self._fetch_task_from_db()
+                data_list = await self.new_scan_model.get_new_scan(fetch_count, self.lease_time)
             except exceptions.DatabaseError as e:
                 Logger().error("Database error occured when fetch scan task.", exc_info=e)
+                await asyncio.sleep(sleep_interval)
+                continue
             except asyncio.CancelledError as e:
                 raise e
             except Exception as e:
                 Logger().error("Unexpected error occured when fetch scan task.", exc_info=e)
-            if self.scan_queue_remaining == 0:
+                await asyncio.sleep(sleep_interval)
                 continue
 
-            await self._check_scan_progress()
+            data_count = len(data_list)
+            Logger().debug("Fetch {} task from db.".format(data_count))
+            for item in data_list:
+                # item 格式: {"id": id, "data":rasp_result_json, "plugin_mask": 已完成的插件位图, "size": 数据大小}
+                self.task_size = self.rate_alpha * item["size"] + (1 - self.rate_alpha) * self.task_size
+                self.task_buffer.append(item)
+            if data_count > 0:
+                self.task_finish_event.set()
+
+            if data_count < fetch_count:
+                # 数据库中暂无更多任务
+                Logger().debug("No more url need scan, fetch task sleep {}s".format(
+                    sleep_interval * continuously_sleep))
+                if continuously_sleep < 10:
+                    continuously_sleep += 1
+                await asyncio.sleep(sleep_interval * continuously_sleep)
+            else:
+                continuously_sleep = 0
+
+    def _get_task_limit(self):
+        """
+        计算内存中任务(缓冲区中和已分发未完成的任务)数量的上限
 
-            # 调整每次获取的扫描任务数
-            if self.scan_queue_remaining + self.fetch_count > scan_queue_max:
-                self.fetch_count = scan_queue_max - self.scan_queue_remaining
-            elif self.fetch_count < 5:
-                self.fetch_count = 5
+        Returns:
+            int
+        """
+        return max(self.fetch_min, int(self.task_memory_limit // self.task_size))
 
-    async def _fetch_task_from_db(self):
+    def _get_max_rate(self):
         """
-        从数据库中获取当前扫描目标的非扫描请求（新扫描任务）
+        Returns:
+            float, 已启用插件中最快的扫描速度(任务/秒)
         """
+        rate_list = [self.plugin_rate[plugin_name] for plugin_name in self.plugin_bit
+                     if self.plugin_loaded[plugin_name].get_enable()]
+        if len(rate_list) == 0:
+            return 0.0
+        return max(rate_list)
 
-        await self.new_scan_model.mark_result(self.mark_id, list(self.failed_task_set))
-        self.failed_task_set.clear()
+    def _get_prefetch_count(self):
+        """
+        计算需要预取的任务数量, 缓冲区目标大小为最快插件fetch_lookahead秒扫描的任务量的两倍,
+        缓冲区不足一半时补充, 同时受内存中任务数量上限约束
 
-        sleep_interval = 1
-        continuously_sleep = 0
+        Returns:
+            int, 需要获取的任务数量, 为0时无需获取
+        """
+        buffer_size = max(self.fetch_min, int(self._get_max_rate() * self.fetch_lookahead)) * 2
+        memory_remaining = self._get_task_limit() - len(self.task_mask) - len(self.task_buffer)
+        if len(self.task_buffer) * 2 >= buffer_size or memory_remaining <= 0:
+            return 0
+        return min(buffer_size - len(self.task_buffer), memory_remaining)
 
-        while True:
-            data_list = await self.new_scan_model.get_new_scan(self.fetch_count)
-            data_count = len(data_list)
-            Logger().debug("Fetch {} task from db.".format(data_count))
-            if data_count > 0 or self.scan_queue_remaining > 0:
-                for item in data_list:
-                    for plugin_name in self.plugin_loaded:
-                        # item 格式: {"id": id, "data":rasp_result_json}
-                        self.plugin_loaded[plugin_name].add_task(item)
-                    Logger().debug(
-                        "Send task with id: {} to plugins.".format(item["id"]))
-                self.scan_queue_remaining += data_count
-                return
-            else:
-                Logger().debug("No url need scan, fetch task sleep {}s".format(
-                    sleep_interval * continuously_sleep))
-                if continuously_sleep < 10:
-                    continuously_sleep += 1
-                await asyncio.sleep(sleep_interval * continuously_sleep)
+    def _dispatch_task(self, item):
+        """
+        将任务分发给尚未完成该任务的插件
 
-    async def _check_scan_progress(self):
+        Parameters:
+            item - dict, get_new_scan获取的任务
         """
-        监测扫描进度，给出下次获取的任务量
+        if item["id"] in self.task_mask:
+            # 当前模块的租约过期后重新领取了仍在扫描中的任务
+            Logger().debug("Task with id: {} is already running, skip.".format(item["id"]))
+            return
+
+        task_mask = item["plugin_mask"] & self.full_mask
+        if task_mask == self.full_mask:
+            # 上次运行时已全部完成但未标记
+            self.finished_list.append(item["id"])
+            return
+
+        self.task_mask[item["id"]] = task_mask
+        for plugin_name, plugin_bit in self.plugin_bit.items():
+            if not task_mask & plugin_bit:
+                self.plugin_loaded[plugin_name].add_task(item)
+        Logger().debug("Send task with id: {} to plugins.".format(item["id"]))
+
+    def _get_fetch_count(self):
         """
-        sleep_interval = 1
-        sleep_count = 0
+        计算需要分发给插件的任务数量
+
+        待扫描任务最少的已启用插件, 剩余任务不足以支撑fetch_lookahead秒的扫描时, 按最快插件的速度补充任务,
+        慢插件的积压由内存中任务数量上限约束
+
+        Returns:
+            int, 需要分发的任务数量, 为0时无需分发
+        """
+        enabled_list = [plugin_name for plugin_name in self.plugin_bit
+                        if self.plugin_loaded[plugin_name].get_enable()]
+        if len(enabled_list) == 0:
+            return self.fetch_min
+
+        min_pending = min(self.plugin_loaded[plugin_name].get_pending_num() for plugin_name in enabled_list)
+        target = max(self.fetch_min, int(self._get_max_rate() * self.fetch_lookahead))
+        if min_pending >= target:
+            return 0
+        # 补充到目标值的两倍, 使下次补充前仍有足够的任务
+        return target * 2 - min_pending
+
+    def _collect_scan_progress(self):
+        """
+        获取各插件完成的任务, 更新任务的插件位图和插件扫描速度
+        """
+        for plugin_name, plugin_bit in self.plugin_bit.items():
+            finished_tasks = self.plugin_loaded[plugin_name].pop_finished_tasks()
+            self.rate_count[plugin_name] += len(finished_tasks)
+            for task_id, failed, scanned in finished_tasks:
+                # 插件未启用时跳过的任务不记录该插件的进度, 插件启用后重新扫描未完成的任务
+                if scanned and not failed:
+                    self.plugin_progress.setdefault(plugin_bit, []).append(task_id)
+                if task_id not in self.task_mask:
+                    continue
+                task_mask = self.task_mask[task_id] | plugin_bit
+                if task_mask == self.full_mask:
+                    del self.task_mask[task_id]
+                    self.finished_list.append(task_id)
+                else:
+                    self.task_mask[task_id] = task_mask
+
+        now = time.time()
+        elapsed = now - self.rate_time
+        if elapsed >= self.rate_interval:
+            for plugin_name in self.plugin_bit:
+                rate = self.rate_count[plugin_name] / elapsed
+                self.plugin_rate[plugin_name] = self.rate_alpha * rate + \
+                    (1 - self.rate_alpha) * self.plugin_rate[plugin_name]
+                self.rate_count[plugin_name] = 0
+            self.rate_time = now
+
+    async def _mark_progress_loop(self):
+        """
+        每隔mark_interval秒将扫描进度写入数据库, 并为未完成的任务续约
+        """
+        renew_time = time.time() + self.lease_time / 3
         while True:
-            await asyncio.sleep(sleep_interval)
-            sleep_count += 1
-            scan_num_list = []
-            scan_id_list = []
-
-            for plugin_name in self.plugin_loaded:
-                plugin_ins = self.plugin_loaded[plugin_name]
-                plugin_scan_num, plugin_last_id = plugin_ins.get_scan_progress()
-                scan_num_list.append(plugin_scan_num)
-                scan_id_list.append(plugin_last_id)
-
-            plugin_scan_min_num = min(scan_num_list)
-            plugin_scan_min_id = min(scan_id_list)
-            finish_count = plugin_scan_min_num - self.scan_num
-
-            if sleep_count > 20:
-                # 20个sleep内未扫描完成，每次最大获取任务量减半
-                self.scan_queue_remaining -= finish_count
-                self.scan_num = plugin_scan_min_num
-                sleep_count = 0
-                Logger().debug("Finish scan num: {}, remain task: {}, max scanned id: {}, decrease task fetch_count.".format(
-                    finish_count, self.scan_queue_remaining, plugin_scan_min_id))
-            elif sleep_count > 10:
-                # 10-20个sleep内完成一半以上，每次最大获取任务量不变
-                if self.scan_queue_remaining < finish_count * 2:
-                    self.fetch_count = finish_count
-                    break
-            elif self.scan_queue_remaining == finish_count:
-                # 10个sleep内完成，每次最大获取任务量加倍
-                self.fetch_count = self.scan_queue_remaining * 2
-                break
+            await asyncio.sleep(self.mark_interval)
+            try:
+                await self._mark_scan_progress()
+                if time.time() >= renew_time:
+                    id_list = list(self.task_mask.keys()) + [item["id"] for item in self.task_buffer]
+                    await self.new_scan_model.renew_lease(id_list, self.lease_time)
+                    renew_time = time.time() + self.lease_time / 3
+            except exceptions.DatabaseError as e:
+                Logger().error("Database error occured when mark scan progress.", exc_info=e)
+            except asyncio.CancelledError as e:
+                raise e
+            except Exception as e:
+                Logger().error("Unexpected error occured when mark scan progress.", exc_info=e)
 
-        self.scan_queue_remaining -= finish_count
-        self.scan_num = plugin_scan_min_num
-        self.mark_id = plugin_scan_min_id
+    async def _mark_scan_progress(self):
+        """
+        将插件进度和已完成的任务写入数据库, 写入失败时保留, 下次重试
+
+        Raises:
+            exceptions.DatabaseError - 数据库错误引发此异常
+        """
+        self._collect_scan_progress()
+        if len(self.finished_list) == 0 and len(self.plugin_progress) == 0:
+            return
+
+        # 写入期间插件完成的任务记录到新的列表中
+        finished_list, self.finished_list = self.finished_list, []
+        plugin_progress, self.plugin_progress = self.plugin_progress, {}
+        failed_list = [task_id for task_id in finished_list if task_id in self.failed_task_set]
+
+        # 成功完成的任务直接标记为已扫描, 只需记录未完成或失败任务的插件进度
+        succeed_set = set(finished_list).difference(failed_list)
+        progress_to_write = {}
+        for plugin_bit, id_list in plugin_progress.items():
+            id_list = [task_id for task_id in id_list if task_id not in succeed_set]
+            if len(id_list) > 0:
+                progress_to_write[plugin_bit] = id_list
 
-        Logger().debug("Finish scan num: {}, remain task: {}, max scanned id: {}".format(
-            finish_count, self.scan_queue_remaining, plugin_scan_min_id))
+        try:
+            await self.new_scan_model.mark_result(finished_list, failed_list, progress_to_write)
+        except BaseException as e:
+            self.finished_list = finished_list + self.finished_list
+            for plugin_bit, id_list in plugin_progress.items():
+                self.plugin_progress[plugin_bit] = id_list + self.plugin_progress.get(plugin_bit, [])
+            raise e
+        self.failed_task_set.difference_update(failed_list)
+        Logger().debug("Mark {} task finished, {} failed, remain task: {}, buffered task: {}".format(
+            len(finished_list), len(failed_list), len(self.task_mask), len(self.task_buffer)))
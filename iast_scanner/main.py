@@ -33,21 +33,8 @@ sys.path.append(main_path)
 from core.components.config import Config
 
 
-def init_check():
-    version_parts = platform.python_version().split(".")
-    if int(version_parts[0]) < 3 or (int(version_parts[0]) == 3 and int(version_parts[1]) < 6):
-        print("[!] You must run this tool with Python 3.6 or newer version.")
-        sys.exit(1)
-
-    if sys.platform not in ("linux", "darwin"):
-        print("[!] Not support to run on platform: {}, use linux.".format(sys.platform))
-        sys.exit(1)
-
-    try:
-        import aiohttp, aiomysql, jsonschema, lru, peewee, peewee_async, psutil, pymysql, tornado, yaml, requests
-    except ModuleNotFoundError as e:
-        print(e, ", use command 'pip3 install -r requirements.txt' to install dependency packages.")
-        sys.exit(1)
+def check_mysql():
+    import pymysql
 
     try:
         conn = pymysql.connect(
@@ -91,6 +78,29 @@ def init_check():
         print("[!] MySQL connection fail, check database config! ", e)
         sys.exit(1)
 
+
+def init_check():
+    version_parts = platform.python_version().split(".")
+    if int(version_parts[0]) < 3 or (int(version_parts[0]) == 3 and int(version_parts[1]) < 6):
+        print("[!] You must run this tool with Python 3.6 or newer version.")
+        sys.exit(1)
+
+    if sys.platform not in ("linux", "darwin"):
+        print("[!] Not support to run on platform: {}, use linux.".format(sys.platform))
+        sys.exit(1)
+
+    try:
+        import aiohttp, aiomysql, jsonschema, lru, peewee, peewee_async, psutil, pymysql, tornado, yaml, requests
+    except ModuleNotFoundError as e:
+        print(e, ", use command 'pip3 install -r requirements.txt' to install dependency packages.")
+        sys.exit(1)
+
+    if Config().config_dict["database.engine"] == "mysql":
+        check_mysql()
+    elif Config().config_dict["database.engine"] != "sqlite":
+        print("[!] Unknown database engine: {}, use mysql or sqlite.".format(Config().config_dict["database.engine"]))
+        sys.exit(1)
+
     # 测试是否能正确连接云控
     if Config().config_dict["cloud_api.enable"]:
         url = Config().config_dict["cloud_api.backend_url"] + "/v1/iast/auth"
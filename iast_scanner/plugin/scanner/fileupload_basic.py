@@ -28,6 +28,8 @@ class ScanPlugin(scan_plugin_base.ScanPluginBase):
         "description": "基础文件上传漏洞检测插件"
     }
 
+    need_response_body = False
+
     def __init__(self):
         super().__init__()
 
@@ -30,6 +30,8 @@ class ScanPlugin(scan_plugin_base.ScanPluginBase):
         "description": "基础xxe漏洞检测插件"
     }
 
+    need_response_body = False
+
     def mutant(self, rasp_result_ins):
         """
         测试向量生成
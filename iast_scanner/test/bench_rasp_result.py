@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+RaspResult 构造性能测试, 对比严格模式(json schema校验)与非严格模式,
+以及新请求去重时读取context字段(非严格模式下首次读取时检查context)的总耗时
+
+使用方法(在iast_scanner目录下):
+    python3 test/bench_rasp_result.py [次数]
+"""
+
+import os
+import sys
+import json
+import copy
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.components import rasp_result
+from plugin.deduplicate import default
+
+
+java_stack = [
+    "com.mysql.jdbc.StatementImpl.executeQuery(StatementImpl.java:1471)",
+    "org.apache.commons.dbcp.DelegatingStatement.executeQuery(DelegatingStatement.java:208)",
+    "com.example.dao.UserDao.findByName(UserDao.java:57)",
+    "com.example.service.UserService.search(UserService.java:33)",
+    "com.example.web.UserController.search(UserController.java:81)",
+    "sun.reflect.NativeMethodAccessorImpl.invoke0(Native Method)",
+    "sun.reflect.NativeMethodAccessorImpl.invoke(NativeMethodAccessorImpl.java:62)",
+    "sun.reflect.DelegatingMethodAccessorImpl.invoke(DelegatingMethodAccessorImpl.java:43)",
+    "java.lang.reflect.Method.invoke(Method.java:498)",
+    "org.springframework.web.method.support.InvocableHandlerMethod.doInvoke(InvocableHandlerMethod.java:205)",
+    "org.springframework.web.method.support.InvocableHandlerMethod.invokeForRequest(InvocableHandlerMethod.java:133)",
+    "org.springframework.web.servlet.mvc.method.annotation.ServletInvocableHandlerMethod.invokeAndHandle(ServletInvocableHandlerMethod.java:97)",
+    "org.springframework.web.servlet.mvc.method.annotation.RequestMappingHandlerAdapter.invokeHandlerMethod(RequestMappingHandlerAdapter.java:827)",
+    "org.springframework.web.servlet.mvc.method.annotation.RequestMappingHandlerAdapter.handleInternal(RequestMappingHandlerAdapter.java:738)",
+    "org.springframework.web.servlet.DispatcherServlet.doDispatch(DispatcherServlet.java:967)",
+    "org.springframework.web.servlet.DispatcherServlet.doService(DispatcherServlet.java:901)",
+    "org.springframework.web.servlet.FrameworkServlet.processRequest(FrameworkServlet.java:970)",
+    "org.springframework.web.servlet.FrameworkServlet.doGet(FrameworkServlet.java:861)",
+    "javax.servlet.http.HttpServlet.service(HttpServlet.java:635)",
+    "org.apache.catalina.core.ApplicationFilterChain.internalDoFilter(ApplicationFilterChain.java:231)",
+    "org.apache.catalina.core.ApplicationFilterChain.doFilter(ApplicationFilterChain.java:166)",
+    "org.apache.catalina.core.StandardWrapperValve.invoke(StandardWrapperValve.java:198)",
+    "org.apache.catalina.core.StandardContextValve.invoke(StandardContextValve.java:96)",
+    "org.apache.catalina.core.StandardHostValve.invoke(StandardHostValve.java:140)",
+    "org.apache.catalina.connector.CoyoteAdapter.service(CoyoteAdapter.java:342)",
+    "org.apache.coyote.http11.Http11Processor.service(Http11Processor.java:408)",
+    "org.apache.tomcat.util.net.NioEndpoint$SocketProcessor.doRun(NioEndpoint.java:1589)",
+    "java.lang.Thread.run(Thread.java:748)"
+]
+
+new_request = {
+    "web_server": {
+        "host": "192.168.1.10",
+        "port": 8080
+    },
+    "context": {
+        "requestId": "0c2a7ab5e6a64e19a7bb7f8f2bb6f8c1",
+        "json": {},
+        "server": {
+            "language": "java",
+            "name": "Tomcat",
+            "version": "8.5.41",
+            "os": "Linux"
+        },
+        "body": "",
+        "appBasePath": "/usr/local/tomcat/webapps",
+        "remoteAddr": "192.168.1.2",
+        "protocol": "http/1.1",
+        "method": "get",
+        "querystring": "name=admin&page=1",
+        "path": "/user/search",
+        "parameter": {"name": ["admin"], "page": ["1"]},
+        "header": {
+            "host": "192.168.1.10:8080",
+            "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0 Safari/537.36",
+            "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "accept-language": "zh-CN,zh;q=0.9",
+            "cookie": "JSESSIONID=6F4A3C0B1E2D9A8B7C6D5E4F3A2B1C0D; lang=zh",
+            "connection": "keep-alive"
+        },
+        "url": "http://192.168.1.10:8080/user/search",
+        "nic": [
+            {
+                "name": "eth0",
+                "ip": "192.168.1.10"
+            }
+        ],
+        "hostname": "app-server-01",
+        "target": "192.168.1.10",
+        "source": "192.168.1.2"
+    },
+    "hook_info": [
+        {
+            "hook_type": "sql",
+            "server": "mysql",
+            "query": "SELECT * FROM user WHERE name = 'admin' LIMIT 10",
+            "stack": java_stack
+        },
+        {
+            "hook_type": "readFile",
+            "path": "/usr/local/tomcat/webapps/ROOT/WEB-INF/views/user.jsp",
+            "realpath": "/usr/local/tomcat/webapps/ROOT/WEB-INF/views/user.jsp",
+            "stack": java_stack[5:]
+        }
+    ]
+}
+
+scan_result = copy.deepcopy(new_request)
+scan_result["context"]["header"]["scan-request-id"] = "0-5f0a2b8c1d3e4f6a7b8c9d0e1f2a3b4c"
+
+
+dedup_plugin = default.DedupPlugin()
+
+
+def bench(name, payload, count, dedup=False):
+    """
+    分别以严格模式和非严格模式构造RaspResult并读取路由需要的字段
+
+    Parameters:
+        dedup - bool, 是否同时计算去重hash, 非严格模式下计算hash时执行context检查
+    """
+    raw = json.dumps(payload).encode("utf-8")
+
+    def run(strict):
+        rasp_result_ins = rasp_result.RaspResult(raw, strict=strict)
+        rasp_result_ins.is_scan_result()
+        rasp_result_ins.get_request_id()
+        if dedup:
+            rasp_result_ins.set_hash(dedup_plugin.get_hash(rasp_result_ins))
+            rasp_result_ins.get_hash()
+
+    strict_time = min(timeit.repeat(lambda: run(True), number=count, repeat=3))
+    fast_time = min(timeit.repeat(lambda: run(False), number=count, repeat=3))
+    print("{:<18} {:>6} bytes  strict: {:>8.2f} us/op  fast: {:>8.2f} us/op  speedup: {:.1f}x".format(
+        name, len(raw), strict_time / count * 1e6, fast_time / count * 1e6, strict_time / fast_time))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    bench("new_request", new_request, count)
+    bench("scan_result", scan_result, count)
+    bench("new_request+dedup", new_request, count, dedup=True)
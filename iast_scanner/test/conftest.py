@@ -19,9 +19,13 @@ limitations under the License.
 
 import os
 import sys
+import pytest
+import asyncio
 
 from pytest_cov.embed import cleanup_on_sigterm
 
+from core.model import base_model
+from core.model import stack_model
 from core.components.config import Config
 
 os.environ["IAST_TEST_MODE"] = "1"
@@ -38,3 +42,47 @@ def pytest_configure(config):
 
 
 sys.path.append(os.path.dirname(__file__) + "/test")
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    使用临时sqlite数据库文件测试model, 结束后恢复数据库配置
+
+    Returns:
+        asyncio事件循环, 用于执行model的异步方法
+    """
+    config_keys = ("database.engine", "database.sqlite_path")
+    old_config = {key: Config().config_dict.get(key) for key in config_keys}
+    Config().config_dict["database.engine"] = "sqlite"
+    Config().config_dict["database.sqlite_path"] = str(tmp_path / "iast.db")
+    _reset_model_state()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    yield loop
+
+    loop.run_until_complete(base_model.BaseModel.mul_database.close_async())
+    base_model.BaseModel.mul_database.close()
+    loop.close()
+    asyncio.set_event_loop(None)
+    Config().config_dict.update(old_config)
+    _reset_model_state()
+
+
+def _reset_model_state():
+    """
+    清除进程内缓存的数据库连接、共用实例和调用栈缓存
+    """
+    base_model.BaseModel.mul_database_pid = None
+    base_model.BaseModel.upgraded_tables = set()
+    stack_model.StackModel.stack_cache = None
+    for model_class in _iter_subclass(base_model.BaseModel):
+        if "instance_pid" in model_class.__dict__:
+            model_class.instance_pid = None
+
+
+def _iter_subclass(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _iter_subclass(subclass)
@@ -60,6 +60,18 @@ def get_data_count(table_name):
     return result[0][0]
 
 
+def wait_data_count(table_name, count, timeout=5):
+    """
+    新请求由预处理模块批量异步写入, 等待表中数据条数达到count, 超时后返回当前条数
+    """
+    end_time = time.time() + timeout
+    while True:
+        result = get_data_count(table_name)
+        if result >= count or time.time() > end_time:
+            return result
+        time.sleep(0.1)
+
+
 def clean_table(table_name):
     sql = "TRUNCATE TABLE `{}`.`{}`".format(db_config["db_name"], table_name)
     _query(sql)
@@ -81,7 +93,7 @@ class HttpSender(object):
                 "Content-Encoding": "deflate",
                 "Content-Type": "application/json"
             }
-            if isinstance(json_data, dict):
+            if isinstance(json_data, (dict, list)):
                 json_data = json.dumps(json_data)
             json_data = zlib.compress(json_data.encode("utf-8"))
             r = requests.post(url=url, headers=headers, data=json_data)
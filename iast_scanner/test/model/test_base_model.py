@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License"];
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import sqlite3
+
+from core.components import rasp_result
+from core.components.communicator import Communicator
+from core.components.config import Config
+from core.model.base_model import BaseModel
+from core.model.new_request_model import NewRequestModel
+
+import bench_rasp_result
+
+
+def test_compressed_field(monkeypatch):
+    """
+    测试压缩字段的写入和读取, 短数据和未压缩的旧数据原样读取
+    """
+    field = BaseModel.CompressedLongTextField()
+    value = json.dumps(bench_rasp_result.new_request)
+    monkeypatch.setitem(Config().config_dict, "database.compress_data", True)
+    data = field.db_value(value)
+    assert data.startswith(field.format_tag)
+    assert len(data) < len(value)
+    assert field.python_value(data) == value
+
+    # 压缩后更大的数据不压缩
+    assert field.db_value("{}") == "{}"
+    assert field.python_value("{}") == "{}"
+    assert field.db_value(None) is None
+    assert field.python_value(None) is None
+
+    # 关闭压缩后写入原始数据, 已压缩的数据仍可读取
+    monkeypatch.setitem(Config().config_dict, "database.compress_data", False)
+    assert field.db_value(value) == value
+    assert field.python_value(value) == value
+    assert field.python_value(data) == value
+
+
+def test_compressed_field_storage(sqlite_db):
+    """
+    测试请求数据压缩存储到数据库后读取一致
+    """
+    Communicator().init_new_module("Scanner_0")
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(bench_rasp_result.new_request))
+    rasp_result_ins.set_hash("hash0")
+    sqlite_db.run_until_complete(model.put(rasp_result_ins))
+
+    conn = sqlite3.connect(Config().get_config("database.sqlite_path"))
+    data = conn.execute("SELECT data FROM \"127.0.0.1_8005_ResultList\"").fetchone()[0]
+    conn.close()
+    assert data.startswith(BaseModel.CompressedLongTextField.format_tag)
+
+    tasks = sqlite_db.run_until_complete(model.get_new_scan(1, 60))
+    assert tasks[0]["data"].get_url() == rasp_result_ins.get_url()
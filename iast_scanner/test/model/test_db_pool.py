@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+
+from core.model.db_pool import PooledConnection
+from core.components.communicator import Communicator
+
+
+class FakeConnection(object):
+
+    def __init__(self, last_usage, broken=False):
+        self.last_usage = last_usage
+        self.broken = broken
+        self.closed = False
+        self.ping_count = 0
+
+    async def ping(self, reconnect=True):
+        self.ping_count += 1
+        if self.broken:
+            raise ConnectionError("Lost connection to MySQL server")
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(object):
+    """
+    按顺序返回给定连接的aiomysql连接池, 可设置获取连接的等待时间
+    """
+
+    def __init__(self, conn_list, delay=0):
+        self.conn_list = list(conn_list)
+        self.delay = delay
+        self.released = []
+
+    async def acquire(self):
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        return self.conn_list.pop(0)
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+def get_pooled_connection(pool, ping_interval):
+    pooled_conn = PooledConnection(database="iast", ping_interval=ping_interval)
+    pooled_conn.pool = pool
+    return pooled_conn
+
+
+def test_ping_on_borrow():
+    """
+    测试空闲超过ping_interval的连接取出前执行ping, ping失败的连接被丢弃并重新获取
+    """
+    Communicator().init_new_module("Scanner_0")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    now = loop.time()
+
+    # 最近使用过的连接不执行ping
+    recent_conn = FakeConnection(now)
+    pooled_conn = get_pooled_connection(FakePool([recent_conn]), 60)
+    assert loop.run_until_complete(pooled_conn.acquire()) is recent_conn
+    assert recent_conn.ping_count == 0
+
+    idle_conn = FakeConnection(now - 100)
+    pooled_conn = get_pooled_connection(FakePool([idle_conn]), 60)
+    assert loop.run_until_complete(pooled_conn.acquire()) is idle_conn
+    assert idle_conn.ping_count == 1
+
+    broken_conn = FakeConnection(now - 100, broken=True)
+    new_conn = FakeConnection(now)
+    pool = FakePool([broken_conn, new_conn])
+    pooled_conn = get_pooled_connection(pool, 60)
+    assert loop.run_until_complete(pooled_conn.acquire()) is new_conn
+    assert broken_conn.closed and pool.released == [broken_conn]
+    assert not new_conn.closed
+
+    # ping_interval为-1时不检查
+    broken_conn = FakeConnection(now - 100, broken=True)
+    pooled_conn = get_pooled_connection(FakePool([broken_conn]), -1)
+    assert loop.run_until_complete(pooled_conn.acquire()) is broken_conn
+    assert broken_conn.ping_count == 0
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def test_pool_wait_counter():
+    """
+    测试获取连接需要等待时记录等待次数和等待时间(ms), 无需等待时不记录
+    """
+    Communicator().init_new_module("Scanner_0")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    wait_count = Communicator().get_value("db_pool_wait")
+    wait_time = Communicator().get_value("db_pool_wait_time")
+
+    pooled_conn = get_pooled_connection(FakePool([FakeConnection(loop.time())]), -1)
+    loop.run_until_complete(pooled_conn.acquire())
+    assert Communicator().get_value("db_pool_wait") == wait_count
+    assert Communicator().get_value("db_pool_wait_time") == wait_time
+
+    pooled_conn = get_pooled_connection(FakePool([FakeConnection(loop.time())], delay=0.05), -1)
+    loop.run_until_complete(pooled_conn.acquire())
+    assert Communicator().get_value("db_pool_wait") == wait_count + 1
+    assert Communicator().get_value("db_pool_wait_time") >= wait_time + 50
+
+    # 未记录运行信息的模块不计数
+    Communicator().init_new_module("Monitor")
+    pooled_conn = get_pooled_connection(FakePool([FakeConnection(loop.time())], delay=0.01), -1)
+    loop.run_until_complete(pooled_conn.acquire())
+    assert Communicator().get_value("db_pool_wait", "Scanner_0") == wait_count + 1
+    loop.close()
+    asyncio.set_event_loop(None)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License"];
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import json
+import sqlite3
+
+from core.components import common
+from core.components import rasp_result
+from core.components.communicator import Communicator
+from core.components.config import Config
+from core.model.new_request_model import NewRequestModel
+
+import bench_rasp_result
+
+
+def get_rasp_result(index):
+    data = copy.deepcopy(bench_rasp_result.new_request)
+    data["context"]["path"] = "/path{}".format(index)
+    data["context"]["url"] = "http://127.0.0.1:8005/path{}".format(index)
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(data))
+    rasp_result_ins.set_hash("hash{}".format(index))
+    return rasp_result_ins
+
+
+def test_lease_expire(sqlite_db, monkeypatch):
+    """
+    测试租约到期的扫描任务被重新领取, 原租约持有者无法再标记结果
+    """
+    Communicator().init_new_module("Scanner_0")
+    now = common.get_timestamp()
+    monkeypatch.setattr(common, "get_timestamp", lambda: now)
+
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    other_model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    sqlite_db.run_until_complete(model.put_batch([get_rasp_result(i) for i in range(3)]))
+
+    tasks = sqlite_db.run_until_complete(model.get_new_scan(2, 60))
+    assert [item["id"] for item in tasks] == [1, 2]
+    assert tasks[0]["data"].get_url() == "http://127.0.0.1:8005/path0"
+
+    # 租约未到期时, 其他实例只能领取剩余的任务
+    other_tasks = sqlite_db.run_until_complete(other_model.get_new_scan(2, 60))
+    assert [item["id"] for item in other_tasks] == [3]
+
+    # 续租的任务到期时间延后
+    sqlite_db.run_until_complete(model.renew_lease([1], 120))
+    monkeypatch.setattr(common, "get_timestamp", lambda: now + 61)
+    other_tasks = sqlite_db.run_until_complete(other_model.get_new_scan(2, 60))
+    assert [item["id"] for item in other_tasks] == [2, 3]
+
+    # 租约已被其他实例领取的任务不能被原持有者标记
+    sqlite_db.run_until_complete(model.mark_result([1, 2], []))
+    assert sqlite_db.run_until_complete(model.get_scan_count()) == (3, 1, 0)
+    sqlite_db.run_until_complete(other_model.mark_result([2], [3]))
+    assert sqlite_db.run_until_complete(model.get_scan_count()) == (3, 2, 1)
+    assert sqlite_db.run_until_complete(model.get_new_scan(2, 60)) == []
+
+
+def create_old_table(version):
+    """
+    使用旧版本的表结构创建扫描目标的数据表并写入一条未扫描的数据
+
+    Parameters:
+        version - int, 表结构版本, 0 为无版本记录的旧表
+    """
+    columns = [
+        "id INTEGER NOT NULL PRIMARY KEY",
+        "data TEXT NOT NULL",
+        "data_hash VARCHAR(63) NOT NULL",
+        "scan_status INTEGER NOT NULL",
+        "time INTEGER NOT NULL"
+    ]
+    if version >= 1:
+        columns += [
+            "plugin_mask INTEGER NOT NULL DEFAULT 0",
+            "lease_owner VARCHAR(63) NOT NULL DEFAULT ''",
+            "lease_expire INTEGER NOT NULL DEFAULT 0"
+        ]
+    conn = sqlite3.connect(Config().get_config("database.sqlite_path"))
+    conn.execute("CREATE TABLE \"127.0.0.1_8005_ResultList\" ({})".format(", ".join(columns)))
+    conn.execute("CREATE UNIQUE INDEX resultlist_data_hash ON \"127.0.0.1_8005_ResultList\" (data_hash)")
+    conn.execute(
+        "INSERT INTO \"127.0.0.1_8005_ResultList\" (data, data_hash, scan_status, time) VALUES (?, ?, 0, 1)",
+        (get_rasp_result(0).dump(), "hash0"))
+    if version > 0:
+        conn.execute("CREATE TABLE schema_version (name VARCHAR(64) NOT NULL PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.execute("INSERT INTO schema_version VALUES ('127.0.0.1_8005_ResultList', ?)", (version,))
+    conn.commit()
+    conn.close()
+
+
+def check_upgraded_table(loop):
+    """
+    检查升级后的表结构和原有数据
+    """
+    Communicator().init_new_module("Scanner_0")
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    database = model.database
+    table_name = "127.0.0.1_8005_ResultList"
+    columns = [column.name for column in database.get_columns(table_name)]
+    for column in ("plugin_mask", "lease_owner", "lease_expire"):
+        assert column in columns
+    indexes = [index.columns for index in database.get_indexes(table_name)]
+    assert ["scan_status", "id"] in indexes
+    assert ["scan_status", "lease_expire"] in indexes
+    version_model = model._create_version_model(database)
+    assert version_model.get(version_model.name == table_name).version == NewRequestModel.schema_version
+
+    tasks = loop.run_until_complete(model.get_new_scan(2, 60))
+    assert [(item["id"], item["plugin_mask"]) for item in tasks] == [(1, 0)]
+    assert tasks[0]["data"].get_url() == "http://127.0.0.1:8005/path0"
+
+
+def test_upgrade_from_version_1(sqlite_db):
+    """
+    测试从schema_version为1的表升级, 只添加索引
+    """
+    create_old_table(1)
+    check_upgraded_table(sqlite_db)
+
+
+def test_upgrade_from_version_0(sqlite_db):
+    """
+    测试升级无版本记录的旧表, 依次添加列和索引
+    """
+    create_old_table(0)
+    check_upgraded_table(sqlite_db)
+
+
+def test_single_table(sqlite_db, monkeypatch):
+    """
+    测试单表存储模式下各扫描目标的数据互不影响
+    """
+    monkeypatch.setitem(Config().config_dict, "database.storage_mode", "single_table")
+    monkeypatch.setitem(Config().config_dict, "database.partition_num", 1)
+    Communicator().init_new_module("Scanner_0")
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    other_model = NewRequestModel("127.0.0.1_8006", multiplexing_conn=True)
+    assert model.ResultList._meta.table_name == "ResultList_0"
+    assert other_model.ResultList._meta.table_name == "ResultList_0"
+
+    # 不同扫描目标可以存储相同hash的数据
+    assert sqlite_db.run_until_complete(model.put_batch([get_rasp_result(i) for i in range(3)])) == 3
+    assert sqlite_db.run_until_complete(model.put(get_rasp_result(0))) is False
+    assert sqlite_db.run_until_complete(other_model.put(get_rasp_result(0))) is True
+
+    tasks = sqlite_db.run_until_complete(other_model.get_new_scan(3, 60))
+    assert [item["id"] for item in tasks] == [4]
+    sqlite_db.run_until_complete(model.mark_result([4], []))
+    sqlite_db.run_until_complete(other_model.mark_result([4], []))
+    assert sqlite_db.run_until_complete(model.get_scan_count()) == (3, 0, 0)
+    assert sqlite_db.run_until_complete(other_model.get_scan_count()) == (1, 1, 0)
+
+    other_model.drop_table()
+    assert "ResultList_0" in model.get_tables()
+    assert sqlite_db.run_until_complete(model.get_scan_count()) == (3, 0, 0)
+    assert sqlite_db.run_until_complete(other_model.get_scan_count()) == (0, 0, 0)
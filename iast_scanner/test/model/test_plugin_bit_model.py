@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License"];
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from core.model.plugin_bit_model import PluginBitModel
+
+
+def test_plugin_bit_stable(sqlite_db):
+    """
+    测试插件bit分配, 插件增删或改名后已分配的bit不变
+    """
+    model = PluginBitModel(table_prefix="", multiplexing_conn=True)
+    bits = model.get_plugin_bit(["sql_basic", "command_basic", "xxe_basic"])
+    assert bits == {"command_basic": 0, "sql_basic": 1, "xxe_basic": 2}
+
+    # 新增的插件名排序靠前时不影响已有插件
+    bits = model.get_plugin_bit(["a_new_plugin", "sql_basic", "xxe_basic"])
+    assert bits == {"a_new_plugin": 3, "sql_basic": 1, "xxe_basic": 2}
+
+    # 已删除插件的bit不会被复用
+    bits = model.get_plugin_bit(["b_new_plugin"])
+    assert bits == {"b_new_plugin": 4}
+
+
+def test_plugin_bit_full(sqlite_db):
+    """
+    测试可分配的bit用尽
+    """
+    model = PluginBitModel(table_prefix="", multiplexing_conn=True)
+    name_list = ["plugin_{:02d}".format(i) for i in range(PluginBitModel.max_bit + 1)]
+    bits = model.get_plugin_bit(name_list)
+    assert len(bits) == PluginBitModel.max_bit
+    assert name_list[-1] not in bits
+    assert sorted(bits.values()) == list(range(PluginBitModel.max_bit))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+from core.components import rasp_result
+from core.model.report_model import ReportModel
+
+import bench_rasp_result
+
+
+class RequestData(object):
+    """
+    用于写入报警的RequestData
+    """
+
+    def __init__(self, payload_seq):
+        self.payload_seq = payload_seq
+        self.rasp_result_ins = rasp_result.RaspResult(json.dumps(bench_rasp_result.scan_result))
+
+    def get_rasp_result(self):
+        return self.rasp_result_ins
+
+    def get_payload_info(self):
+        return {"seq": self.payload_seq}
+
+
+def test_report_sqlite(sqlite_db):
+    """
+    测试sqlite数据库下写入、获取和分批标记报警数据
+    """
+    model = ReportModel("127.0.0.1_8005", multiplexing_conn=True)
+    assert model.database.execute_sql("PRAGMA journal_mode").fetchone()[0] == "wal"
+    for index in range(3):
+        assert sqlite_db.run_until_complete(model.put(
+            [RequestData("seq{}".format(index))], "sql_basic", "description", "message"))
+    assert not sqlite_db.run_until_complete(model.put(
+        [RequestData("seq0")], "sql_basic", "description", "message"))
+
+    reports = model.get_upload_report(10)
+    assert len(reports) == 3
+    assert reports[0][:2] == ("sql_basic", "description")
+    assert json.loads(reports[0][2]) == [bench_rasp_result.scan_result]
+
+    model.mark_report(2)
+    assert len(model.get_upload_report(10)) == 1
+    model.mark_report(2)
+    assert model.get_upload_report(10) == []
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import json
+import sqlite3
+
+from core.components import rasp_result
+from core.components.communicator import Communicator
+from core.components.config import Config
+from core.model.stack_model import StackModel
+from core.model.new_request_model import NewRequestModel
+
+import bench_rasp_result
+
+
+def test_strip_stack():
+    """
+    测试调用栈替换为stack_ref, 不修改原数据
+    """
+    data = copy.deepcopy(bench_rasp_result.new_request)
+    data["vuln_hook"] = {"hook_info": copy.deepcopy(data["hook_info"][0])}
+    origin_data = copy.deepcopy(data)
+    stacks = {}
+    result = StackModel.strip_stack(data, stacks)
+    assert data == origin_data
+
+    stack_hash = rasp_result.RaspResult.get_stack_hash(bench_rasp_result.java_stack)
+    assert len(stacks) == 2
+    assert stacks[stack_hash] == bench_rasp_result.java_stack
+    assert result["hook_info"][0]["stack_ref"] == stack_hash
+    assert result["vuln_hook"]["hook_info"]["stack_ref"] == stack_hash
+    for hook_item in result["hook_info"] + [result["vuln_hook"]["hook_info"]]:
+        assert "stack" not in hook_item
+    assert result["context"] is data["context"]
+
+
+def test_stack_storage(sqlite_db, monkeypatch):
+    """
+    测试请求数据中的调用栈单独存储, 领取任务时还原, 相同的调用栈共用同一个list
+    """
+    Communicator().init_new_module("Scanner_0")
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    rasp_result_list = []
+    for index in range(2):
+        data = copy.deepcopy(bench_rasp_result.new_request)
+        data["context"]["path"] = "/path{}".format(index)
+        rasp_result_ins = rasp_result.RaspResult(json.dumps(data))
+        rasp_result_ins.set_hash("hash{}".format(index))
+        rasp_result_list.append(rasp_result_ins)
+    sqlite_db.run_until_complete(model.put_batch(rasp_result_list))
+
+    conn = sqlite3.connect(Config().get_config("database.sqlite_path"))
+    assert conn.execute("SELECT count(*) FROM StackTrace").fetchone()[0] == 2
+    data = conn.execute("SELECT data FROM \"127.0.0.1_8005_ResultList\"").fetchone()[0]
+    data = json.loads(NewRequestModel.CompressedLongTextField().python_value(data))
+    assert [("stack" in item, "stack_ref" in item) for item in data["hook_info"]] == [(False, True)] * 2
+    conn.close()
+
+    # 清除进程内缓存, 从数据库读取调用栈
+    monkeypatch.setattr(StackModel, "stack_cache", None)
+    StackModel(table_prefix="", multiplexing_conn=True)
+    tasks = sqlite_db.run_until_complete(model.get_new_scan(2, 60))
+    hook_list = [item["data"].get_hook_info() for item in tasks]
+    assert hook_list[0] == bench_rasp_result.new_request["hook_info"]
+    assert hook_list[1] == bench_rasp_result.new_request["hook_info"]
+    assert hook_list[0][0]["stack"] is hook_list[1][0]["stack"]
+    assert "stack_ref" not in hook_list[0][0]
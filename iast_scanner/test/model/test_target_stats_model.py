@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import json
+
+from core.components import rasp_result
+from core.components.communicator import Communicator
+from core.model.base_model import BaseModel
+from core.model.target_stats_model import TargetStatsModel
+from core.model.new_request_model import NewRequestModel
+
+import bench_rasp_result
+
+
+def get_rasp_result(index):
+    data = copy.deepcopy(bench_rasp_result.new_request)
+    data["context"]["path"] = "/path{}".format(index)
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(data))
+    rasp_result_ins.set_hash("hash{}".format(index))
+    return rasp_result_ins
+
+
+def test_add_count(sqlite_db):
+    """
+    测试增量更新统计数据, 统计数据不存在时以增量值新建
+    """
+    model = TargetStatsModel(table_prefix="", multiplexing_conn=True)
+    sqlite_db.run_until_complete(model.add_count("127.0.0.1_8005", total=3, scanned=1))
+    model.add_count_sync("127.0.0.1_8005", scanned=1, failed=1)
+    model.add_count_sync("127.0.0.1_8006", scanned=-1)
+    result = BaseModel.get_scan_count(["127.0.0.1_8005", "127.0.0.1_8006", "127.0.0.1_8007"])
+    assert result == {
+        "127.0.0.1_8005": {"total": 3, "scanned": 2, "failed": 1},
+        "127.0.0.1_8006": {"total": 0, "scanned": 0, "failed": 0},
+        "127.0.0.1_8007": {"total": 0, "scanned": 0, "failed": 0}
+    }
+    assert BaseModel.get_last_time(["127.0.0.1_8005"])["127.0.0.1_8005"]["last_time"] > 0
+    assert BaseModel.get_last_time(["127.0.0.1_8006"])["127.0.0.1_8006"]["last_time"] == 0
+    assert model.get_targets() == ["127.0.0.1_8005", "127.0.0.1_8006"]
+
+    model.reset_target("127.0.0.1_8005")
+    model.delete_target("127.0.0.1_8006")
+    assert BaseModel.get_scan_count(["127.0.0.1_8005"])["127.0.0.1_8005"] == {"total": 0, "scanned": 0, "failed": 0}
+    assert model.get_targets() == ["127.0.0.1_8005"]
+
+
+def test_request_stats(sqlite_db):
+    """
+    测试写入和标记请求数据时更新统计数据, 统计数据丢失时从数据表重新统计
+    """
+    Communicator().init_new_module("Scanner_0")
+    model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    sqlite_db.run_until_complete(model.put_batch([get_rasp_result(i) for i in range(4)]))
+    sqlite_db.run_until_complete(model.put(get_rasp_result(0)))
+    tasks = sqlite_db.run_until_complete(model.get_new_scan(3, 60))
+    sqlite_db.run_until_complete(model.mark_result([item["id"] for item in tasks], [tasks[0]["id"]]))
+    stats = {"total": 4, "scanned": 2, "failed": 1}
+    assert BaseModel.get_scan_count(["127.0.0.1_8005"])["127.0.0.1_8005"] == stats
+
+    model.reset_unscanned_item()
+    assert BaseModel.get_scan_count(["127.0.0.1_8005"])["127.0.0.1_8005"] == dict(stats, failed=0)
+
+    TargetStatsModel.get_instance().delete_target("127.0.0.1_8005")
+    TargetStatsModel.get_instance().inited_targets.clear()
+    NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    assert BaseModel.get_scan_count(["127.0.0.1_8005"])["127.0.0.1_8005"] == dict(stats, failed=0)
+
+    model.truncate_table()
+    assert BaseModel.get_scan_count(["127.0.0.1_8005"])["127.0.0.1_8005"] == {"total": 0, "scanned": 0, "failed": 0}
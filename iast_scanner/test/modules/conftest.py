@@ -27,6 +27,7 @@ for item in helper.db_config:
 Config().config_dict["cloud_api.enable"] = False
 Config().config_dict["monitor.schedule_interval"] = 0.1
 Config().config_dict["preprocessor.request_lru_size"] = 1
+Config().config_dict["preprocessor.write_flush_interval"] = 0.1
 Config().config_dict["scanner.max_concurrent_request"] = 5
 Config().config_dict["scanner.min_request_interval"] = 50
 Config().config_dict["scanner.max_request_interval"] = 300
@@ -22,6 +22,7 @@ import time
 import pytest
 
 import helper
+from core.components import rasp_result
 from core.components.config import Config
 from core.components.communicator import Communicator
 
@@ -184,7 +185,7 @@ def test_send_rasp_result_data(preprocessor_fixture):
                 data = Communicator().get_data_nowait("rasp_result_queue_0")
             except Exception:
                 time.sleep(1)
-        assert data.get_request_id() == json_data["context"]["requestId"]
+        assert rasp_result.RaspResult(data).get_request_id() == json_data["context"]["requestId"]
 
 
 def test_send_new_request_data(preprocessor_fixture):
@@ -201,7 +202,7 @@ def test_send_new_request_data(preprocessor_fixture):
         assert json.loads(r1.text)["status"] == 0 and json.loads(
             r2.text)["status"] == 0
 
-        assert helper.get_data_count("www.test-host.com_80_ResultList") == 2
+        assert helper.wait_data_count("www.test-host.com_80_ResultList", 2) == 2
 
 
 def test_send_duplicate_data(preprocessor_fixture):
@@ -217,7 +218,24 @@ def test_send_duplicate_data(preprocessor_fixture):
         assert r1.status_code == 200 and r2.status_code == 200
         assert json.loads(r1.text)["status"] == 0 and json.loads(
             r2.text)["status"] == 0
-        assert helper.get_data_count("www.test-host.com_80_ResultList") == 2
+        assert helper.wait_data_count("www.test-host.com_80_ResultList", 2) == 2
+
+
+def test_send_batch_data(preprocessor_fixture):
+    """
+    测试批量提交json数组
+    """
+    json_data = [http_data["new_request_1"], http_data["invalid"], http_data["new_request_2"]]
+    try:
+        r = http_sender.send_json(json_data, api_path, compress=True)
+    except Exception as e:
+        assert False
+    else:
+        assert r.status_code == 200
+        result = json.loads(r.text)
+        assert result["status"] == 0
+        assert [item["status"] for item in result["results"]] == [0, 1, 0]
+        assert helper.wait_data_count("www.test-host.com_80_ResultList", 2) == 2
 
 
 def test_clean_lru(preprocessor_fixture):
@@ -233,7 +251,7 @@ def test_clean_lru(preprocessor_fixture):
     else:
         assert r.status_code == 200
         assert json.loads(r.text)["status"] == 0
-        assert helper.get_data_count("www.test-host.com_80_ResultList") == 1
+        assert helper.wait_data_count("www.test-host.com_80_ResultList", 1) == 1
 
 # @pytest.mark.test_test
 # def test_passing2(preprocessor_fixture):
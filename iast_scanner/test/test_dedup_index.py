@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from core.modules.preprocessor import DedupIndex
+
+
+def test_mark_preloaded():
+    """
+    测试预加载标记, 仅第一次标记时需要预加载, 分区清空后需要重新加载
+    """
+    dedup_index = DedupIndex(4, 64)
+    assert dedup_index.mark_preloaded("www.test-host.com_80")
+    assert not dedup_index.mark_preloaded("www.test-host.com_80")
+    assert dedup_index.mark_preloaded("www.test-host.com_8080")
+
+    dedup_index.clean_lru("www.test-host.com_80")
+    assert dedup_index.mark_preloaded("www.test-host.com_80")
+
+
+def check_new(dedup_index, host_port, key):
+    """
+    调用check, key不存在于去重表时返回True
+    """
+    try:
+        dedup_index.check(host_port, key)
+    except KeyError:
+        return True
+    return False
+
+
+def test_check_and_delete():
+    """
+    测试去重表的查找、加入和删除
+    """
+    dedup_index = DedupIndex(4, 64)
+    assert check_new(dedup_index, "www.test-host.com_80", "hash_1")
+    assert not check_new(dedup_index, "www.test-host.com_80", "hash_1")
+    dedup_index.delete_key("www.test-host.com_80", "hash_1")
+    assert check_new(dedup_index, "www.test-host.com_80", "hash_1")
+
+    dedup_index.add("www.test-host.com_80", "hash_2")
+    assert not check_new(dedup_index, "www.test-host.com_80", "hash_2")
+
+
+def test_partition_collision():
+    """
+    测试多个扫描目标共用同一分区, 相同的key互不影响
+    """
+    dedup_index = DedupIndex(1, 64)
+    assert check_new(dedup_index, "www.test-host.com_80", "hash_1")
+    assert check_new(dedup_index, "www.test-host.com_8080", "hash_1")
+
+    dedup_index.delete_key("www.test-host.com_80", "hash_1")
+    assert not check_new(dedup_index, "www.test-host.com_8080", "hash_1")
+    assert check_new(dedup_index, "www.test-host.com_80", "hash_1")
+
+    # 同一探测位置的不同指纹存储在后续槽位中
+    dedup_index = DedupIndex(1, 8)
+    key_list = ["hash_{}".format(i) for i in range(8)]
+    for key in key_list:
+        assert check_new(dedup_index, "www.test-host.com_80", key)
+    for key in key_list:
+        assert not check_new(dedup_index, "www.test-host.com_80", key)
+
+
+def test_partition_full():
+    """
+    测试分区写满后覆盖旧指纹, 新加入的key仍可去重, 被覆盖的key回退为不存在
+    """
+    dedup_index = DedupIndex(1, 8)
+    key_list = ["hash_{}".format(i) for i in range(32)]
+    for key in key_list:
+        assert check_new(dedup_index, "www.test-host.com_80", key)
+        assert not check_new(dedup_index, "www.test-host.com_80", key)
+
+    assert 0 not in list(dedup_index.slots)
+    exist_count = 0
+    for key in key_list:
+        if not check_new(dedup_index, "www.test-host.com_80", key):
+            exist_count += 1
+    assert exist_count < len(key_list)
+
+    # 分区写满不影响其他分区
+    dedup_index = DedupIndex(2, 8)
+    host_list = ["host_{}_80".format(i) for i in range(16)]
+    partition_list = [dedup_index._get_partition(host_port) for host_port in host_list]
+    full_host = host_list[0]
+    other_host = host_list[partition_list.index(1 - partition_list[0])]
+    assert check_new(dedup_index, other_host, "hash_other")
+    for key in key_list:
+        dedup_index.add(full_host, key)
+    assert not check_new(dedup_index, other_host, "hash_other")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import select
+import pytest
+import multiprocessing
+
+from core.components import exceptions
+from core.components.communicator import OriQueue
+
+
+def test_put_get():
+    """
+    测试按写入顺序读取, 队列为空时引发QueueEmpty
+    """
+    queue = OriQueue(1024)
+    with pytest.raises(exceptions.QueueEmpty):
+        queue.get_nowait()
+    queue.put(b"data_1")
+    queue.put(b"")
+    queue.put(b"data_3")
+    assert queue.get_nowait() == b"data_1"
+    assert queue.get_nowait() == b""
+    assert queue.get_nowait() == b"data_3"
+    with pytest.raises(exceptions.QueueEmpty):
+        queue.get_nowait()
+
+
+def test_wraparound():
+    """
+    测试数据跨越缓冲区末尾时的写入和读取
+    """
+    queue = OriQueue(30)
+    for i in range(20):
+        data = "{:02d}-abcdefghij".format(i).encode("ascii")
+        queue.put(data)
+        assert queue.get_nowait() == data
+
+    # 长度字段和数据均可能跨越缓冲区末尾
+    for offset in range(1, 8):
+        queue = OriQueue(30)
+        queue.put(b"x" * (26 - offset))
+        queue.get_nowait()
+        queue.put(b"0123456789abcdef")
+        assert queue.get_nowait() == b"0123456789abcdef"
+
+
+def test_full_queue_drop():
+    """
+    测试缓冲区空间不足时引发QueueFull且不写入数据, 读取后可以继续写入
+    """
+    queue = OriQueue(32)
+    queue.put(b"a" * 12)
+    queue.put(b"b" * 8)
+    with pytest.raises(exceptions.QueueFull):
+        queue.put(b"c")
+    assert queue.get_nowait() == b"a" * 12
+    queue.put(b"c" * 12)
+    assert queue.get_nowait() == b"b" * 8
+    assert queue.get_nowait() == b"c" * 12
+    with pytest.raises(exceptions.QueueEmpty):
+        queue.get_nowait()
+
+    with pytest.raises(exceptions.QueueValueError):
+        queue.put(b"d" * 29)
+    with pytest.raises(exceptions.QueueValueError):
+        queue.put("str data")
+
+
+def test_notify_fd():
+    """
+    测试写入后通知fd可读, 清空通知后不可读
+    """
+    queue = OriQueue(64)
+    assert select.select([queue.get_fd()], [], [], 0)[0] == []
+    queue.put(b"data")
+    assert select.select([queue.get_fd()], [], [], 0)[0] == [queue.get_fd()]
+    queue.clear_notify()
+    assert select.select([queue.get_fd()], [], [], 0)[0] == []
+
+
+def _put_data(queue, start, count):
+    for i in range(start, start + count):
+        while True:
+            try:
+                queue.put(str(i).encode("ascii"))
+                break
+            except exceptions.QueueFull:
+                pass
+
+
+def test_multi_process():
+    """
+    测试多个进程同时写入
+    """
+    queue = OriQueue(256)
+    procs = [multiprocessing.Process(target=_put_data, args=(queue, i * 1000, 500)) for i in range(3)]
+    for proc in procs:
+        proc.start()
+    result = []
+    while len(result) < 1500:
+        result.append(int(queue.get()))
+    for proc in procs:
+        proc.join(10)
+    assert sorted(result) == [i * 1000 + j for i in range(3) for j in range(500)]
+    # 同一进程写入的数据保持顺序
+    for i in range(3):
+        assert [item for item in result if item // 1000 == i] == list(range(i * 1000, i * 1000 + 500))
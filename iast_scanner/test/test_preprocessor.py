@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import gzip
+import json
+import zlib
+import pytest
+import psutil
+import socket
+import sqlite3
+import aiohttp
+import tornado.netutil
+import tornado.httpserver
+
+import helper
+import bench_rasp_result
+from core import modules
+from core.components import exceptions
+from core.components import rasp_result
+from core.components.config import Config
+from core.components.communicator import Communicator
+from core.model.new_request_model import NewRequestModel
+from core.modules.preprocessor import DedupIndex
+from core.modules.preprocessor import ResultStorage
+from core.modules.preprocessor import Preprocessor
+from core.modules.preprocessor import jsonHandler
+
+
+def get_request(index):
+    data = copy.deepcopy(bench_rasp_result.new_request)
+    data["context"]["path"] = "/path{}".format(index)
+    data["context"]["url"] = "http://192.168.1.10:8080/path{}".format(index)
+    return data
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_data_count(sqlite_path, table_name):
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        return conn.execute("SELECT count(*) FROM \"{}\"".format(table_name)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_stop_http_server(tmp_path, monkeypatch):
+    """
+    测试停止http服务进程时, 缓冲区中未达到写入阈值的新请求写入数据库
+    """
+    port = get_free_port()
+    sqlite_path = str(tmp_path / "iast.db")
+    for key, value in {
+        "database.engine": "sqlite",
+        "database.sqlite_path": sqlite_path,
+        "preprocessor.http_port": port,
+        "preprocessor.process_num": 1,
+        "preprocessor.write_batch_size": 1000,
+        "preprocessor.write_flush_interval": 60,
+        "log.path": str(tmp_path)
+    }.items():
+        monkeypatch.setitem(Config().config_dict, key, value)
+    Communicator()
+    module_proc = modules.Process(modules.Preprocessor)
+    module_proc.start()
+    try:
+        http_sender = helper.HttpSender("127.0.0.1", port)
+        api_path = Config().get_config("preprocessor.api_path")
+        assert http_sender.test_connect(api_path).status_code == 200
+        for index in range(3):
+            r = http_sender.send_json(get_request(index), api_path)
+            assert json.loads(r.text)["status"] == 0
+        assert module_proc.pid in Communicator().get_pre_http_pid()
+
+        # 测试进程是http服务进程的父进程, 退出状态由stop_http_server回收
+        Preprocessor.stop_http_server(10)
+        assert not psutil.pid_exists(module_proc.pid)
+        assert get_data_count(sqlite_path, "192.168.1.10_8080_ResultList") == 3
+    finally:
+        if psutil.pid_exists(module_proc.pid):
+            module_proc.kill()
+
+
+def test_flush_retry(sqlite_db, monkeypatch):
+    """
+    测试批量写入失败时保留缓冲数据重试, 超出重试次数后丢弃并从去重表删除
+    """
+    monkeypatch.setitem(Config().config_dict, "preprocessor.write_batch_size", 2)
+    monkeypatch.setitem(Config().config_dict, "preprocessor.write_retry_times", 2)
+    monkeypatch.setitem(Config().config_dict, "preprocessor.dedup_preload_size", 0)
+    Communicator().init_new_module("Preprocessor")
+    dedup_lru = DedupIndex(1, 100)
+    storage = ResultStorage(dedup_lru)
+    host_port = "192.168.1.10_8080"
+
+    def put(index):
+        rasp_result_ins = rasp_result.RaspResult(json.dumps(get_request(index)))
+        rasp_result_ins.set_hash("hash{}".format(index))
+        dedup_lru.add(host_port, rasp_result_ins.get_hash())
+        sqlite_db.run_until_complete(storage.put(rasp_result_ins))
+
+    async def put_batch_error(self, rasp_result_list):
+        raise exceptions.DatabaseError
+
+    put_batch = NewRequestModel.put_batch
+    monkeypatch.setattr(NewRequestModel, "put_batch", put_batch_error)
+    put(0)
+    put(1)
+    assert len(storage.pending[host_port]) == 2
+    assert storage.retry_count[host_port] == 1
+    # 等待重试时达到写入阈值不立即写入
+    put(2)
+    assert len(storage.pending[host_port]) == 3
+
+    # 重试成功后写入全部数据
+    monkeypatch.setattr(NewRequestModel, "put_batch", put_batch)
+    sqlite_db.run_until_complete(storage.flush_all())
+    assert storage.pending == {}
+    assert storage.retry_count == {}
+    model = NewRequestModel(host_port, multiplexing_conn=True)
+    assert sqlite_db.run_until_complete(model.get_scan_count()) == (3, 0, 0)
+
+    # 超出重试次数后丢弃
+    monkeypatch.setattr(NewRequestModel, "put_batch", put_batch_error)
+    put(3)
+    put(4)
+    sqlite_db.run_until_complete(storage.flush_all())
+    assert len(storage.pending[host_port]) == 2
+    sqlite_db.run_until_complete(storage.flush_all())
+    assert storage.pending == {}
+    assert storage.retry_count == {}
+    for index in (3, 4):
+        try:
+            dedup_lru.check(host_port, "hash{}".format(index))
+        except KeyError:
+            pass
+        else:
+            assert False
+
+
+def test_send_data_too_large():
+    """
+    测试超过队列大小的扫描请求结果被丢弃并计入dropped_scan_result
+    """
+    Communicator().init_new_module("Preprocessor")
+    queue = Communicator().queues["rasp_result_queue_0"]
+    handler = jsonHandler.__new__(jsonHandler)
+    dropped = Communicator().get_value("dropped_scan_result")
+    invalid = Communicator().get_value("invalid_data")
+    handler.send_data("0-5f0a2b8c", b"x" * (queue.size + 1))
+    assert Communicator().get_value("dropped_scan_result") == dropped + 1
+    assert Communicator().get_value("invalid_data") == invalid
+    with pytest.raises(exceptions.QueueEmpty):
+        queue.get_nowait()
+
+
+@pytest.fixture
+def http_server(sqlite_db):
+    """
+    在测试进程内启动预处理模块的http服务
+
+    Returns:
+        tuple, (事件循环, Preprocessor实例, 接口url)
+    """
+    Communicator().init_new_module("Preprocessor")
+    preprocessor = Preprocessor()
+    server = tornado.httpserver.HTTPServer(preprocessor.app)
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+    server.add_sockets(sockets)
+    url = "http://127.0.0.1:{}{}".format(
+        sockets[0].getsockname()[1], Config().get_config("preprocessor.api_path"))
+
+    yield sqlite_db, preprocessor, url
+
+    server.stop()
+
+
+def post(http_server, data, content_type="application/json", content_encoding=None):
+    loop, preprocessor, url = http_server
+    headers = {"Content-Type": content_type}
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+
+    async def request():
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, data=data, headers=headers) as response:
+                assert response.status == 200
+                return json.loads(await response.text())
+    return loop.run_until_complete(request())
+
+
+def get_result_count(http_server):
+    loop, preprocessor, url = http_server
+    loop.run_until_complete(preprocessor.new_request_storage.flush_all())
+    model = NewRequestModel("192.168.1.10_8080", multiplexing_conn=True)
+    return loop.run_until_complete(model.get_scan_count())[0]
+
+
+def test_post_batch_ndjson(http_server):
+    """
+    测试按行拆分ndjson格式的批量数据, 忽略空行
+    """
+    data = b"\n".join(json.dumps(get_request(index)).encode("utf-8") for index in range(3)) + b"\n\n"
+    result = post(http_server, data, "application/x-ndjson")
+    assert result["status"] == 0
+    assert result["results"] == [{"status": 0, "msg": "ok"}] * 3
+    assert get_result_count(http_server) == 3
+
+
+def test_post_batch_array(http_server):
+    """
+    测试json数组格式的批量数据, 以及gzip/deflate压缩的请求body
+    """
+    data = json.dumps([get_request(index) for index in range(2)]).encode("utf-8")
+    result = post(http_server, gzip.compress(data), content_encoding="gzip")
+    assert result["results"] == [{"status": 0, "msg": "ok"}] * 2
+
+    data = b"\n".join(json.dumps(get_request(index)).encode("utf-8") for index in range(2, 4))
+    result = post(http_server, zlib.compress(data), "application/x-ndjson", "deflate")
+    assert result["results"] == [{"status": 0, "msg": "ok"}] * 2
+
+    # 单条数据
+    result = post(http_server, zlib.compress(json.dumps(get_request(4)).encode("utf-8")), content_encoding="deflate")
+    assert result["status"] == 0 and "results" not in result
+    assert get_result_count(http_server) == 5
+
+    # 解压失败和json数组解析失败时整个请求无效
+    assert post(http_server, b"not gzip", content_encoding="gzip")["status"] == 1
+    assert post(http_server, b"[{\"a\": 1},")["status"] == 1
+    assert get_result_count(http_server) == 5
+
+
+def test_post_batch_item_error(http_server, monkeypatch):
+    """
+    测试批量数据中单条数据无效或处理出错时, 在对应位置返回错误状态, 不影响其他数据
+    """
+    dedup_data = jsonHandler.dedup_data
+
+    async def dedup_data_error(self, rasp_result_ins):
+        if rasp_result_ins.get_path() == "/path1":
+            raise RuntimeError
+        await dedup_data(self, rasp_result_ins)
+
+    monkeypatch.setattr(jsonHandler, "dedup_data", dedup_data_error)
+    invalid = Communicator().get_value("invalid_data")
+    data = b"\n".join([
+        json.dumps(get_request(0)).encode("utf-8"),
+        b"{\"context\": ",
+        json.dumps(get_request(1)).encode("utf-8"),
+        json.dumps(get_request(2)).encode("utf-8")
+    ])
+    result = post(http_server, data, "application/x-ndjson")
+    assert [item["status"] for item in result["results"]] == [0, 1, 2, 0]
+    assert Communicator().get_value("invalid_data") == invalid + 1
+    assert get_result_count(http_server) == 2
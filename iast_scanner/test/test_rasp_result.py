@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import json
+import pytest
+
+from core.components import exceptions
+from core.components import rasp_result
+
+
+rasp_result_data = {
+    "web_server": {
+        "host": "www.test-host.com",
+        "port": 80
+    },
+    "context": {
+        "requestId": "kci13",
+        "json": {},
+        "server": {
+            "language": "java",
+            "name": "Tomcat",
+            "version": "8",
+            "os": "Linux"
+        },
+        "body": "",
+        "appBasePath": "/var/www/html",
+        "remoteAddr": "172.17.0.1",
+        "protocol": "http/1.1",
+        "method": "get",
+        "querystring": "a=1",
+        "path": "/cmd.jsp",
+        "parameter": {"a": ["1"]},
+        "header": {
+            "host": "www.test-host.com:80"
+        },
+        "url": "http://www.test-host.com/cmd.jsp",
+        "nic": [
+            {
+                "name": "eth0",
+                "ip": "172.17.0.2"
+            }
+        ],
+        "hostname": "server_host_name"
+    },
+    "hook_info": []
+}
+
+
+def test_fast_mode():
+    """
+    测试非严格模式下的字段检查
+    """
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(rasp_result_data), strict=False)
+    assert rasp_result_ins.get_path() == "/cmd.jsp"
+
+    # context中的非必要结构在首次读取时检查
+    data = copy.deepcopy(rasp_result_data)
+    data["context"]["path"] = 1
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(data), strict=False)
+    assert rasp_result_ins.get_request_id() == "kci13"
+    with pytest.raises(exceptions.ResultInvalid):
+        rasp_result_ins.get_path()
+
+    data = copy.deepcopy(rasp_result_data)
+    del data["context"]["header"]
+    with pytest.raises(exceptions.ResultInvalid):
+        rasp_result.RaspResult(json.dumps(data), strict=False)
+
+
+def test_strict_mode():
+    """
+    测试严格模式下的json schema校验
+    """
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(rasp_result_data), strict=True)
+    assert rasp_result_ins.get_path() == "/cmd.jsp"
+
+    data = copy.deepcopy(rasp_result_data)
+    del data["context"]["nic"]
+    with pytest.raises(exceptions.ResultInvalid):
+        rasp_result.RaspResult(json.dumps(data), strict=True)
+
+
+def test_raw_scan_request_id():
+    """
+    测试在原始数据中查找scan-request-id, 请求body中的同名key不应被当作scan-request-id
+    """
+    data = copy.deepcopy(rasp_result_data)
+    assert rasp_result.RaspResult.get_raw_scan_request_id(json.dumps(data).encode("utf-8")) == ""
+
+    data["context"]["header"]["scan-request-id"] = "1-5f0a2b8c"
+    assert rasp_result.RaspResult.get_raw_scan_request_id(json.dumps(data).encode("utf-8")) == "1-5f0a2b8c"
+
+    # json body中包含scan-request-id, 且在原始数据中位于header之前
+    del data["context"]["json"]
+    data["context"] = dict([("json", {"scan-request-id": "0-abc"})] + list(data["context"].items()))
+    raw_result = json.dumps(data).encode("utf-8")
+    assert 0 <= raw_result.find(b"0-abc") < raw_result.find(b"1-5f0a2b8c")
+    assert rasp_result.RaspResult.get_raw_scan_request_id(raw_result) == "1-5f0a2b8c"
+    assert "1-5f0a2b8c" in rasp_result.RaspResult.get_raw_scan_request_id_list(raw_result)
+
+    # 普通请求的json body中包含scan-request-id
+    del data["context"]["header"]["scan-request-id"]
+    assert rasp_result.RaspResult.get_raw_scan_request_id(json.dumps(data).encode("utf-8")) == ""
+
+
+def test_raw_scan_request_id_no_parse(monkeypatch):
+    """
+    测试原始数据中只有header中的scan-request-id时不解析json
+    """
+    data = copy.deepcopy(rasp_result_data)
+    data["context"]["header"]["scan-request-id"] = "1-5f0a2b8c"
+    raw_result = json.dumps(data).encode("utf-8")
+    data_with_body = copy.deepcopy(data)
+    data_with_body["context"]["json"] = {"scan-request-id": "0-abc"}
+    raw_result_with_body = json.dumps(data_with_body).encode("utf-8")
+
+    def loads_error(*args, **kwargs):
+        raise AssertionError("json parsed")
+
+    monkeypatch.setattr(rasp_result.json, "loads", loads_error)
+    assert rasp_result.RaspResult.get_raw_scan_request_id(raw_result) == "1-5f0a2b8c"
+    assert rasp_result.RaspResult.get_raw_scan_request_id(json.dumps(rasp_result_data).encode("utf-8")) == ""
+    with pytest.raises(AssertionError):
+        rasp_result.RaspResult.get_raw_scan_request_id(raw_result_with_body)
+
+    # header的值中包含花括号时解析json确认
+    monkeypatch.undo()
+    data["context"]["header"]["cookie"] = "a={}"
+    raw_result = json.dumps(data).encode("utf-8")
+    assert rasp_result.RaspResult.get_raw_scan_request_id(raw_result) == "1-5f0a2b8c"
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gc
+import copy
+import json
+
+from core.components import rasp_result
+from core.components.audit_tools.request_data import RequestData
+from core.components.audit_tools.mutant_helper import MutantHelper
+
+
+rasp_result_data = {
+    "web_server": {
+        "host": "www.test-host.com",
+        "port": 80
+    },
+    "context": {
+        "requestId": "kci13",
+        "json": {},
+        "server": {
+            "language": "java",
+            "name": "Tomcat",
+            "version": "8",
+            "os": "Linux"
+        },
+        "body": b"orignal".hex(),
+        "appBasePath": "/var/www/html",
+        "remoteAddr": "172.17.0.1",
+        "protocol": "http/1.1",
+        "method": "post",
+        "querystring": "a=1",
+        "path": "/cmd.jsp",
+        "parameter": {"a": ["1"]},
+        "header": {
+            "host": "www.test-host.com:80",
+            "content-type": "text/plain",
+            "cookie": "session=abc"
+        },
+        "url": "http://www.test-host.com/cmd.jsp",
+        "nic": [
+            {
+                "name": "eth0",
+                "ip": "172.17.0.2"
+            }
+        ],
+        "hostname": "server_host_name"
+    },
+    "hook_info": []
+}
+
+
+def get_rasp_result(data=rasp_result_data):
+    return rasp_result.RaspResult(json.dumps(data), strict=False)
+
+
+def test_params_list_cache_after_set_body():
+    """
+    测试修改body后不使用同一任务共用的参数列表缓存
+    """
+    rasp_result_ins = get_rasp_result()
+    mutant_helper = MutantHelper()
+
+    request_data = RequestData(rasp_result_ins)
+    request_data.set_param("body", "", b"MUTATED")
+    assert not request_data.is_template()
+    params_list = mutant_helper.get_params_list(request_data, ["body"])
+    assert params_list == [{"type": "body", "name": "body", "value": b"MUTATED"}]
+
+    params_list = mutant_helper.get_params_list(RequestData(rasp_result_ins), ["body"])
+    assert params_list == [{"type": "body", "name": "body", "value": b"orignal"}]
+
+
+def test_raw_response_body_marker():
+    """
+    测试未读取或被截断的响应body在raw response中注明
+    """
+    request_data = RequestData(get_rasp_result())
+    response = {"status": 200, "headers": {"Server": "test"}, "body": b"", "body_read": True, "body_truncated": False}
+    request_data.set_response(response)
+    assert request_data.get_raw_response() == "HTTP Code:200\r\nServer: test\r\n\r\n"
+
+    request_data.set_response(dict(response, body_read=False))
+    assert request_data.get_raw_response().endswith("\r\n\r\n[body not read]")
+
+    request_data.set_response(dict(response, body=b"abcd", body_truncated=True))
+    assert request_data.get_raw_response().endswith("\r\n\r\nabcd\r\n[truncated at 4 bytes]")
+
+
+def test_mutants_isolation():
+    """
+    测试同一RaspResult的多个RequestData修改参数时互不影响, 不修改模板
+    """
+    rasp_result_ins = get_rasp_result()
+    request_data = RequestData(rasp_result_ins)
+    other_request_data = RequestData(rasp_result_ins)
+    assert request_data.http_data["headers"] is other_request_data.http_data["headers"]
+
+    request_data.set_param("get", "a", "2")
+    request_data.set_param("get", "b", "3")
+    request_data.set_param("headers", "x-test", "test")
+    request_data.set_param("cookies", "session", "a b")
+    request_data.delete_param("headers", "host")
+    request_data.gen_scan_request_id()
+    request_data.set_param("body", "", b"MUTATED")
+    assert not request_data.is_template()
+    assert request_data.get_param("get", "a") == "2"
+    assert request_data.get_param("cookies", "session") == "a%20b"
+    assert request_data.get_param("headers", "host") is None
+    assert request_data.get_param("headers", "scan-request-id") is not None
+
+    assert other_request_data.is_template()
+    assert other_request_data.http_data["params"] == {"a": "1"}
+    assert other_request_data.http_data["cookies"] == {"session": "abc"}
+    assert other_request_data.http_data["headers"] == {
+        "host": "www.test-host.com:80",
+        "content-type": "text/plain"
+    }
+    assert other_request_data.get_param("body", "") == b"orignal"
+    assert RequestData(rasp_result_ins).http_data == other_request_data.http_data
+
+
+def test_mutants_isolation_json_files():
+    """
+    测试json和files参数的修改不影响同一RaspResult的其他RequestData
+    """
+    data = copy.deepcopy(rasp_result_data)
+    data["context"]["header"]["content-type"] = "application/json"
+    data["context"]["json"] = {"user": {"name": "test", "id": [1, 2]}}
+    rasp_result_ins = get_rasp_result(data)
+    request_data = RequestData(rasp_result_ins)
+    request_data.set_param("json", ["user", "name"], "MUTATED")
+    request_data.get_param("json", ["user", "id"]).append(3)
+    assert RequestData(rasp_result_ins).get_param("json", ["user"]) == {"name": "test", "id": [1, 2]}
+    request_data.set_param("json", [], {"root": 1})
+    assert RequestData(rasp_result_ins).get_param("json", ["user", "name"]) == "test"
+
+    data = copy.deepcopy(rasp_result_data)
+    data["context"]["header"]["content-type"] = "multipart/form-data; boundary=xxx"
+    data["hook_info"] = [{"hook_type": "fileUpload", "name": "file", "filename": "a.txt", "content": "abc"}]
+    rasp_result_ins = get_rasp_result(data)
+    request_data = RequestData(rasp_result_ins)
+    request_data.set_param("files", [0, "filename"], "b.php")
+    request_data.set_param("files", [0, "content"], b"MUTATED")
+    other_request_data = RequestData(rasp_result_ins)
+    assert other_request_data.get_param("files", [0, "filename"]) == "a.txt"
+    assert other_request_data.get_param("files", [0, "content"]) == b"abc"
+
+
+def test_template_release():
+    """
+    测试RaspResult释放后请求模板和模板缓存随之清除
+    """
+    rasp_result_ins = get_rasp_result()
+    template_count = len(RequestData._templates)
+    request_data = RequestData(rasp_result_ins)
+    request_data.get_template_cache()["key"] = "value"
+    assert RequestData(rasp_result_ins).get_template_cache() == {"key": "value"}
+    assert len(RequestData._templates) == template_count + 1
+
+    del request_data
+    del rasp_result_ins
+    gc.collect()
+    assert len(RequestData._templates) == template_count
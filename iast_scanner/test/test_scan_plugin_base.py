@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import asyncio
+import pytest
+
+import bench_rasp_result
+from core.components import exceptions
+from core.components import rasp_result
+from core.components.plugin import scan_plugin_base
+from core.components.communicator import Communicator
+from plugin.scanner import sql_basic
+
+
+class FakeSession(object):
+    """
+    记录发送的请求, 返回固定response的Session
+    """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+
+    async def send_request(self, request_data, proxy_url=None, read_body=True):
+        self.requests.append((request_data.get_param("headers", "scan-request-id"), read_body))
+        if self.fail:
+            raise exceptions.ScanRequestFailed
+        return {
+            "status": 200,
+            "headers": {"Server": "test"},
+            "body": b"response body" if read_body else b"",
+            "body_read": read_body,
+            "body_truncated": False
+        }
+
+
+class FakeReportModel(object):
+
+    def __init__(self):
+        self.reports = []
+
+    async def put(self, request_data_list, plugin_name, description, message):
+        self.reports.append([request_data.get_rasp_result().get_response() for request_data in request_data_list])
+        return True
+
+
+@pytest.fixture
+def plugin():
+    """
+    初始化未读取响应body的扫描插件
+
+    Returns:
+        插件实例
+    """
+    Communicator().init_new_module("Monitor")
+    Communicator().set_internal_shared("report_model", FakeReportModel())
+    Communicator().set_internal_shared("failed_task_set", set())
+    plugin = sql_basic.ScanPlugin()
+    assert not plugin.need_response_body
+    plugin._request_session = FakeSession()
+    return plugin
+
+
+def get_request_data(plugin):
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(bench_rasp_result.new_request))
+    request_data = plugin.new_request_data(rasp_result_ins, "seq")
+    request_data.gen_scan_request_id()
+    request_data.set_rasp_result(rasp_result.RaspResult(json.dumps(bench_rasp_result.scan_result)))
+    return request_data
+
+
+def test_report_read_body(plugin):
+    """
+    测试不读取响应body的插件在写入漏洞报告时重新发送请求获取body
+    """
+    loop = asyncio.new_event_loop()
+    request_data = get_request_data(plugin)
+    scan_request_id = request_data.get_param("headers", "scan-request-id")
+    request_data.set_response(loop.run_until_complete(
+        plugin._request_session.send_request(request_data, read_body=False)))
+    assert request_data.get_raw_response().endswith("[body not read]")
+
+    assert loop.run_until_complete(plugin.report([request_data], "message"))
+    assert len(plugin._request_session.requests) == 2
+    resend_id, read_body = plugin._request_session.requests[1]
+    assert read_body and resend_id != scan_request_id
+    assert plugin._report_model.reports[0][0].endswith("\r\n\r\nresponse body")
+    # 报告中的请求为原请求
+    assert scan_request_id in request_data.get_rasp_result().get_request()
+
+    # 已读取body时不重新发送
+    assert loop.run_until_complete(plugin.report([request_data], "message"))
+    assert len(plugin._request_session.requests) == 2
+    loop.close()
+
+
+def test_report_read_body_failed(plugin):
+    """
+    测试重新发送请求失败时使用原response写入报告
+    """
+    loop = asyncio.new_event_loop()
+    request_data = get_request_data(plugin)
+    request_data.set_response(loop.run_until_complete(
+        plugin._request_session.send_request(request_data, read_body=False)))
+    plugin._request_session.fail = True
+    assert loop.run_until_complete(plugin.report([request_data], "message"))
+    assert plugin._report_model.reports[0][0].endswith("[body not read]")
+    loop.close()
+
+
+def test_finish_task_out_of_order(plugin, monkeypatch):
+    """
+    测试任务乱序完成时_last_scan_id只推进到连续完成的最大id, 失败的任务记录到failed_task_set
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task_events = {task_id: asyncio.Event() for task_id in (1, 2, 3)}
+
+    async def scan(task_id, rasp_result_ins):
+        await task_events[task_id].wait()
+        if task_id == 2:
+            scan_plugin_base.current_task_state.get()["failed"] = True
+
+    monkeypatch.setattr(plugin, "_scan", scan)
+    task_semaphore = asyncio.Semaphore(3)
+    running_tasks = []
+    for task_id in (1, 2, 3):
+        loop.run_until_complete(task_semaphore.acquire())
+        plugin._running_task_ids[task_id] = False
+        running_tasks.append(loop.create_task(plugin._run_task({"id": task_id, "data": None}, task_semaphore)))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert plugin.get_pending_num() == 3
+
+    def finish(task_id):
+        task_events[task_id].set()
+        loop.run_until_complete(asyncio.sleep(0.01))
+        return plugin.get_scan_progress()
+
+    assert finish(3) == (1, 0)
+    assert finish(1) == (2, 1)
+    assert finish(2) == (3, 3)
+    assert plugin.get_pending_num() == 0
+    assert plugin.pop_finished_tasks() == [(3, False, True), (1, False, True), (2, True, True)]
+    assert plugin._failed_set == {2}
+    assert all(task.done() for task in running_tasks)
+    assert not task_semaphore.locked()
+
+    # 插件未启用时任务不执行扫描, 同样推进进度
+    plugin.set_enable(False)
+    plugin._running_task_ids[4] = False
+    loop.run_until_complete(task_semaphore.acquire())
+    loop.run_until_complete(plugin._run_task({"id": 4, "data": None}, task_semaphore))
+    assert plugin.get_scan_progress() == (4, 4)
+    assert plugin.pop_finished_tasks() == [(4, False, False)]
+    loop.close()
+    asyncio.set_event_loop(None)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import copy
+import json
+import select
+import asyncio
+import pytest
+
+import bench_rasp_result
+from core.modules import scanner
+from core.components import rasp_result
+from core.components import result_receiver
+from core.components.communicator import Communicator, OriQueue
+from core.model.new_request_model import NewRequestModel
+
+
+class FakePlugin(object):
+    """
+    记录分发的任务, 完成任务由测试直接写入finished_tasks的扫描插件
+    """
+
+    def __init__(self, enable=True):
+        self.enable = enable
+        self.tasks = []
+        self.finished_tasks = []
+
+    def get_enable(self):
+        return self.enable
+
+    def add_task(self, task):
+        self.tasks.append(task)
+
+    def get_pending_num(self):
+        return len(self.tasks)
+
+    def pop_finished_tasks(self):
+        finished_tasks = self.finished_tasks
+        self.finished_tasks = []
+        return finished_tasks
+
+
+def get_scanner(plugin_num=2):
+    """
+    不连接数据库、不加载插件, 创建只包含调度状态的Scanner实例
+
+    Parameters:
+        plugin_num - int, 插件数量, 第i个插件的bit为1 << i
+
+    Returns:
+        Scanner实例
+    """
+    Communicator().init_new_module("Scanner_0")
+    scanner_ins = scanner.Scanner.__new__(scanner.Scanner)
+    scanner_ins.module_id = "0"
+    scanner_ins.scan_config = {"version": Communicator().get_value("config_version")}
+    scanner_ins.failed_task_set = set()
+    scanner_ins.task_finish_event = asyncio.Event()
+    scanner_ins.plugin_loaded = {}
+    scanner_ins.plugin_bit = {}
+    scanner_ins.full_mask = 0
+    for i in range(plugin_num):
+        plugin_name = "plugin_{}".format(i)
+        scanner_ins.plugin_loaded[plugin_name] = FakePlugin()
+        scanner_ins.plugin_bit[plugin_name] = 1 << i
+        scanner_ins.full_mask |= 1 << i
+    scanner_ins._init_fetch_state()
+    return scanner_ins
+
+
+def get_rasp_result(index):
+    data = copy.deepcopy(bench_rasp_result.new_request)
+    data["context"]["path"] = "/path{}".format(index)
+    data["context"]["url"] = "http://127.0.0.1:8005/path{}".format(index)
+    rasp_result_ins = rasp_result.RaspResult(json.dumps(data))
+    rasp_result_ins.set_hash("hash{}".format(index))
+    return rasp_result_ins
+
+
+@pytest.fixture
+def result_queue(monkeypatch):
+    """
+    替换扫描模块读取的结果队列, 记录发送给RaspResultReceiver的数据
+
+    Returns:
+        tuple, (队列, 接收到的数据list)
+    """
+    queue = OriQueue(1024)
+    received = []
+
+    def add_raw_result(self, data):
+        received.append(data)
+        if data == b"error":
+            raise ValueError
+
+    Communicator().init_new_module("Scanner_0")
+    monkeypatch.setitem(Communicator().queues, "rasp_result_queue_0", queue)
+    monkeypatch.setattr(result_receiver.RaspResultReceiver, "add_raw_result", add_raw_result)
+    return queue, received
+
+
+def test_drain_queue(result_queue):
+    """
+    测试一次读取队列中的全部数据并清空通知fd, 单条数据处理出错不影响后续数据
+    """
+    queue, received = result_queue
+    scanner_ins = get_scanner()
+    for data in (b"data_1", b"error", b"data_3"):
+        queue.put(data)
+    assert select.select([queue.get_fd()], [], [], 0)[0]
+
+    scanner_ins._drain_queue("rasp_result_queue_0")
+    assert received == [b"data_1", b"error", b"data_3"]
+    assert not select.select([queue.get_fd()], [], [], 0)[0]
+
+    scanner_ins._drain_queue("rasp_result_queue_0")
+    assert len(received) == 3
+
+
+def test_fetch_from_queue(result_queue):
+    """
+    测试监听前已写入的数据立即读取, 之后写入的数据由通知fd触发读取, 无需等待轮询间隔
+    """
+    queue, received = result_queue
+    scanner_ins = get_scanner()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    queue.put(b"data_1")
+    fetch_task = loop.create_task(scanner_ins._fetch_from_queue())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert received == [b"data_1"]
+
+    loop.call_soon(queue.put, b"data_2")
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert received == [b"data_1", b"data_2"]
+
+    fetch_task.cancel()
+    loop.run_until_complete(asyncio.wait({fetch_task}))
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def test_plugin_rate(monkeypatch):
+    """
+    测试插件扫描速度按指数加权移动平均更新, 统计间隔不足rate_interval时不更新
+    """
+    now = 1000.0
+    monkeypatch.setattr(scanner.time, "time", lambda: now)
+    scanner_ins = get_scanner()
+    plugin = scanner_ins.plugin_loaded["plugin_0"]
+
+    plugin.finished_tasks = [(i, False, True) for i in range(10)]
+    now += 0.1
+    scanner_ins._collect_scan_progress()
+    assert scanner_ins.plugin_rate["plugin_0"] == 0
+
+    now += 0.9
+    scanner_ins._collect_scan_progress()
+    assert scanner_ins.plugin_rate["plugin_0"] == pytest.approx(0.3 * 10)
+    assert scanner_ins.plugin_rate["plugin_1"] == 0
+
+    plugin.finished_tasks = [(i, False, True) for i in range(10, 30)]
+    now += 1
+    scanner_ins._collect_scan_progress()
+    assert scanner_ins.plugin_rate["plugin_0"] == pytest.approx(0.3 * 20 + 0.7 * 3)
+
+
+def test_prefetch_count():
+    """
+    测试预取数量按最快的已启用插件速度计算, 缓冲区超过一半时不预取, 并受内存中任务数量上限约束
+    """
+    scanner_ins = get_scanner()
+    scanner_ins.task_memory_limit = 1000 * scanner_ins.task_size
+    assert scanner_ins._get_prefetch_count() == scanner_ins.fetch_min * 2
+
+    scanner_ins.task_buffer.extend({"id": i} for i in range(20))
+    assert scanner_ins._get_prefetch_count() == 0
+    scanner_ins.task_buffer.pop()
+    assert scanner_ins._get_prefetch_count() == 21
+
+    # 缓冲区目标大小为最快插件fetch_lookahead秒扫描量的两倍, 未启用的插件不参与计算
+    scanner_ins.plugin_rate["plugin_0"] = 50
+    scanner_ins.plugin_rate["plugin_1"] = 500
+    scanner_ins.plugin_loaded["plugin_1"].enable = False
+    assert scanner_ins._get_prefetch_count() == 50 * 2 * 2 - 19
+
+    # 内存中的任务包括缓冲区中和已分发未完成的任务
+    scanner_ins.task_memory_limit = 100 * scanner_ins.task_size
+    scanner_ins.task_mask = dict.fromkeys(range(100, 170), 0)
+    assert scanner_ins._get_prefetch_count() == 100 - 70 - 19
+    scanner_ins.task_mask = dict.fromkeys(range(100, 181), 0)
+    assert scanner_ins._get_prefetch_count() == 0
+
+
+def test_prefetch_task(sqlite_db):
+    """
+    测试预取协程从数据库获取任务放入缓冲区, 通知分发并更新任务大小的估计值
+    """
+    scanner_ins = get_scanner()
+    scanner_ins.new_scan_model = NewRequestModel("127.0.0.1_8005", multiplexing_conn=True)
+    sqlite_db.run_until_complete(scanner_ins.new_scan_model.put_batch([get_rasp_result(i) for i in range(30)]))
+
+    prefetch_task = sqlite_db.create_task(scanner_ins._prefetch_task())
+    sqlite_db.run_until_complete(asyncio.wait_for(scanner_ins.task_finish_event.wait(), 5))
+    assert [item["id"] for item in scanner_ins.task_buffer] == list(range(1, 31))
+    item_size = scanner_ins.task_buffer[0]["size"]
+    assert scanner_ins.task_size != 4096
+    assert abs(scanner_ins.task_size - item_size) < abs(4096 - item_size)
+
+    prefetch_task.cancel()
+    sqlite_db.run_until_complete(asyncio.wait({prefetch_task}))
+
+
+def test_dispatch_task():
+    """
+    测试任务只分发给未完成的插件, 已在执行中的任务不重复分发, 已全部完成的任务直接标记
+    """
+    scanner_ins = get_scanner(3)
+    plugins = [scanner_ins.plugin_loaded["plugin_{}".format(i)] for i in range(3)]
+
+    scanner_ins._dispatch_task({"id": 1, "plugin_mask": 0})
+    assert [len(plugin.tasks) for plugin in plugins] == [1, 1, 1]
+    assert scanner_ins.task_mask == {1: 0}
+
+    # 租约过期后重新领取的执行中任务
+    scanner_ins._dispatch_task({"id": 1, "plugin_mask": 0b010})
+    assert [len(plugin.tasks) for plugin in plugins] == [1, 1, 1]
+    assert scanner_ins.task_mask == {1: 0}
+
+    scanner_ins._dispatch_task({"id": 2, "plugin_mask": 0b101})
+    assert [len(plugin.tasks) for plugin in plugins] == [1, 2, 1]
+    assert scanner_ins.task_mask == {1: 0, 2: 0b101}
+
+    # 已删除插件的bit不影响判断
+    scanner_ins._dispatch_task({"id": 3, "plugin_mask": 0b1111})
+    assert [len(plugin.tasks) for plugin in plugins] == [1, 2, 1]
+    assert 3 not in scanner_ins.task_mask
+    assert scanner_ins.finished_list == [3]
+
+    # 各插件完成后任务从task_mask移除
+    plugins[1].finished_tasks = [(2, False, True)]
+    scanner_ins._collect_scan_progress()
+    assert 2 not in scanner_ins.task_mask
+    assert scanner_ins.finished_list == [3, 2]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+"""
+Copyright 2017-2020 Baidu Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import pytest
+from aiohttp import web
+
+from core.components.config import Config
+from core.components.communicator import Communicator
+from core.components.audit_tools.session import Session
+
+body_limit = 100000
+
+
+async def small_handler(request):
+    return web.Response(body=b"b" * 500)
+
+
+async def large_handler(request):
+    return web.Response(body=b"c" * 300000)
+
+
+async def stream_handler(request):
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for i in range(50):
+        await response.write(b"a" * 10000)
+    return response
+
+
+@pytest.fixture
+def session_env(monkeypatch):
+    """
+    启动本地http服务, 初始化Session
+
+    Returns:
+        tuple, (事件循环, Session实例, http服务地址)
+    """
+    monkeypatch.setitem(Config().config_dict, "scanner.response_body_limit", body_limit)
+    Communicator().init_new_module("Scanner_0")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    app = web.Application()
+    app.router.add_get("/small", small_handler)
+    app.router.add_get("/large", large_handler)
+    app.router.add_get("/stream", stream_handler)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+
+    session = Session()
+    loop.run_until_complete(session.async_init())
+
+    yield loop, session, "http://127.0.0.1:{}".format(port)
+
+    loop.run_until_complete(session.close())
+    assert session.session is None
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def read_body(session_env, path, read_body):
+    loop, session, base_url = session_env
+
+    async def request():
+        async with session.session.get(base_url + path) as response:
+            return await session._read_body(response, read_body)
+    return loop.run_until_complete(request())
+
+
+def test_read_body_truncate(session_env):
+    """
+    测试读取响应body, 超出上限的部分被丢弃
+    """
+    assert read_body(session_env, "/small", True) == (b"b" * 500, False)
+    assert read_body(session_env, "/large", True) == (b"c" * body_limit, True)
+    assert read_body(session_env, "/stream", True) == (b"a" * body_limit, True)
+
+
+def test_read_body_header_only(session_env):
+    """
+    测试不读取body时返回空body, 超出上限的body不读取并标记截断
+    """
+    assert read_body(session_env, "/small", False) == (b"", False)
+    assert read_body(session_env, "/large", False) == (b"", True)
+    assert read_body(session_env, "/stream", False) == (b"", True)
+
+    # 未超出上限的body被读完, 连接可以复用
+    reuse_count = Communicator().get_value("http_conn_reuse")
+    read_body(session_env, "/small", False)
+    read_body(session_env, "/small", False)
+    assert Communicator().get_value("http_conn_reuse") > reuse_count
+
+
+def test_session_shared(session_env):
+    """
+    测试各使用者共用同一个session, 所有使用者关闭后才关闭session
+    """
+    loop, session, base_url = session_env
+    assert Session() is session
+    client_session = session.session
+    loop.run_until_complete(Session().async_init())
+    assert session.session is client_session
+
+    loop.run_until_complete(Session().close())
+    assert session.session is client_session
+    assert not client_session.closed
+    assert read_body(session_env, "/small", True) == (b"b" * 500, False)
+
+
+def test_connector_config(session_env):
+    """
+    测试连接池按配置限制总连接数和每个目标的连接数, 默认不校验证书
+    """
+    loop, session, base_url = session_env
+    connector = session.session.connector
+    assert connector.limit == Config().get_config("scanner.conn_limit")
+    assert connector.limit_per_host == Config().get_config("scanner.conn_limit_per_host")
+    assert connector._ssl is False